@@ -0,0 +1,30 @@
+import argparse
+import os
+import sys
+
+# Add the 'src' directory to the sys.path
+src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(src_path)
+
+from mymatches.benchmark import DEFAULT_SCALES, run_benchmarks
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the offline benchmark scenarios.')
+    parser.add_argument('--teams', type=int, nargs='+', default=list(DEFAULT_SCALES),
+                        help='team counts to benchmark')
+    parser.add_argument('--fixtures', type=int, default=10, help='upcoming fixtures per team')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='fake API-Football latency in seconds')
+    parser.add_argument('--calendar-latency', type=float, default=0.0, help='fake Calendar API latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of failing API calls')
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(__file__), '..', 'data', 'benchmarks',
+                                                         'benchmarks.json'), help='JSON report path')
+    args = parser.parse_args()
+
+    reports = run_benchmarks(args.teams, args.output, fixtures_per_team=args.fixtures, api_latency=args.api_latency,
+                             calendar_latency=args.calendar_latency, error_rate=args.error_rate)
+    for report in reports:
+        print(f"{report['teams']:>5} teams | "
+              f"fetch {report['fetch']['throughput_per_second']:>8.1f} teams/s p95 {report['fetch']['p95_seconds']:.4f}s | "
+              f"calendar {report['calendar']['throughput_per_second']:>8.1f} teams/s "
+              f"p95 {report['calendar']['p95_seconds']:.4f}s | "
+              f"{report['api_calls']['total']} API calls")
@@ -0,0 +1,57 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+import tempfile
+
+# Add the 'src' directory to the sys.path
+src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(src_path)
+
+from mymatches.cassettes import run_with_cassette
+
+# Entry points that can run under a cassette, as (module, function) pairs. Calendar updates read the matches
+# files written by the fetch, so they only run after it, in the 'all' workload.
+WORKLOADS = {
+    'fetch': [('mymatches.fetch_and_store_matches', 'fetch_and_store_matches')],
+    'all': [('mymatches.fetch_and_store_matches', 'fetch_and_store_matches'),
+            ('mymatches.update_calendars', 'update_calendars')],
+    'tickets': [('mymatches.update_tickets', 'run_update_tickets')],
+}
+
+
+def run_workload(name, data_dir):
+    """
+    Runs the entry points of a workload with their data directory, and log file, pointed at `data_dir`.
+    """
+    for module_name, function_name in WORKLOADS[name]:
+        module = importlib.import_module(module_name)
+        module.DATA_DIR = data_dir
+        if hasattr(module, 'LOG_FILE'):
+            module.LOG_FILE = os.path.join(data_dir, 'logs', os.path.basename(module.LOG_FILE))
+        getattr(module, function_name)()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record or replay a run against an HTTP cassette.')
+    parser.add_argument('workload', choices=sorted(WORKLOADS))
+    parser.add_argument('--mode', choices=['record', 'replay'], default='replay')
+    parser.add_argument('--cassette', required=True, help='path to the .jsonl.gz cassette')
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help='factor applied to the recorded timings in replay mode, 0 for instant')
+    parser.add_argument('--baseline', help='path to the baseline report to compare with')
+    parser.add_argument('--update-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative wall time increase')
+    parser.add_argument('--data-dir', help='data directory, defaults to a fresh temporary directory so that '
+                                           'every run makes the same requests')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or tmp_dir
+        report = run_with_cassette(lambda: run_workload(args.workload, data_dir), args.cassette, args.mode,
+                                   args.time_scale, args.baseline, args.tolerance, args.update_baseline)
+
+    print(json.dumps(report, indent=4))
+    if report.get('regressions'):
+        sys.exit(1)
@@ -1,3 +1,4 @@
+import argparse
 import os
 import sys
 
@@ -5,7 +6,12 @@ import sys
 src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
 sys.path.append(src_path)
 
-from mymatches import fetch_and_store_matches
+from mymatches import fetch_and_store_matches, add_profile_arguments, profile_call
 
 if __name__ == '__main__':
-    fetch_and_store_matches()
+    parser = argparse.ArgumentParser(description='Fetch and store the matches of the configured teams.')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    profile_call('fetch_and_store_matches', fetch_and_store_matches, mode=args.profile, output_dir=args.profile_dir,
+                 top=args.profile_top, summary_stream=sys.stdout)
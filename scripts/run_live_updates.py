@@ -0,0 +1,17 @@
+import argparse
+import os
+import sys
+
+# Add the 'src' directory to the sys.path
+src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(src_path)
+
+from mymatches import run_live_updates
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Push live scores and statuses to the calendar events.')
+    parser.add_argument('--interval', type=float, default=60, help='seconds between two polls')
+    parser.add_argument('--max-polls', type=int, help='stop after this many polls')
+    args = parser.parse_args()
+
+    run_live_updates(args.interval, args.max_polls)
@@ -1,3 +1,4 @@
+import argparse
 import os
 import sys
 
@@ -5,15 +6,25 @@ import sys
 src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
 sys.path.append(src_path)
 
-from mymatches import reset_calendar, authenticate_google
+from mymatches import reset_calendar, authenticate_google, add_profile_arguments, profile_call
 
-if __name__ == '__main__':
 
+def reset(calendar_id):
 	CONFIG_DIR = os.path.join(os.path.dirname(__file__), '..', 'config')
 
 	service_acc_key_path = os.path.join(CONFIG_DIR, 'service_account_key.json')
 	service = authenticate_google(service_acc_key_path)
 
+	reset_calendar(service, calendar_id)
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Delete every event of a calendar.')
+	add_profile_arguments(parser)
+	args = parser.parse_args()
+
 	calendar_id = "98e4f5e3788173b71456bc62c7e3ba201f03e2f330585e2be059a289ba078997@group.calendar.google.com"
 
-	reset_calendar(service, calendar_id)
+	profile_call('reset_calendar', reset, calendar_id, mode=args.profile, output_dir=args.profile_dir,
+				 top=args.profile_top, summary_stream=sys.stdout)
@@ -0,0 +1,19 @@
+import argparse
+import os
+import sys
+
+# Add the 'src' directory to the sys.path
+src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(src_path)
+
+from mymatches import serve_feeds, setup_logging
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the published ICS feeds over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--feeds-dir', help='directory of the .ics feeds, defaults to data/ics')
+    args = parser.parse_args()
+
+    setup_logging(os.path.join(os.path.dirname(__file__), '..', 'data', 'logs', 'serve_feeds.log'))
+    serve_feeds(args.feeds_dir, args.host, args.port)
@@ -0,0 +1,23 @@
+import argparse
+import os
+import sys
+
+# Add the 'src' directory to the sys.path
+src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(src_path)
+
+from mymatches import DATA_DIR, run_sharded_update, run_worker
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Update the calendars with a pool of sharded worker processes.')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default: one per shard)')
+    parser.add_argument('--shards', type=int, help='number of shards (default: one per service account key)')
+    parser.add_argument('--queue-dir', help='shared queue directory (default: data/shards)')
+    parser.add_argument('--lease-seconds', type=float, default=60, help='lease duration of a shard')
+    parser.add_argument('--join', action='store_true', help='only work on the shards of a running coordinator')
+    args = parser.parse_args()
+
+    if args.join:
+        run_worker(args.queue_dir or os.path.join(DATA_DIR, 'shards'), DATA_DIR, lease_seconds=args.lease_seconds)
+    else:
+        run_sharded_update(args.workers, args.shards, args.queue_dir, lease_seconds=args.lease_seconds)
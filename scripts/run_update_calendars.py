@@ -1,3 +1,4 @@
+import argparse
 import os
 import sys
 
@@ -5,8 +6,13 @@ import sys
 src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
 sys.path.append(src_path)
 
-from mymatches import update_calendars
+from mymatches import update_calendars, add_profile_arguments, profile_call
 
 
 if __name__ == '__main__':
-    update_calendars()
+    parser = argparse.ArgumentParser(description='Update the calendars with the stored matches.')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    profile_call('update_calendars', update_calendars, mode=args.profile, output_dir=args.profile_dir,
+                 top=args.profile_top, summary_stream=sys.stdout)
@@ -2,3 +2,11 @@ from .utils import *
 from .fetch_and_store_matches import *
 from .update_calendars import *
 from .update_tickets import *
+from .notifiers import *
+from .metrics import *
+from .ics_feeds import *
+from .live_matches import *
+from .subscriptions import *
+from .snapshots import *
+from .sharding import *
+from .profiling import *
@@ -0,0 +1,154 @@
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+
+from mymatches.fakes import FakeApiFootball, FakeApiFootballServer, FakeCalendarService
+from mymatches.fetch_and_store_matches import fetch_matches, store_matches
+from mymatches.update_calendars import add_matches_to_calendar
+
+"""
+benchmark.py
+
+This module contains the offline load-test harness of the mymatches package. Each scenario runs the fetch and
+calendar stages against the local API-Football server and the in-process Calendar service from `fakes.py`,
+and reports throughput, p95 latency and API calls.
+
+Functions:
+
+percentile: Nearest-rank percentile of a list of values.
+run_scenario: Runs one benchmark scenario.
+run_benchmarks: Runs a scenario for each team count and optionally writes the reports to a JSON file.
+"""
+
+# Team counts of the default scenarios
+DEFAULT_SCALES = (10, 100, 1000)
+
+
+def percentile(values, pct):
+    """
+    Returns the nearest-rank percentile of a list of values.
+
+    Args:
+        values (list): The values.
+        pct (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, or 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _stage_report(latencies, wall_time, errors):
+    return {
+        'operations': len(latencies),
+        'errors': errors,
+        'wall_seconds': round(wall_time, 6),
+        'throughput_per_second': round(len(latencies) / wall_time, 3) if wall_time else 0.0,
+        'p50_seconds': round(percentile(latencies, 50), 6),
+        'p95_seconds': round(percentile(latencies, 95), 6),
+        'max_seconds': round(max(latencies), 6) if latencies else 0.0,
+    }
+
+
+def run_scenario(team_count, fixtures_per_team=10, api_latency=0.0, calendar_latency=0.0, error_rate=0.0,
+                 data_dir=None, seed=0):
+    """
+    Runs one benchmark scenario: fetches and stores the matches of every team from the fake API-Football
+    server, then syncs each team to its own calendar on the fake Calendar service.
+
+    Args:
+        team_count (int): The number of teams, and of calendars.
+        fixtures_per_team (int): The number of upcoming fixtures of each team.
+        api_latency (float): The latency of the fake API-Football server, in seconds.
+        calendar_latency (float): The latency of each fake Calendar API call, in seconds.
+        error_rate (float): The fraction of failing calls on both fakes.
+        data_dir (str): The data directory to write to. Defaults to a temporary directory.
+        seed (int): The seed of the error injection.
+
+    Returns:
+        dict: The scenario report.
+    """
+    api = FakeApiFootball(team_count, fixtures_per_team)
+    service = FakeCalendarService(latency=calendar_latency, error_rate=error_rate, seed=seed)
+    team_ids = list(api.team_fixtures)
+
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            FakeApiFootballServer(api, latency=api_latency, error_rate=error_rate, seed=seed) as server:
+        data_dir = data_dir or tmp_dir
+
+        fetch_latencies = []
+        fetch_errors = 0
+        fetch_start = time.perf_counter()
+        for team_id in team_ids:
+            start = time.perf_counter()
+            try:
+                matches = fetch_matches(team_id, 'benchmark-key', base_url=server.url)
+                store_matches(matches, os.path.join(data_dir, 'matches', f'matches{team_id}.json'))
+            except Exception as e:
+                fetch_errors += 1
+                logging.error(f"Error processing team {team_id}: {e}")
+            fetch_latencies.append(time.perf_counter() - start)
+        fetch_wall = time.perf_counter() - fetch_start
+
+        calendar_latencies = []
+        calendar_errors = 0
+        calendar_start = time.perf_counter()
+        for team_id in team_ids:
+            start = time.perf_counter()
+            try:
+                add_matches_to_calendar(team_id, f'calendar{team_id}', service, data_dir)
+            except Exception as e:
+                calendar_errors += 1
+                logging.error(f"Error syncing team {team_id}: {e}")
+            calendar_latencies.append(time.perf_counter() - start)
+        calendar_wall = time.perf_counter() - calendar_start
+        api_football_calls = server.request_count
+
+    return {
+        'teams': team_count,
+        'calendars': team_count,
+        'fixtures': len(api.fixtures),
+        'events': sum(len(events) for events in service.calendars.values()),
+        'fetch': _stage_report(fetch_latencies, fetch_wall, fetch_errors),
+        'calendar': _stage_report(calendar_latencies, calendar_wall, calendar_errors + service.errors),
+        'api_calls': {
+            'api_football': api_football_calls,
+            'calendar': service.api_calls,
+            'calendar_by_method': dict(service.calls),
+            'total': api_football_calls + service.api_calls,
+        },
+        'wall_seconds': round(fetch_wall + calendar_wall, 6),
+    }
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, output_path=None, **scenario_options):
+    """
+    Runs a benchmark scenario for each team count.
+
+    Args:
+        scales (tuple): The team counts.
+        output_path (str): The path of the JSON report, or None to skip writing it.
+        **scenario_options: Keyword arguments forwarded to `run_scenario`.
+
+    Returns:
+        list: The scenario reports.
+    """
+    reports = []
+    for team_count in scales:
+        report = run_scenario(team_count, **scenario_options)
+        logging.info(f"Benchmark with {team_count} teams: {report['wall_seconds']}s, "
+                     f"{report['api_calls']['total']} API calls")
+        reports.append(report)
+
+    if output_path:
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=4)
+    return reports
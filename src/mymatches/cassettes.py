@@ -0,0 +1,499 @@
+import base64
+import gzip
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+"""
+cassettes.py
+
+This module contains the record/replay layer used for deterministic performance regression runs. In record
+mode, every HTTP request made through `requests` (API-Football, news pages, webhooks) and every Calendar API
+request made through the service object is captured into a gzip-compressed JSON lines cassette. In replay mode,
+the same requests are answered from the cassette, with the recorded timings scaled by `time_scale`, so a
+production-shaped workload can be rerun offline and compared with a stored baseline.
+
+Classes:
+
+CassetteMiss: Raised in replay mode when a request is not in the cassette.
+ReplayHttpError: Raised in replay mode for Calendar requests that failed while recording.
+Cassette: The recorded exchanges of a run.
+
+Functions:
+
+wrap_service: Wraps a Calendar service object so that its requests go through a cassette.
+use_cassette: Context manager that records or replays all outbound requests of a block.
+compare_to_baseline: Lists the regressions of a run report against a baseline report.
+run_with_cassette: Runs a workload under a cassette and compares it with a baseline.
+"""
+
+# Response headers kept in the cassette
+RECORDED_HEADERS = ('Content-Type', 'Content-Encoding', 'ETag', 'Last-Modified')
+
+# Query parameters never written to a cassette
+SECRET_PARAMS = ('key', 'api_key', 'token', 'access_token')
+
+# Positional parameters of requests.Session.request after the URL
+SESSION_REQUEST_PARAMS = ('params', 'data', 'headers', 'cookies', 'files', 'auth', 'timeout', 'allow_redirects',
+                          'proxies', 'hooks', 'stream', 'verify', 'cert', 'json')
+
+
+class CassetteMiss(Exception):
+    """
+    Raised in replay mode when a request has no recorded exchange left in the cassette.
+    """
+
+
+class ReplayHttpError(Exception):
+    """
+    Raised in replay mode for Calendar requests that failed while recording.
+
+    Args:
+        status_code (int): The recorded HTTP status.
+        message (str): The recorded error message.
+    """
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _strip_query(url, params):
+    """
+    Splits the query string of a URL and merges it with the `params` of a request, dropping secrets.
+    """
+    parsed = urlparse(url)
+    query = parse_qsl(parsed.query)
+    if isinstance(params, dict):
+        query.extend((key, str(value)) for key, value in params.items())
+    elif params:
+        query.extend((key, str(value)) for key, value in params)
+    query = sorted((key, value) for key, value in query if key not in SECRET_PARAMS)
+    return urlunparse(parsed._replace(query='')), query
+
+
+class Cassette:
+    """
+    The recorded exchanges of a run, stored as gzip-compressed JSON lines.
+
+    Args:
+        path (str): The path to the cassette file.
+        mode (str): `record` or `replay`.
+        time_scale (float): In replay mode, the factor applied to the recorded timings. 0 replays instantly.
+    """
+
+    def __init__(self, path, mode='replay', time_scale=1.0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown cassette mode: {mode}. Use 'record' or 'replay'.")
+        self.path = path
+        self.mode = mode
+        self.time_scale = time_scale
+        self.lock = threading.Lock()
+        self.entries = []
+        self.pending = defaultdict(deque)
+        self.counts = Counter()
+        if mode == 'replay':
+            self.load()
+
+    @staticmethod
+    def key(entry):
+        if entry['kind'] == 'http':
+            return 'http', entry['method'], entry['url'], tuple(map(tuple, entry['query']))
+        return 'calendar', entry['method'], entry['calendar_id'], entry['event_id']
+
+    @staticmethod
+    def counter_name(entry):
+        if entry['kind'] == 'http':
+            return f"{entry['method']} {entry['url']}"
+        return f"calendar/{entry['method']}"
+
+    def load(self):
+        """
+        Loads the recorded exchanges.
+
+        Raises:
+            FileNotFoundError: If the cassette file is not found.
+        """
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette not found in this path: {self.path}. Record it first.")
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            self.entries = [json.loads(line) for line in f if line.strip()]
+        for entry in self.entries:
+            self.pending[self.key(entry)].append(entry)
+
+    def save(self):
+        """
+        Writes the recorded exchanges to the cassette file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with gzip.open(self.path, 'wt', encoding='utf-8') as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+        logging.info(f"Recorded {len(self.entries)} exchanges to {self.path}")
+
+    def record(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+            self.counts[self.counter_name(entry)] += 1
+
+    def play(self, key):
+        """
+        Returns the next recorded exchange for a request, after waiting for its scaled recorded duration.
+
+        Args:
+            key (tuple): The request key.
+
+        Returns:
+            dict: The recorded exchange.
+
+        Raises:
+            CassetteMiss: If the cassette has no exchange left for the request.
+        """
+        with self.lock:
+            if not self.pending[key]:
+                raise CassetteMiss(f"No recorded exchange left for {key} in {self.path}")
+            entry = self.pending[key].popleft()
+            self.counts[self.counter_name(entry)] += 1
+        if self.time_scale:
+            time.sleep(entry['elapsed'] * self.time_scale)
+        return entry
+
+    # HTTP exchanges
+
+    def http_request(self, send, session, method, url, params=None, **kwargs):
+        """
+        Handles a `requests.Session.request` call, either forwarding and recording it or replaying it.
+        """
+        base_url, query = _strip_query(url, params)
+        if self.mode == 'replay':
+            return self._build_response(self.play(('http', method.upper(), base_url, tuple(query))))
+
+        start = time.perf_counter()
+        response = send(session, method, url, params=params, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        entry = {
+            'kind': 'http',
+            'method': method.upper(),
+            'url': base_url,
+            'query': query,
+            'status': response.status_code,
+            'headers': {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers},
+            'elapsed': round(elapsed, 6),
+        }
+        try:
+            entry['body'] = response.content.decode('utf-8')
+        except UnicodeDecodeError:
+            entry['body_b64'] = base64.b64encode(response.content).decode('ascii')
+        self.record(entry)
+        return response
+
+    @staticmethod
+    def _build_response(entry):
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.headers.pop('Content-Encoding', None)
+        if 'body_b64' in entry:
+            response._content = base64.b64decode(entry['body_b64'])
+        else:
+            response._content = entry['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        query = urlencode([tuple(pair) for pair in entry['query']])
+        response.url = f"{entry['url']}?{query}" if query else entry['url']
+        return response
+
+    # Calendar exchanges
+
+    def calendar_request(self, method, kwargs, execute):
+        """
+        Handles the execution of a Calendar request, either forwarding and recording it or replaying it.
+
+        Args:
+            method (str): The request method, e.g. `events.insert`.
+            kwargs (dict): The request arguments.
+            execute (callable): Executes the real request. Unused in replay mode.
+
+        Returns:
+            dict: The Calendar API response.
+        """
+        key = ('calendar', method, kwargs.get('calendarId'), kwargs.get('eventId'))
+        if self.mode == 'replay':
+            entry = self.play(key)
+            if entry['error']:
+                raise ReplayHttpError(entry['error']['status'], entry['error']['message'])
+            return entry['response']
+
+        start = time.perf_counter()
+        response, exception = None, None
+        try:
+            response = execute()
+            return response
+        except Exception as e:
+            exception = e
+            raise
+        finally:
+            self.record_calendar(method, kwargs, response, exception, time.perf_counter() - start)
+
+    def record_calendar(self, method, kwargs, response, exception, elapsed):
+        """
+        Records the outcome of a Calendar request.
+
+        Args:
+            method (str): The request method, e.g. `events.insert`.
+            kwargs (dict): The request arguments.
+            response (dict): The Calendar API response, or None if the request failed.
+            exception (Exception): The request error, or None if the request succeeded.
+            elapsed (float): The request duration, in seconds.
+        """
+        entry = {'kind': 'calendar', 'method': method, 'calendar_id': kwargs.get('calendarId'),
+                 'event_id': kwargs.get('eventId'), 'body': kwargs.get('body'), 'response': response, 'error': None,
+                 'elapsed': round(elapsed, 6)}
+        if exception is not None:
+            status = getattr(exception, 'status_code', None) or \
+                getattr(getattr(exception, 'resp', None), 'status', None) or 500
+            entry['error'] = {'status': int(status), 'message': str(exception)}
+        self.record(entry)
+
+
+class _CassetteRequest:
+
+    def __init__(self, cassette, method, kwargs, request):
+        self.cassette = cassette
+        self.method = method
+        self.kwargs = kwargs
+        self.request = request
+
+    def execute(self, *args, **kwargs):
+        return self.cassette.calendar_request(self.method, self.kwargs,
+                                              lambda: self.request.execute(*args, **kwargs))
+
+
+class _CassetteEvents:
+
+    def __init__(self, cassette, events):
+        self.cassette = cassette
+        self.events = events
+
+    def __getattr__(self, method):
+        def build_request(**kwargs):
+            request = getattr(self.events, method)(**kwargs) if self.events is not None else None
+            return _CassetteRequest(self.cassette, f'events.{method}', kwargs, request)
+        return build_request
+
+
+class _CassetteBatch:
+
+    def __init__(self, cassette, callback, service):
+        self.cassette = cassette
+        self.callback = callback
+        self.service = service
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id or str(len(self.requests) + 1), request, callback or self.callback))
+
+    def execute(self):
+        if self.cassette.mode == 'record':
+            self._execute_recorded()
+            return
+        # Sub-requests are replayed one by one, in order
+        for request_id, request, callback in self.requests:
+            response, exception = None, None
+            try:
+                response = request.execute()
+            except Exception as e:
+                exception = e
+            if callback:
+                callback(request_id, response, exception)
+
+    def _execute_recorded(self):
+        # The real batch is sent as one request, and each sub-request is recorded from its callback
+        batch = self.service.new_batch_http_request()
+        start = time.perf_counter()
+        share = 1.0 / max(len(self.requests), 1)
+
+        def recorder(request, callback):
+            def on_response(request_id, response, exception):
+                elapsed = (time.perf_counter() - start) * share
+                self.cassette.record_calendar(request.method, request.kwargs, response, exception, elapsed)
+                if callback:
+                    callback(request_id, response, exception)
+            return on_response
+
+        for request_id, request, callback in self.requests:
+            batch.add(request.request, callback=recorder(request, callback), request_id=request_id)
+        batch.execute()
+
+
+class _CassetteService:
+
+    def __init__(self, cassette, service):
+        self.cassette = cassette
+        self.service = service
+
+    def events(self):
+        return _CassetteEvents(self.cassette, self.service.events() if self.service is not None else None)
+
+    def new_batch_http_request(self, callback=None):
+        return _CassetteBatch(self.cassette, callback, self.service)
+
+
+def wrap_service(cassette, service=None):
+    """
+    Wraps a Calendar service object so that its `events()` and batch requests go through a cassette.
+
+    Args:
+        cassette (Cassette): The cassette.
+        service (googleapiclient.discovery.Resource): The real service. Not needed in replay mode.
+
+    Returns:
+        object: A service object with the same request interface.
+    """
+    return _CassetteService(cassette, service)
+
+
+@contextmanager
+def _patched(target, attribute, value):
+    original = getattr(target, attribute)
+    setattr(target, attribute, value)
+    try:
+        yield
+    finally:
+        setattr(target, attribute, original)
+
+
+@contextmanager
+def use_cassette(path, mode='replay', time_scale=1.0):
+    """
+    Records or replays all outbound requests made inside the block.
+
+    HTTP requests are intercepted at `requests.Session.request`. Calendar requests are intercepted by wrapping
+    the service objects returned by `authenticate_google` and `authenticate_google_oauth`, which are replaced
+    in every loaded mymatches module that imported them; in replay mode no credentials are loaded. The cassette
+    is written when a recording block exits. Requests made by forked worker processes are not covered.
+
+    Args:
+        path (str): The path to the cassette file.
+        mode (str): `record` or `replay`.
+        time_scale (float): In replay mode, the factor applied to the recorded timings.
+
+    Yields:
+        Cassette: The active cassette.
+    """
+    # Make sure the modules holding the authentication functions are loaded before they are replaced
+    importlib.import_module('mymatches.update_calendars')
+    importlib.import_module('mymatches.update_tickets')
+
+    cassette = Cassette(path, mode, time_scale)
+    original_request = requests.Session.request
+
+    def request(session, method, url, *args, **kwargs):
+        kwargs.update(zip(SESSION_REQUEST_PARAMS, args))
+        return cassette.http_request(original_request, session, method, url, **kwargs)
+
+    def wrap_authenticate(original):
+        def authenticate(*args, **kwargs):
+            return wrap_service(cassette, original(*args, **kwargs) if mode == 'record' else None)
+        return authenticate
+
+    with ExitStack() as stack:
+        stack.enter_context(_patched(requests.Session, 'request', request))
+        # Modules bind the authentication functions at import, so they are replaced wherever they were imported
+        for module_name, module in sorted(sys.modules.items()):
+            if module is None or (module_name != 'mymatches' and not module_name.startswith('mymatches.')):
+                continue
+            for attribute in ('authenticate_google', 'authenticate_google_oauth'):
+                original = getattr(module, attribute, None)
+                if callable(original):
+                    stack.enter_context(_patched(module, attribute, wrap_authenticate(original)))
+        try:
+            yield cassette
+        finally:
+            if mode == 'record':
+                cassette.save()
+
+
+def compare_to_baseline(report, baseline, tolerance=0.2):
+    """
+    Lists the regressions of a run report against a baseline report.
+
+    A run regresses when its wall time exceeds the baseline by more than `tolerance`, or when it makes more
+    requests to any endpoint than the baseline did.
+
+    Args:
+        report (dict): The run report.
+        baseline (dict): The baseline report.
+        tolerance (float): The allowed relative wall time increase.
+
+    Returns:
+        list: The regression descriptions, empty if there is none.
+    """
+    regressions = []
+    if report['wall_seconds'] > baseline['wall_seconds'] * (1 + tolerance):
+        regressions.append(f"Wall time {report['wall_seconds']:.3f}s exceeds baseline "
+                           f"{baseline['wall_seconds']:.3f}s by more than {tolerance:.0%}")
+    for endpoint, count in sorted(report['requests'].items()):
+        baseline_count = baseline['requests'].get(endpoint, 0)
+        if count > baseline_count:
+            regressions.append(f"{endpoint}: {count} requests, baseline {baseline_count}")
+    return regressions
+
+
+def run_with_cassette(workload, cassette_path, mode='replay', time_scale=1.0, baseline_path=None, tolerance=0.2,
+                      update_baseline=False):
+    """
+    Runs a workload under a cassette, measures its wall time and request counts and compares them with a
+    stored baseline.
+
+    Args:
+        workload (callable): The workload, called without arguments.
+        cassette_path (str): The path to the cassette file.
+        mode (str): `record` or `replay`.
+        time_scale (float): In replay mode, the factor applied to the recorded timings.
+        baseline_path (str): The path to the baseline report, or None to skip the comparison.
+        tolerance (float): The allowed relative wall time increase.
+        update_baseline (bool): Whether to store this run as the new baseline.
+
+    Returns:
+        dict: The run report, with a `regressions` list when a baseline was compared.
+    """
+    with use_cassette(cassette_path, mode, time_scale) as cassette:
+        start = time.perf_counter()
+        workload()
+        wall_time = time.perf_counter() - start
+
+    report = {
+        'cassette': cassette_path,
+        'mode': mode,
+        'time_scale': time_scale,
+        'wall_seconds': round(wall_time, 6),
+        'requests': dict(sorted(cassette.counts.items())),
+        'total_requests': sum(cassette.counts.values()),
+    }
+    if mode == 'replay':
+        report['unplayed'] = sum(len(entries) for entries in cassette.pending.values())
+
+    if baseline_path and os.path.exists(baseline_path) and not update_baseline:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['baseline_wall_seconds'] = baseline['wall_seconds']
+        report['regressions'] = compare_to_baseline(report, baseline, tolerance)
+        for regression in report['regressions']:
+            logging.warning(f"Performance regression: {regression}")
+    elif baseline_path:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        logging.info(f"Stored baseline in {baseline_path}")
+    return report
@@ -0,0 +1,372 @@
+import copy
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+"""
+fakes.py
+
+This module contains local stand-ins for the external services used by the mymatches package, so that the
+pipeline can be tested and benchmarked without network access. Both stand-ins support configurable latency
+and error injection.
+
+Classes:
+
+FakeApiFootball: Deterministic league schedule answering API-Football fixture queries.
+FakeApiFootballServer: Local HTTP server exposing a FakeApiFootball as the API-Football `/fixtures` endpoint.
+FakeHttpError: Error raised by the fake Calendar service on injected failures.
+FakeCalendarService: In-process replacement for the Google Calendar v3 service object.
+"""
+
+# Fixture statuses of matches that have not started
+NOT_STARTED = {'long': 'Not Started', 'short': 'NS', 'elapsed': None}
+
+
+class FakeApiFootball:
+    """
+    Deterministic schedule of fixtures answering API-Football fixture queries.
+
+    Teams are numbered from 1 and paired with the round-robin circle method, so every fixture is shared by
+    two teams. Teams are spread over `league_count` leagues.
+
+    Args:
+        team_count (int): The number of teams.
+        fixtures_per_team (int): The number of upcoming fixtures of each team.
+        league_count (int): The number of leagues.
+        start (datetime): The kickoff of the first round. Defaults to tomorrow at 19:00 UTC.
+    """
+
+    def __init__(self, team_count, fixtures_per_team=10, league_count=1, start=None):
+        self.lock = threading.Lock()
+        self.fixtures = {}
+        self.team_fixtures = {str(team): [] for team in range(1, team_count + 1)}
+        start = start or (datetime.now(timezone.utc) + timedelta(days=1)).replace(hour=19, minute=0, second=0,
+                                                                                    microsecond=0)
+
+        teams = list(range(1, team_count + 1))
+        if len(teams) % 2:
+            teams.append(None)
+        for round_number in range(fixtures_per_team):
+            kickoff = start + timedelta(days=7 * round_number)
+            half = len(teams) // 2
+            for home, away in zip(teams[:half], reversed(teams[half:])):
+                if home is None or away is None:
+                    continue
+                if round_number % 2:
+                    home, away = away, home
+                fixture_id = 1000000 + len(self.fixtures) + 1
+                league_id = 100 + (min(home, away) - 1) % league_count
+                self.fixtures[fixture_id] = self._build_fixture(fixture_id, league_id, round_number, kickoff, home,
+                                                                away)
+                self.team_fixtures[str(home)].append(fixture_id)
+                self.team_fixtures[str(away)].append(fixture_id)
+            # Rotate every team but the first one
+            teams = [teams[0], teams[-1]] + teams[1:-1]
+
+    @staticmethod
+    def _build_fixture(fixture_id, league_id, round_number, kickoff, home, away):
+        return {
+            'fixture': {
+                'id': fixture_id,
+                'referee': None,
+                'timezone': 'UTC',
+                'date': kickoff.isoformat(),
+                'timestamp': int(kickoff.timestamp()),
+                'venue': {'id': home, 'name': f'Stadium {home}', 'city': f'City {home}'},
+                'status': dict(NOT_STARTED),
+            },
+            'league': {'id': league_id, 'name': f'League {league_id}', 'country': 'Brazil',
+                       'season': kickoff.year, 'round': f'Regular Season - {round_number + 1}'},
+            'teams': {'home': {'id': home, 'name': f'Team {home}', 'winner': None},
+                      'away': {'id': away, 'name': f'Team {away}', 'winner': None}},
+            'goals': {'home': None, 'away': None},
+            'score': {'halftime': {'home': None, 'away': None}, 'fulltime': {'home': None, 'away': None}},
+        }
+
+    def set_status(self, fixture_id, short, elapsed=None, home_goals=None, away_goals=None, long=None):
+        """
+        Changes the status and score of a fixture, e.g. to simulate a live match.
+
+        Args:
+            fixture_id (int): The fixture ID.
+            short (str): The short status, e.g. `1H` or `FT`.
+            elapsed (int): The elapsed minutes.
+            home_goals (int): The home team goals.
+            away_goals (int): The away team goals.
+            long (str): The long status.
+        """
+        with self.lock:
+            fixture = self.fixtures[fixture_id]
+            fixture['fixture']['status'] = {'long': long or short, 'short': short, 'elapsed': elapsed}
+            fixture['goals'] = {'home': home_goals, 'away': away_goals}
+
+    def query(self, params):
+        """
+        Answers a `/fixtures` query.
+
+        Args:
+            params (dict): The query parameters: `team`, `league` or `ids` (dash-separated), and `next`.
+
+        Returns:
+            dict: The API-Football response payload.
+        """
+        with self.lock:
+            if 'ids' in params:
+                ids = [int(fixture_id) for fixture_id in params['ids'].split('-') if fixture_id]
+                fixtures = [self.fixtures[fixture_id] for fixture_id in ids if fixture_id in self.fixtures]
+            elif 'team' in params:
+                fixtures = [self.fixtures[fixture_id] for fixture_id in self.team_fixtures.get(params['team'], [])]
+            elif 'league' in params:
+                fixtures = [fixture for fixture in self.fixtures.values()
+                            if str(fixture['league']['id']) == params['league']]
+            else:
+                fixtures = []
+            if 'next' in params:
+                fixtures = fixtures[:int(params['next'])]
+            fixtures = copy.deepcopy(fixtures)
+
+        return {
+            'get': 'fixtures',
+            'parameters': params,
+            'errors': [],
+            'results': len(fixtures),
+            'paging': {'current': 1, 'total': 1},
+            'response': fixtures,
+        }
+
+
+class _FakeApiFootballHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            inject_error = server.random.random() < server.error_rate
+        if server.latency:
+            time.sleep(server.latency)
+
+        parsed = urlparse(self.path)
+        if inject_error:
+            self._reply(500, {'message': 'Injected error'})
+        elif not parsed.path.endswith('/fixtures'):
+            self._reply(404, {'message': 'Endpoint not found'})
+        elif not self.headers.get('x-rapidapi-key'):
+            self._reply(403, {'message': 'You are not subscribed to this API.'})
+        else:
+            params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+            self._reply(200, server.api.query(params))
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeApiFootballServer:
+    """
+    Local HTTP server exposing a FakeApiFootball as the API-Football `/fixtures` endpoint.
+
+    Use it as a context manager and pass `url` as the `base_url` of `fetch_matches`.
+
+    Args:
+        api (FakeApiFootball): The schedule to serve.
+        latency (float): The delay added to every request, in seconds.
+        error_rate (float): The fraction of requests answered with HTTP 500.
+        seed (int): The seed of the error injection.
+    """
+
+    def __init__(self, api, latency=0.0, error_rate=0.0, seed=0):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeApiFootballHandler)
+        self.server.daemon_threads = True
+        self.server.api = api
+        self.server.latency = latency
+        self.server.error_rate = error_rate
+        self.server.random = random.Random(seed)
+        self.server.lock = threading.Lock()
+        self.server.request_count = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/v3"
+
+    @property
+    def request_count(self):
+        return self.server.request_count
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class FakeHttpError(Exception):
+    """
+    Error raised by the fake Calendar service, mirroring `googleapiclient.errors.HttpError`.
+
+    Args:
+        status_code (int): The HTTP status of the failure.
+        message (str): The error message.
+    """
+
+    def __init__(self, status_code, message):
+        super().__init__(f"<HttpError {status_code}: {message}>")
+        self.status_code = status_code
+
+
+class _FakeRequest:
+
+    def __init__(self, service, method, func):
+        self.service = service
+        self.method = method
+        self.func = func
+
+    def execute(self):
+        self.service._call(self.method)
+        return self.func()
+
+
+class _FakeEvents:
+
+    def __init__(self, service):
+        self.service = service
+
+    def _calendar(self, calendar_id):
+        return self.service.calendars.setdefault(calendar_id, {})
+
+    def _get_event(self, calendar_id, event_id):
+        calendar = self._calendar(calendar_id)
+        if event_id not in calendar:
+            raise FakeHttpError(404, f"Event {event_id} not found")
+        return calendar[event_id]
+
+    def insert(self, calendarId, body, **kwargs):
+        def run():
+            event = copy.deepcopy(body)
+            event['id'] = event.get('id') or uuid.uuid4().hex
+            event['status'] = 'confirmed'
+            self._calendar(calendarId)[event['id']] = event
+            return copy.deepcopy(event)
+        return _FakeRequest(self.service, 'insert', run)
+
+    def update(self, calendarId, eventId, body, **kwargs):
+        def run():
+            self._get_event(calendarId, eventId)
+            event = copy.deepcopy(body)
+            event['id'] = eventId
+            event['status'] = 'confirmed'
+            self._calendar(calendarId)[eventId] = event
+            return copy.deepcopy(event)
+        return _FakeRequest(self.service, 'update', run)
+
+    def patch(self, calendarId, eventId, body, **kwargs):
+        def run():
+            event = self._get_event(calendarId, eventId)
+            event.update(copy.deepcopy(body))
+            return copy.deepcopy(event)
+        return _FakeRequest(self.service, 'patch', run)
+
+    def get(self, calendarId, eventId, **kwargs):
+        return _FakeRequest(self.service, 'get', lambda: copy.deepcopy(self._get_event(calendarId, eventId)))
+
+    def delete(self, calendarId, eventId, **kwargs):
+        def run():
+            self._get_event(calendarId, eventId)
+            del self._calendar(calendarId)[eventId]
+            return ''
+        return _FakeRequest(self.service, 'delete', run)
+
+    def list(self, calendarId, **kwargs):
+        def run():
+            return {'kind': 'calendar#events', 'items': copy.deepcopy(list(self._calendar(calendarId).values()))}
+        return _FakeRequest(self.service, 'list', run)
+
+
+class _FakeBatch:
+
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = request_id or str(len(self.requests) + 1)
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self):
+        self.service._call('batch')
+        for request_id, request, callback in self.requests:
+            response, exception = None, None
+            try:
+                response = request.func()
+            except FakeHttpError as e:
+                exception = e
+            if callback:
+                callback(request_id, response, exception)
+
+
+class FakeCalendarService:
+    """
+    In-process replacement for the Google Calendar v3 service object returned by `authenticate_google`.
+
+    Supports `events().insert/update/patch/get/list/delete(...).execute()` and
+    `new_batch_http_request(callback).add(request).execute()`. A batch costs a single API call.
+
+    Args:
+        latency (float): The delay added to every API call, in seconds.
+        error_rate (float): The fraction of API calls failing with a FakeHttpError 503.
+        seed (int): The seed of the error injection.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calendars = {}
+        self.calls = Counter()
+        self.errors = 0
+
+    @property
+    def api_calls(self):
+        return sum(self.calls.values())
+
+    def _call(self, method):
+        with self.lock:
+            self.calls[method] += 1
+            inject_error = self.random.random() < self.error_rate
+            if inject_error:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if inject_error:
+            raise FakeHttpError(503, 'Injected error')
+
+    def events(self):
+        return _FakeEvents(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _FakeBatch(self, callback)
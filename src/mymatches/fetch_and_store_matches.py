@@ -4,19 +4,24 @@ import json
 import os
 from datetime import datetime, timedelta
 from mymatches import setup_logging  # Keep setup_logging in utils.py
+from mymatches.metrics import METRICS, timed, record_api_call, record_bytes_written, export_metrics
+from mymatches.snapshots import SNAPSHOT_KEEP_LAST, SNAPSHOT_RETENTION_DAYS, apply_retention, archive_snapshot
 
 # Constants
 CONFIG_DIR = os.path.join(os.path.dirname(__file__), '../../config')
 DATA_DIR = os.path.join(os.path.dirname(__file__), '../../data')
+API_FOOTBALL_URL = "https://api-football-v1.p.rapidapi.com/v3"
 
 
-def fetch_matches(team_id, api_key):
+@timed('fetch_matches')
+def fetch_matches(team_id, api_key, base_url=API_FOOTBALL_URL):
     """
     Fetches the upcoming matches for a given team using api-football from RapidAPI.
 
     Args:
         team_id (str): The team ID.
         api_key (str): The API key for authorization.
+        base_url (str): The API-Football base URL, overridable to point at a local stand-in.
 
     Returns:
         dict: The matches data if the request is successful.
@@ -24,7 +29,7 @@ def fetch_matches(team_id, api_key):
     Raises:
         Exception: If the request fails.
     """
-    url = "https://api-football-v1.p.rapidapi.com/v3/fixtures"
+    url = f"{base_url}/fixtures"
     querystring = {"team": team_id, "next": "99"}  # Adjust the "next" value as needed
 
     headers = {
@@ -32,7 +37,12 @@ def fetch_matches(team_id, api_key):
         "x-rapidapi-host": "api-football-v1.p.rapidapi.com"
     }
 
-    response = requests.get(url, headers=headers, params=querystring)
+    try:
+        response = requests.get(url, headers=headers, params=querystring)
+    except Exception:
+        record_api_call('api-football/fixtures', error=True)
+        raise
+    record_api_call('api-football/fixtures', error=response.status_code != 200, bytes_received=len(response.content))
     if response.status_code == 200:
         return response.json()
     else:
@@ -60,9 +70,10 @@ def is_file_recent(file_path, days=0.9):
     return False
 
 
+@timed('store_matches')
 def store_matches(matches, json_file_path):
     """
-    Stores the matches data in a JSON file.
+    Stores the matches data in a compact JSON file.
 
     Args:
         matches (dict): The matches data.
@@ -74,8 +85,10 @@ def store_matches(matches, json_file_path):
     if not os.path.exists(matches_dir):
         os.makedirs(matches_dir)
 
-    with open(json_file_path, 'w', encoding='utf-8') as f:
-        json.dump(matches, f, ensure_ascii=False, indent=4)
+    content = json.dumps(matches, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    with open(json_file_path, 'wb') as f:
+        f.write(content)
+    record_bytes_written('matches', len(content))
     logging.info(f"Successfully stored matches to {json_file_path}")
 
 
@@ -104,6 +117,7 @@ def fetch_and_store_matches():
     Fetches the upcoming matches for each team in the config.json file and stores them in the data directory.
     """
     setup_logging(os.path.join(DATA_DIR, 'logs', 'fetch_and_store_matches.log'))
+    METRICS.reset()
 
     # Load the config file
     config_path = os.path.join(CONFIG_DIR, 'config.json')
@@ -124,10 +138,15 @@ def fetch_and_store_matches():
         os.makedirs(os.path.dirname(json_file_path), exist_ok=True)
 
         try:
-            matches = fetch_matches(team_id, config['API_KEY'])
+            matches = fetch_matches(team_id, config['API_KEY'], config.get('API_URL', API_FOOTBALL_URL))
             store_matches(matches, json_file_path)
+            archive_snapshot(team_id, matches, DATA_DIR)
             logging.info(f"Successfully fetched and stored matches for team {team_id}")
         except Exception as e:
             logging.error(f"Error processing team {team_id}: {e}")
 
+    apply_retention(DATA_DIR, config.get('SNAPSHOT_RETENTION_DAYS', SNAPSHOT_RETENTION_DAYS),
+                    config.get('SNAPSHOT_KEEP_LAST', SNAPSHOT_KEEP_LAST))
+    export_metrics('fetch_and_store_matches', DATA_DIR)
+
 
@@ -0,0 +1,342 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mymatches.utils import setup_logging
+from mymatches.metrics import METRICS, timed, record_bytes_written, export_metrics
+from mymatches.update_calendars import build_event
+
+"""
+ics_feeds.py
+
+This module contains the ICS publishing backend, an alternative to writing events through the Google Calendar
+API. Each team's fixtures are rendered into an `.ics` feed in the data directory and served by a small built-in
+HTTP server with ETag/304 support and gzip, so subscribers poll a cached file and no calendar API quota is used.
+
+Rendered VEVENTs are cached per fixture with the hash of the event they were rendered from, so a publish run
+only regenerates the VEVENTs of fixtures that changed, and a feed file is only rewritten when its content
+changed.
+
+Functions:
+
+render_vevent: Renders the VEVENT of a match.
+publish_team_feed: Renders the feed of a team from its stored matches.
+publish_feeds: Publishes the feed of every team in the config file.
+make_feed_server: Creates the HTTP server of the feeds directory.
+serve_feeds: Serves the feeds directory until interrupted.
+"""
+
+# Constants
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), '../../config')
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../../data')
+
+PRODUCT_ID = '-//mymatches//Football fixtures//EN'
+FEED_CACHE_SECONDS = 300
+FEED_NAME_PATTERN = re.compile(r'^[\w.-]+\.ics$')
+
+
+def _escape(text):
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line):
+    """
+    Folds a content line at 75 octets, as required by RFC 5545.
+    """
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Never split a multi-byte UTF-8 sequence
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74  # Continuation lines start with a space
+    return '\r\n '.join(parts)
+
+
+def _utc(date_time):
+    value = datetime.fromisoformat(date_time)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_vevent(fixture_id, event, dtstamp):
+    """
+    Renders the VEVENT of a match.
+
+    Args:
+        fixture_id (str): The fixture ID, used as the stable UID of the event.
+        event (dict): The event details, as built by `build_event`.
+        dtstamp (str): The UTC timestamp of the rendering, in the iCalendar format.
+
+    Returns:
+        str: The VEVENT, with CRLF line endings.
+    """
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{fixture_id}@mymatches',
+        f'DTSTAMP:{dtstamp}',
+        f"DTSTART:{_utc(event['start']['dateTime'])}",
+        f"DTEND:{_utc(event['end']['dateTime'])}",
+        f"SUMMARY:{_escape(event['summary'])}",
+        f"LOCATION:{_escape(event['location'])}",
+        'END:VEVENT',
+    ]
+    return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
+
+
+def _load_vevent_cache(cache_file):
+    if os.path.exists(cache_file):
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+@timed('publish_team_feed')
+def publish_team_feed(team_id, data_dir):
+    """
+    Renders the ICS feed of a team from its stored matches into `<data_dir>/ics/team<team_id>.ics`.
+
+    Only the VEVENTs of fixtures whose event changed since the previous run are rendered again, and the feed
+    file is only rewritten when its content changed.
+
+    Args:
+        team_id (str): The team ID.
+        data_dir (str): The path to the data directory.
+
+    Returns:
+        dict: The number of `rendered`, `reused` and `removed` VEVENTs, and whether the feed was `written`.
+    """
+    json_file_path = os.path.abspath(os.path.join(data_dir, 'matches', f'matches{team_id}.json'))
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        matches_data = json.load(f)
+
+    feeds_dir = os.path.join(data_dir, 'ics')
+    cache_file = os.path.join(feeds_dir, 'cache', f'team{team_id}.json')
+    feed_file = os.path.join(feeds_dir, f'team{team_id}.ics')
+    cache = _load_vevent_cache(cache_file)
+
+    dtstamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    new_cache = {}
+    rendered = 0
+    for match in matches_data['response']:
+        fixture_id = str(match['fixture']['id'])
+        event = build_event(match)
+        event_hash = hashlib.sha1(json.dumps(event, sort_keys=True).encode('utf-8')).hexdigest()
+        cached = cache.get(fixture_id)
+        if cached and cached['hash'] == event_hash:
+            new_cache[fixture_id] = cached
+        else:
+            new_cache[fixture_id] = {'hash': event_hash, 'vevent': render_vevent(fixture_id, event, dtstamp)}
+            rendered += 1
+    removed = len(set(cache) - set(new_cache))
+
+    content = (f'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:{PRODUCT_ID}\r\nCALSCALE:GREGORIAN\r\n'
+               f'METHOD:PUBLISH\r\n{_fold("X-WR-CALNAME:" + _escape(_feed_name(matches_data, team_id)))}\r\n'
+               + ''.join(entry['vevent'] for entry in new_cache.values())
+               + 'END:VCALENDAR\r\n').encode('utf-8')
+
+    written = False
+    if rendered or removed or not os.path.exists(feed_file):
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            json.dump(new_cache, f, ensure_ascii=False)
+
+        # Replace the feed atomically so that the server never reads a partial file
+        tmp_file = f'{feed_file}.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_file, feed_file)
+        record_bytes_written('ics', len(content))
+        written = True
+
+    logging.info(f"Published feed for team {team_id}: {rendered} rendered, "
+                 f"{len(new_cache) - rendered} reused, {removed} removed")
+    return {'rendered': rendered, 'reused': len(new_cache) - rendered, 'removed': removed, 'written': written}
+
+
+def _feed_name(matches_data, team_id):
+    for match in matches_data['response']:
+        for side in ('home', 'away'):
+            if str(match['teams'][side]['id']) == str(team_id):
+                return match['teams'][side]['name']
+    return f'Team {team_id}'
+
+
+def publish_feeds():
+    """
+    Publishes the ICS feed of every team in the config.json file from the matches stored in the data directory.
+    """
+    setup_logging(os.path.join(DATA_DIR, 'logs', 'publish_feeds.log'))
+    METRICS.reset()
+
+    config_path = os.path.join(CONFIG_DIR, 'config.json')
+    with open(config_path, 'r', encoding='utf-8') as config_file:
+        config = json.load(config_file)
+
+    for team_id in config['CALENDARS']:
+        try:
+            publish_team_feed(team_id, DATA_DIR)
+        except Exception as e:
+            logging.error(f"Error publishing feed for team {team_id}: {e}")
+
+    export_metrics('publish_feeds', DATA_DIR)
+
+
+def _accepts_gzip(accept_encoding):
+    """
+    Returns whether an Accept-Encoding header accepts gzip, honouring q-values such as `gzip;q=0`.
+    """
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def _etag_matches(if_none_match, etag):
+    """
+    Returns whether an If-None-Match header matches an ETag, using the weak comparison of RFC 9110.
+    """
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    if '*' in tags:
+        return True
+    opaque_tag = etag[2:] if etag.startswith('W/') else etag
+    return any((tag[2:] if tag.startswith('W/') else tag) == opaque_tag for tag in tags if tag)
+
+
+class _FeedHandler(BaseHTTPRequestHandler):
+
+    def do_HEAD(self):
+        self.do_GET(send_body=False)
+
+    def do_GET(self, send_body=True):
+        name = self.path.split('?', 1)[0].lstrip('/')
+        if not FEED_NAME_PATTERN.match(name):
+            self.send_error(404)
+            return
+        feed = self.server.load_feed(name)
+        if feed is None:
+            self.send_error(404)
+            return
+
+        use_gzip = _accepts_gzip(self.headers.get('Accept-Encoding', ''))
+        body = feed['gzip'] if use_gzip else feed['body']
+        etag = feed['etag_gzip'] if use_gzip else feed['etag']
+        not_modified = _etag_matches(self.headers.get('If-None-Match', ''), etag)
+
+        self.send_response(304 if not_modified else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', f'public, max-age={FEED_CACHE_SECONDS}')
+        self.send_header('Vary', 'Accept-Encoding')
+        if not not_modified:
+            self.send_header('Content-Type', 'text/calendar; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            if use_gzip:
+                self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        if send_body and not not_modified:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+class _FeedServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, feeds_dir):
+        super().__init__(address, _FeedHandler)
+        self.feeds_dir = feeds_dir
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def load_feed(self, name):
+        """
+        Returns the body, gzip body and ETags of a feed, recomputed only when the file changed on disk.
+        """
+        path = os.path.join(self.feeds_dir, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            feed = self.cache.get(name)
+            if feed and feed['version'] == version:
+                return feed
+        with open(path, 'rb') as f:
+            body = f.read()
+        digest = hashlib.sha1(body).hexdigest()
+        feed = {
+            'version': version,
+            'body': body,
+            'gzip': gzip.compress(body, mtime=0),
+            'etag': f'"{digest}"',
+            'etag_gzip': f'"{digest}-gzip"',
+        }
+        with self.lock:
+            self.cache[name] = feed
+        return feed
+
+
+def make_feed_server(feeds_dir, host='127.0.0.1', port=8080):
+    """
+    Creates the HTTP server of the feeds directory. Call `serve_forever` on it to start serving.
+
+    Args:
+        feeds_dir (str): The directory containing the `.ics` feeds.
+        host (str): The address to bind.
+        port (int): The port to bind, or 0 for any free port.
+
+    Returns:
+        http.server.ThreadingHTTPServer: The server.
+    """
+    return _FeedServer((host, port), feeds_dir)
+
+
+def serve_feeds(feeds_dir=None, host='127.0.0.1', port=8080):
+    """
+    Serves the feeds directory until interrupted.
+
+    Args:
+        feeds_dir (str): The directory containing the `.ics` feeds. Defaults to the `ics` folder of the data
+            directory.
+        host (str): The address to bind.
+        port (int): The port to bind.
+    """
+    feeds_dir = feeds_dir or os.path.join(DATA_DIR, 'ics')
+    server = make_feed_server(feeds_dir, host, port)
+    logging.info(f"Serving ICS feeds from {feeds_dir} on http://{host}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+import time
+
+import requests
+
+from mymatches.utils import setup_logging
+from mymatches.metrics import METRICS, timed, record_api_call, export_metrics
+from mymatches.fetch_and_store_matches import API_FOOTBALL_URL, load_config
+from mymatches.update_calendars import authenticate_google, build_event, load_existing_events
+from mymatches.subscriptions import load_subscriptions, subscribed_events
+
+"""
+live_matches.py
+
+This module contains the live-match polling mode. Between the daily runs, it tracks only the fixtures that are
+in progress or close to kickoff, polls them in batched `fixtures?ids=` requests and patches the title of their
+calendar events when the score or the status changes. The API cost of a poll depends on the number of live
+fixtures, not on the number of configured teams. Both the CALENDARS teams and the SUBSCRIPTIONS teams and
+leagues are tracked.
+
+Functions:
+
+find_tracked_fixtures: Finds the fixtures in progress or near kickoff in the stored matches.
+fetch_fixtures_by_ids: Fetches fixtures by id, many ids per request.
+live_summary: Builds the event title of a match with its score and status.
+poll_live_fixtures: Runs one polling iteration.
+run_live_updates: Polls the live fixtures until none is left.
+"""
+
+# Constants
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), '../../config')
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../../data')
+
+# API-Football accepts up to 20 ids per fixtures request
+MAX_IDS_PER_REQUEST = 20
+
+# Fixture statuses, see the API-Football documentation
+LIVE_STATUSES = {'1H', 'HT', '2H', 'ET', 'BT', 'P', 'SUSP', 'INT', 'LIVE'}
+ENDED_STATUSES = {'FT', 'AET', 'PEN', 'PST', 'CANC', 'ABD', 'AWD', 'WO'}
+
+# Tracking window around kickoff, in seconds
+TRACK_BEFORE_KICKOFF = 15 * 60
+TRACK_AFTER_KICKOFF = 3 * 60 * 60
+
+
+def _state_file(data_dir):
+    return os.path.join(data_dir, 'live', 'state.json')
+
+
+def load_live_state(data_dir):
+    """
+    Loads the last pushed status and score of each tracked fixture.
+
+    Args:
+        data_dir (str): The path to the data directory.
+
+    Returns:
+        dict: The live state, keyed by fixture ID.
+    """
+    state_file = _state_file(data_dir)
+    if os.path.exists(state_file):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_live_state(state, data_dir):
+    """
+    Saves the live state.
+
+    Args:
+        state (dict): The live state, keyed by fixture ID.
+        data_dir (str): The path to the data directory.
+    """
+    state_file = _state_file(data_dir)
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=4)
+
+
+def find_tracked_fixtures(team_ids, data_dir, state, now=None, league_ids=()):
+    """
+    Finds the fixtures that are in progress or near kickoff in the stored matches of the given teams and leagues.
+
+    A fixture is tracked when its last known status is live, or when its kickoff is less than
+    TRACK_BEFORE_KICKOFF away and less than TRACK_AFTER_KICKOFF ago, unless it already ended.
+
+    Args:
+        team_ids (list): The team IDs.
+        data_dir (str): The path to the data directory.
+        state (dict): The live state.
+        now (float): The current UNIX timestamp. Defaults to the current time.
+        league_ids (list): The league IDs.
+
+    Returns:
+        dict: The set of given team IDs whose matches file holds each tracked fixture, keyed by fixture ID.
+    """
+    now = time.time() if now is None else now
+    tracked = {}
+    sources = [(team_id, f'matches{team_id}.json') for team_id in team_ids]
+    sources += [(None, f'matches_league{league_id}.json') for league_id in league_ids]
+    for team_id, file_name in sources:
+        json_file_path = os.path.abspath(os.path.join(data_dir, 'matches', file_name))
+        if not os.path.exists(json_file_path):
+            continue
+        with open(json_file_path, 'r', encoding='utf-8') as f:
+            matches_data = json.load(f)
+
+        for match in matches_data['response']:
+            fixture = match['fixture']
+            fixture_id = str(fixture['id'])
+            status = state.get(fixture_id, {}).get('status') or fixture['status']['short']
+            if status in ENDED_STATUSES:
+                continue
+            near_kickoff = -TRACK_BEFORE_KICKOFF <= now - fixture['timestamp'] <= TRACK_AFTER_KICKOFF
+            if status in LIVE_STATUSES or near_kickoff:
+                teams = tracked.setdefault(fixture_id, set())
+                if team_id is not None:
+                    teams.add(team_id)
+    return tracked
+
+
+@timed('fetch_fixtures_by_ids')
+def fetch_fixtures_by_ids(fixture_ids, api_key, base_url=API_FOOTBALL_URL):
+    """
+    Fetches fixtures by id, up to MAX_IDS_PER_REQUEST ids per request.
+
+    Args:
+        fixture_ids (list): The fixture IDs.
+        api_key (str): The API key for authorization.
+        base_url (str): The API-Football base URL.
+
+    Returns:
+        list: The matches, as returned by API-Football.
+
+    Raises:
+        Exception: If a request fails.
+    """
+    url = f"{base_url}/fixtures"
+    headers = {
+        "x-rapidapi-key": api_key,
+        "x-rapidapi-host": "api-football-v1.p.rapidapi.com"
+    }
+
+    fixture_ids = sorted(fixture_ids)
+    matches = []
+    for i in range(0, len(fixture_ids), MAX_IDS_PER_REQUEST):
+        ids = '-'.join(str(fixture_id) for fixture_id in fixture_ids[i:i + MAX_IDS_PER_REQUEST])
+        try:
+            response = requests.get(url, headers=headers, params={"ids": ids})
+        except Exception:
+            record_api_call('api-football/fixtures?ids', error=True)
+            raise
+        record_api_call('api-football/fixtures?ids', error=response.status_code != 200,
+                        bytes_received=len(response.content))
+        if response.status_code != 200:
+            raise Exception(
+                f"Failed to fetch fixtures {ids}. "
+                f"Status code: {response.status_code}. "
+                f"Response content: {response.text}"
+            )
+        matches.extend(response.json()['response'])
+    return matches
+
+
+def live_summary(match):
+    """
+    Builds the event title of a match with its current score and status, e.g.
+    `Vasco 2 x 1 Flamengo, Serie A (2H)`.
+
+    Args:
+        match (dict): The match, as returned by API-Football.
+
+    Returns:
+        str: The event title.
+    """
+    status = match['fixture']['status']['short']
+    goals = match['goals']
+    if goals['home'] is None or goals['away'] is None:
+        return build_event(match)['summary']
+
+    home_team = match['teams']['home']['name']
+    away_team = match['teams']['away']['name']
+    return f"{home_team} {goals['home']} x {goals['away']} {away_team}, {match['league']['name']} ({status})"
+
+
+def poll_live_fixtures(config, service, data_dir, state, now=None):
+    """
+    Runs one polling iteration: fetches the tracked fixtures in batched requests and patches the title of the
+    calendar events whose score or status changed since the last push.
+
+    Args:
+        config (dict): The configuration dictionary.
+        service (googleapiclient.discovery.Resource): The Google Calendar service object.
+        data_dir (str): The path to the data directory.
+        state (dict): The live state, updated in place.
+        now (float): The current UNIX timestamp. Defaults to the current time.
+
+    Returns:
+        dict: The number of `tracked` fixtures, API `requests` made and calendar events `updated`.
+    """
+    calendars = config.get('CALENDARS', {})
+    subscriptions = load_subscriptions(config)
+    team_ids = set(calendars).union(*(subscription['teams'] for subscription in subscriptions.values()))
+    league_ids = set().union(*(subscription['leagues'] for subscription in subscriptions.values()))
+    tracked = find_tracked_fixtures(sorted(team_ids), data_dir, state, now, sorted(league_ids))
+    if not tracked:
+        return {'tracked': 0, 'requests': 0, 'updated': 0}
+
+    matches = fetch_fixtures_by_ids(list(tracked), config['API_KEY'], config.get('API_URL', API_FOOTBALL_URL))
+    requests_made = -(-len(tracked) // MAX_IDS_PER_REQUEST)
+
+    fixture_events = subscribed_events(data_dir)
+    updated = 0
+    for match in matches:
+        fixture_id = str(match['fixture']['id'])
+        current = {'status': match['fixture']['status']['short'],
+                   'home': match['goals']['home'], 'away': match['goals']['away']}
+        # Events are created from not started fixtures by the daily run, so those need no push
+        previous = state.get(fixture_id, {'status': 'NS', 'home': None, 'away': None})
+        if all(previous.get(key) == value for key, value in current.items()):
+            continue
+
+        # The legacy and the subscription events of a calendar are the same event once synced
+        targets = set(fixture_events.get(fixture_id, {}).items())
+        for team_id in tracked.get(fixture_id, ()):
+            event_id = load_existing_events(team_id, data_dir).get(fixture_id)
+            if event_id and team_id in calendars:
+                targets.add((calendars[team_id], event_id))
+
+        summary = live_summary(match)
+        for calendar_id, event_id in sorted(targets):
+            try:
+                service.events().patch(calendarId=calendar_id, eventId=event_id,
+                                       body={'summary': summary}).execute()
+                record_api_call('calendar/events.patch')
+                updated += 1
+                logging.info(f"Successfully updated live event: {summary}")
+            except Exception as e:
+                record_api_call('calendar/events.patch', error=True)
+                logging.error(f"Failed to update live event: {summary}. Event ID: {fixture_id}. Error: {str(e)}")
+                break
+        else:
+            state[fixture_id] = current
+
+    return {'tracked': len(tracked), 'requests': requests_made, 'updated': updated}
+
+
+def run_live_updates(poll_interval=60, max_polls=None):
+    """
+    Polls the fixtures in progress or near kickoff of the teams in the config.json file and pushes score and
+    status changes to their calendar events, until no fixture is left to track.
+
+    Args:
+        poll_interval (float): The delay between two polls, in seconds.
+        max_polls (int): The maximum number of polls, or None to run until no fixture is tracked.
+    """
+    setup_logging(os.path.join(DATA_DIR, 'logs', 'live_updates.log'))
+    METRICS.reset()
+
+    config = load_config(os.path.join(CONFIG_DIR, 'config.json'))
+    service = authenticate_google(os.path.join(CONFIG_DIR, 'service_account_key.json'))
+    state = load_live_state(DATA_DIR)
+
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            try:
+                stats = poll_live_fixtures(config, service, DATA_DIR, state)
+            except Exception as e:
+                logging.error(f"Error polling live fixtures: {e}")
+            else:
+                save_live_state(state, DATA_DIR)
+                if not stats['tracked']:
+                    logging.info("No live fixtures to track.")
+                    break
+                logging.info(f"Polled {stats['tracked']} live fixtures with {stats['requests']} requests, "
+                             f"{stats['updated']} events updated")
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                time.sleep(poll_interval)
+    finally:
+        export_metrics('live_updates', DATA_DIR)
@@ -0,0 +1,325 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+"""
+metrics.py
+
+This module contains the run instrumentation of the mymatches package: per-stage latency histograms, API call
+and error counters per endpoint, and bytes transferred and written. Metrics are collected in a process-wide
+registry and exported at the end of a run as a Prometheus textfile and a JSON run summary.
+
+Classes:
+
+Histogram: Cumulative latency histogram with fixed buckets.
+MetricsRegistry: Thread-safe collection of histograms and counters.
+
+Functions:
+
+timed: Decorator that records the latency of a function as a stage.
+record_api_call: Counts an API call, its errors and its transferred bytes.
+record_bytes_written: Counts bytes written to disk.
+write_prometheus_textfile: Writes the metrics in the Prometheus text exposition format.
+write_run_summary: Writes the metrics as a JSON run summary.
+export_metrics: Writes both exports of a run to the data directory.
+"""
+
+# Latency bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    Latency histogram with fixed bucket upper bounds.
+
+    Args:
+        buckets (tuple): The sorted bucket upper bounds, in seconds.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """
+        Records one observation.
+
+        Args:
+            value (float): The observed latency, in seconds.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimates a quantile as the upper bound of the bucket that contains it.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The estimated quantile, capped at the largest observation.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for upper_bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(upper_bound, self.max)
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    Thread-safe collection of per-stage latency histograms and labeled counters.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Drops every recorded metric and restarts the run clock.
+        """
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.started_at = datetime.now()
+            self.started_clock = time.perf_counter()
+
+    def observe(self, stage, seconds):
+        """
+        Records the latency of one execution of a stage.
+
+        Args:
+            stage (str): The stage name.
+            seconds (float): The latency, in seconds.
+        """
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram()
+            self.histograms[stage].observe(seconds)
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increments a labeled counter.
+
+        Args:
+            name (str): The counter name.
+            value (int): The increment.
+            **labels: The counter labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Context manager that records the latency of its block as a stage.
+
+        Args:
+            stage (str): The stage name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def summary(self, run_name=None):
+        """
+        Builds the JSON run summary.
+
+        Args:
+            run_name (str): The name of the run.
+
+        Returns:
+            dict: The run summary.
+        """
+        with self.lock:
+            stages = {
+                stage: {
+                    'count': histogram.count,
+                    'total_seconds': round(histogram.sum, 6),
+                    'mean_seconds': round(histogram.sum / histogram.count, 6) if histogram.count else 0.0,
+                    'p50_seconds': histogram.quantile(0.5),
+                    'p95_seconds': histogram.quantile(0.95),
+                    'max_seconds': round(histogram.max, 6),
+                }
+                for stage, histogram in sorted(self.histograms.items())
+            }
+            api_calls = {}
+            bytes_written = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                labels = dict(labels)
+                if name == 'bytes_written':
+                    bytes_written[labels['kind']] = value
+                elif 'endpoint' in labels:
+                    endpoint = api_calls.setdefault(labels['endpoint'], {
+                        'calls': 0, 'errors': 0, 'bytes_received': 0, 'bytes_sent': 0})
+                    endpoint[name.replace('api_', '')] = value
+
+            return {
+                'run': run_name,
+                'started_at': self.started_at.isoformat(),
+                'finished_at': datetime.now().isoformat(),
+                'wall_time_seconds': round(time.perf_counter() - self.started_clock, 6),
+                'stages': stages,
+                'api_calls': api_calls,
+                'bytes_written': bytes_written,
+            }
+
+    def to_prometheus(self, run_name=None):
+        """
+        Renders the metrics in the Prometheus text exposition format.
+
+        Args:
+            run_name (str): The name of the run, added as a `run` label to every sample.
+
+        Returns:
+            str: The exposition text.
+        """
+        run_label = f'run="{run_name}",' if run_name else ''
+        lines = []
+        with self.lock:
+            lines.append('# HELP mymatches_stage_duration_seconds Latency of each instrumented stage.')
+            lines.append('# TYPE mymatches_stage_duration_seconds histogram')
+            for stage, histogram in sorted(self.histograms.items()):
+                labels = f'{run_label}stage="{stage}"'
+                cumulative = 0
+                for upper_bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'mymatches_stage_duration_seconds_bucket{{{labels},le="{upper_bound}"}} {cumulative}')
+                lines.append(f'mymatches_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'mymatches_stage_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'mymatches_stage_duration_seconds_count{{{labels}}} {histogram.count}')
+
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f'# TYPE mymatches_{name}_total counter')
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name != name:
+                        continue
+                    label_text = ','.join(f'{key}="{label}"' for key, label in labels)
+                    lines.append(f'mymatches_{name}_total{{{run_label}{label_text}}} {value}')
+
+            lines.append('# TYPE mymatches_run_wall_time_seconds gauge')
+            wall_time = time.perf_counter() - self.started_clock
+            lines.append(f'mymatches_run_wall_time_seconds{{{run_label.rstrip(",")}}} {wall_time:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry used by the instrumented functions
+METRICS = MetricsRegistry()
+
+
+def timed(stage):
+    """
+    Decorator that records the latency of every call of the decorated function as a stage.
+
+    Args:
+        stage (str): The stage name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with METRICS.timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_api_call(endpoint, error=False, bytes_received=0, bytes_sent=0):
+    """
+    Counts an API call, its error status and its transferred bytes.
+
+    Args:
+        endpoint (str): The endpoint name, e.g. `api-football/fixtures`.
+        error (bool): Whether the call failed.
+        bytes_received (int): The size of the response body.
+        bytes_sent (int): The size of the request body.
+    """
+    METRICS.inc('api_calls', endpoint=endpoint)
+    if error:
+        METRICS.inc('api_errors', endpoint=endpoint)
+    if bytes_received:
+        METRICS.inc('api_bytes_received', bytes_received, endpoint=endpoint)
+    if bytes_sent:
+        METRICS.inc('api_bytes_sent', bytes_sent, endpoint=endpoint)
+
+
+def record_bytes_written(kind, size):
+    """
+    Counts bytes written to disk.
+
+    Args:
+        kind (str): The kind of file, e.g. `matches` or `events`.
+        size (int): The number of bytes written.
+    """
+    METRICS.inc('bytes_written', size, kind=kind)
+
+
+def _write_atomically(path, content):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def write_prometheus_textfile(path, run_name=None):
+    """
+    Writes the metrics in the Prometheus text exposition format, e.g. for the node_exporter textfile collector.
+    The file is replaced atomically so that a scrape never reads a partial file.
+
+    Args:
+        path (str): The path to the `.prom` file.
+        run_name (str): The name of the run.
+    """
+    _write_atomically(path, METRICS.to_prometheus(run_name))
+
+
+def write_run_summary(path, run_name=None):
+    """
+    Writes the metrics as a JSON run summary.
+
+    Args:
+        path (str): The path to the JSON file.
+        run_name (str): The name of the run.
+
+    Returns:
+        dict: The run summary.
+    """
+    summary = METRICS.summary(run_name)
+    _write_atomically(path, json.dumps(summary, ensure_ascii=False, indent=4))
+    return summary
+
+
+def export_metrics(run_name, data_dir):
+    """
+    Writes the Prometheus textfile and the JSON run summary of a run to the `metrics` folder of the data directory.
+
+    Args:
+        run_name (str): The name of the run.
+        data_dir (str): The path to the data directory.
+
+    Returns:
+        dict: The run summary.
+    """
+    metrics_dir = os.path.join(data_dir, 'metrics')
+    write_prometheus_textfile(os.path.join(metrics_dir, f'{run_name}.prom'), run_name)
+    return write_run_summary(os.path.join(metrics_dir, f'{run_name}.json'), run_name)
@@ -0,0 +1,409 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+import smtplib
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+import requests
+
+"""
+notifiers.py
+
+This module contains the notification channels used to deliver alerts and an asyncio dispatcher that fans
+a message out to every subscriber of every channel.
+
+Classes:
+
+Notifier: Base class for notification channels.
+StdoutNotifier: Prints the message to the standard output.
+SmtpNotifier: Sends the message by e-mail, one message per batch of BCC recipients.
+WebhookNotifier: POSTs the message as JSON to an HTTP endpoint, one request per batch of recipients.
+WhatsAppNotifier: Sends the message through WhatsApp Web using Selenium.
+NotificationDispatcher: Fans a message out to all channels with per-channel concurrency and rate limits.
+
+Functions:
+
+load_phone_numbers: Loads the WhatsApp subscribers from a text file.
+build_notifiers: Builds the notification channels described in the config file.
+"""
+
+
+class Notifier:
+    """
+    Base class for notification channels.
+
+    Subclasses implement `send`, which delivers one message to one batch of recipients and raises on failure.
+    The dispatcher calls `send` from a worker thread, so it may block.
+
+    Args:
+        recipients (list): The channel subscribers.
+        max_concurrency (int): The maximum number of batches in flight at the same time.
+        rate_limit (float): The maximum number of batches started per second, or None for no limit.
+        batch_size (int): The maximum number of recipients per `send` call.
+    """
+
+    name = 'notifier'
+
+    # Dispatch settings the config file may set on this channel
+    dispatch_settings = ('max_concurrency', 'rate_limit', 'batch_size')
+
+    def __init__(self, recipients, max_concurrency=1, rate_limit=None, batch_size=1):
+        self.recipients = list(recipients)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.rate_limit = rate_limit
+        self.batch_size = max(1, int(batch_size))
+
+    def normalize(self, recipient):
+        """
+        Returns the canonical form of a recipient, used to drop duplicate subscribers.
+
+        Args:
+            recipient (str): The recipient.
+
+        Returns:
+            str: The normalized recipient.
+        """
+        return recipient.strip()
+
+    def send(self, recipients, message, subject=None, link=None):
+        """
+        Delivers the message to a batch of recipients.
+
+        Args:
+            recipients (list): The recipients of this batch.
+            message (str): The message body.
+            subject (str): The message subject, if the channel supports one.
+            link (str): The link the message is about, if any.
+        """
+        raise NotImplementedError
+
+
+class StdoutNotifier(Notifier):
+    """
+    Prints the message to the standard output. Useful for dry runs and cron mails.
+    """
+
+    name = 'stdout'
+
+    def __init__(self, recipients=('stdout',), stream=None):
+        super().__init__(recipients, max_concurrency=1, batch_size=1000)
+        self.stream = stream
+
+    def send(self, recipients, message, subject=None, link=None):
+        stream = self.stream or sys.stdout
+        if subject:
+            print(subject, file=stream)
+        print(message, file=stream)
+        stream.flush()
+
+
+class SmtpNotifier(Notifier):
+    """
+    Sends the message by e-mail. Each batch is a single message with the recipients in BCC.
+
+    Args:
+        recipients (list): The e-mail addresses of the subscribers.
+        host (str): The SMTP server host.
+        port (int): The SMTP server port.
+        sender (str): The From address.
+        username (str): The SMTP user, or None to skip authentication.
+        password (str): The SMTP password.
+        use_tls (bool): Whether to upgrade the connection with STARTTLS.
+        timeout (float): The connection timeout in seconds.
+    """
+
+    name = 'smtp'
+
+    def __init__(self, recipients, host='localhost', port=25, sender='mymatches@localhost', username=None,
+                 password=None, use_tls=False, timeout=30, max_concurrency=4, rate_limit=None, batch_size=50):
+        super().__init__(recipients, max_concurrency=max_concurrency, rate_limit=rate_limit, batch_size=batch_size)
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+    def normalize(self, recipient):
+        return recipient.strip().lower()
+
+    def send(self, recipients, message, subject=None, link=None):
+        email = EmailMessage()
+        email['Subject'] = subject or 'MyMatches alert'
+        email['From'] = self.sender
+        email['To'] = self.sender
+        email.set_content(message)
+
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(email, from_addr=self.sender, to_addrs=list(recipients))
+
+
+class WebhookNotifier(Notifier):
+    """
+    POSTs the message as JSON to an HTTP endpoint. Each batch is a single request whose body carries
+    `subject`, `message`, `link` and the list of `recipients`.
+
+    Args:
+        recipients (list): The subscriber identifiers forwarded to the endpoint.
+        url (str): The webhook URL.
+        headers (dict): Extra request headers, e.g. an authorization token.
+        timeout (float): The request timeout in seconds.
+    """
+
+    name = 'webhook'
+
+    def __init__(self, recipients, url, headers=None, timeout=10, max_concurrency=8, rate_limit=None,
+                 batch_size=100):
+        super().__init__(recipients, max_concurrency=max_concurrency, rate_limit=rate_limit, batch_size=batch_size)
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout
+
+    def send(self, recipients, message, subject=None, link=None):
+        payload = {'subject': subject, 'message': message, 'link': link, 'recipients': list(recipients)}
+        response = requests.post(self.url, json=payload, headers=self.headers, timeout=self.timeout)
+        if response.status_code >= 300:
+            raise Exception(
+                f"Webhook {self.url} rejected the notification. "
+                f"Status code: {response.status_code}. "
+                f"Response content: {response.text}"
+            )
+
+
+class WhatsAppNotifier(Notifier):
+    """
+    Sends the message through WhatsApp Web using Selenium, one browser session per phone number.
+
+    WARNING! Whatsapp may ban numbers that uses automated messages. Do not use personal number to send messages,
+    buy a new number for this service.
+
+    The browser profile can only be driven by one session at a time, so this channel never runs concurrently.
+
+    Args:
+        recipients (list): The phone numbers of the subscribers.
+        rate_limit (float): The maximum number of messages started per second.
+    """
+
+    name = 'whatsapp'
+    dispatch_settings = ('rate_limit',)
+
+    def __init__(self, recipients, rate_limit=None):
+        super().__init__(recipients, max_concurrency=1, rate_limit=rate_limit, batch_size=1)
+
+    def normalize(self, recipient):
+        return re.sub(r'[^\d+]', '', recipient)
+
+    def send(self, recipients, message, subject=None, link=None):
+        from mymatches.update_tickets import kill_chrome_processes, send_whatsapp_message
+
+        for phone_number in recipients:
+            kill_chrome_processes()
+            send_whatsapp_message(phone_number, message, link)
+
+
+class _RateLimiter:
+    """
+    Spaces out the start of consecutive operations so that at most `rate` start per second.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        async with self.lock:
+            now = loop.time()
+            if self.next_start > now:
+                await asyncio.sleep(self.next_start - now)
+                now = loop.time()
+            self.next_start = max(now, self.next_start) + self.interval
+
+
+class NotificationDispatcher:
+    """
+    Fans a message out to every subscriber of every channel.
+
+    Channels run concurrently with each other. Within a channel, recipients are deduplicated, split into
+    batches of `batch_size`, and sent with at most `max_concurrency` batches in flight and at most
+    `rate_limit` batches started per second. A recipient that already received a message from this
+    dispatcher is not sent the same message again. With a `delivered_path`, the deliveries are also appended
+    to a JSON lines file and remembered by every dispatcher using the same file, e.g. across scheduled runs.
+
+    Args:
+        notifiers (list): The notification channels.
+        delivered_path (str): The path to the delivery record, or None to remember deliveries in memory only.
+    """
+
+    def __init__(self, notifiers, delivered_path=None):
+        self.notifiers = list(notifiers)
+        self.delivered_path = delivered_path
+        self.delivered = set()
+        if delivered_path and os.path.exists(delivered_path):
+            with open(delivered_path, 'r', encoding='utf-8') as f:
+                self.delivered.update(tuple(json.loads(line)) for line in f if line.strip())
+
+    def _record_delivered(self, keys):
+        self.delivered.update(keys)
+        if not self.delivered_path:
+            return
+        os.makedirs(os.path.dirname(self.delivered_path), exist_ok=True)
+        with open(self.delivered_path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(list(key)) + '\n' for key in keys)
+
+    def dispatch(self, message, subject=None, link=None):
+        """
+        Sends the message to all channels and blocks until every batch finished.
+
+        Args:
+            message (str): The message body.
+            subject (str): The message subject.
+            link (str): The link the message is about, if any.
+
+        Returns:
+            dict: Per channel name, the number of recipients `sent`, `failed` and `skipped` as duplicates.
+        """
+        return asyncio.run(self.dispatch_async(message, subject, link))
+
+    async def dispatch_async(self, message, subject=None, link=None):
+        """
+        Coroutine version of `dispatch`.
+        """
+        results = await asyncio.gather(*(self._dispatch_channel(notifier, message, subject, link)
+                                         for notifier in self.notifiers))
+        report = {}
+        for notifier, result in zip(self.notifiers, results):
+            totals = report.setdefault(notifier.name, {'sent': 0, 'failed': 0, 'skipped': 0})
+            for key in totals:
+                totals[key] += result[key]
+        return report
+
+    async def _dispatch_channel(self, notifier, message, subject, link):
+        message_key = hashlib.sha1(f"{subject}\n{message}".encode('utf-8')).hexdigest()
+
+        recipients = []
+        seen = set()
+        for recipient in notifier.recipients:
+            normalized = notifier.normalize(recipient)
+            key = (notifier.name, normalized, message_key)
+            if not normalized or normalized in seen or key in self.delivered:
+                continue
+            seen.add(normalized)
+            recipients.append(normalized)
+        result = {'sent': 0, 'failed': 0, 'skipped': len(notifier.recipients) - len(recipients)}
+        if not recipients:
+            return result
+
+        batches = [recipients[i:i + notifier.batch_size] for i in range(0, len(recipients), notifier.batch_size)]
+        semaphore = asyncio.Semaphore(notifier.max_concurrency)
+        limiter = _RateLimiter(notifier.rate_limit) if notifier.rate_limit else None
+        loop = asyncio.get_running_loop()
+
+        async def send_batch(batch):
+            async with semaphore:
+                if limiter:
+                    await limiter.wait()
+                try:
+                    await loop.run_in_executor(executor, notifier.send, batch, message, subject, link)
+                except Exception as e:
+                    logging.error(f"Failed to notify {len(batch)} recipient(s) via {notifier.name}: {e}")
+                    result['failed'] += len(batch)
+                    return
+                self._record_delivered([(notifier.name, recipient, message_key) for recipient in batch])
+                result['sent'] += len(batch)
+
+        with ThreadPoolExecutor(max_workers=notifier.max_concurrency) as executor:
+            await asyncio.gather(*(send_batch(batch) for batch in batches))
+
+        logging.info(f"Notified {result['sent']} recipient(s) via {notifier.name} "
+                     f"({result['failed']} failed, {result['skipped']} skipped)")
+        return result
+
+
+def load_phone_numbers(path):
+    """
+    Loads the WhatsApp subscribers from a text file with one phone number per line.
+
+    Lines that do not look like phone numbers, such as the header of the sample file, are ignored.
+
+    Args:
+        path (str): The path to the phone numbers file.
+
+    Returns:
+        list: The phone numbers, or an empty list if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if re.fullmatch(r'\+?[\d\s().-]{6,}', line)]
+
+
+NOTIFIER_TYPES = {
+    StdoutNotifier.name: StdoutNotifier,
+    SmtpNotifier.name: SmtpNotifier,
+    WebhookNotifier.name: WebhookNotifier,
+    WhatsAppNotifier.name: WhatsAppNotifier,
+}
+
+
+def build_notifiers(specs, phone_numbers_path=None):
+    """
+    Builds the notification channels described in the `NOTIFIERS` section of the config file.
+
+    Each spec is a dict with a `type` key (stdout, smtp, webhook or whatsapp) plus the keyword arguments of
+    the channel class. A whatsapp channel without `recipients` uses the numbers from `phone_numbers_path`.
+    The dispatch settings `max_concurrency`, `rate_limit` and `batch_size` are applied to any channel that
+    allows them, whether its constructor takes them or not; other keys the channel does not accept are ignored
+    with a warning.
+
+    Args:
+        specs (list): The channel specifications.
+        phone_numbers_path (str): The path to the phone numbers file.
+
+    Returns:
+        list: The notification channels.
+
+    Raises:
+        ValueError: If a spec has an unknown type.
+    """
+    notifiers = []
+    for spec in specs:
+        spec = dict(spec)
+        notifier_type = spec.pop('type', None)
+        if notifier_type not in NOTIFIER_TYPES:
+            raise ValueError(f"Unknown notifier type: {notifier_type}. "
+                             f"Supported types: {', '.join(sorted(NOTIFIER_TYPES))}")
+        if notifier_type == WhatsAppNotifier.name and 'recipients' not in spec:
+            spec['recipients'] = load_phone_numbers(phone_numbers_path) if phone_numbers_path else []
+
+        notifier_class = NOTIFIER_TYPES[notifier_type]
+        parameters = inspect.signature(notifier_class.__init__).parameters
+        settings = {key: spec.pop(key) for key in Notifier.dispatch_settings
+                    if key in spec and key not in parameters}
+        for key in [key for key in spec if key not in parameters]:
+            logging.warning(f"Ignoring unknown option {key} of the {notifier_type} notifier")
+            del spec[key]
+
+        notifier = notifier_class(**spec)
+        for key, value in settings.items():
+            if key not in notifier_class.dispatch_settings:
+                logging.warning(f"Ignoring option {key} of the {notifier_type} notifier")
+            elif key == 'rate_limit':
+                notifier.rate_limit = value
+            else:
+                setattr(notifier, key, max(1, int(value)))
+        notifiers.append(notifier)
+    return notifiers
@@ -0,0 +1,455 @@
+import builtins
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from urllib.parse import urlparse
+
+import requests
+
+"""
+profiling.py
+
+This module contains the profiling mode of the script entry points. A profiled run captures either cProfile
+statistics or stack samples of the running thread, plus wall-clock spans around every outbound HTTP call
+(`requests` and the `httplib2` transport of the Google API client) and every file opened for reading or writing.
+It writes, to the `profiles` folder of the data directory:
+
+    <name>-<timestamp>.folded        collapsed stacks, ready for flamegraph.pl or speedscope
+    <name>-<timestamp>.pstats        cProfile statistics, in cprofile mode only
+    <name>-<timestamp>.trace.json    the spans, in the Chrome trace event format (chrome://tracing, Perfetto)
+    <name>-<timestamp>.txt           the top-N hotspots and the slowest spans
+
+Classes:
+
+SpanRecorder: Records wall-clock spans around HTTP calls and file I/O.
+StackSampler: Samples the stack of a thread and collapses the samples for flamegraphs.
+Profiler: Runs the profilers and span recorder of a profiled run and writes their outputs.
+
+Functions:
+
+add_profile_arguments: Adds the profiling options to a script argument parser.
+profile_call: Calls a function, profiled when a profiling mode is given.
+"""
+
+# Constants
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../../data')
+
+PROFILE_MODES = ('sampling', 'cprofile')
+SAMPLE_INTERVAL = 0.005
+TOP_HOTSPOTS = 20
+
+
+class _TracedFile:
+    """
+    File object proxy that times its reads and writes and reports one span when it is closed.
+    """
+
+    def __init__(self, recorder, f, path, mode, start):
+        self._recorder = recorder
+        self._file = f
+        self._path = path
+        self._mode = mode
+        self._start = start
+        self._io_seconds = 0.0
+        self._bytes_read = 0
+        self._bytes_written = 0
+        self._reported = False
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._io_seconds += time.perf_counter() - start
+
+    def read(self, *args):
+        data = self._timed(self._file.read, *args)
+        self._bytes_read += len(data)
+        return data
+
+    def readline(self, *args):
+        data = self._timed(self._file.readline, *args)
+        self._bytes_read += len(data)
+        return data
+
+    def readlines(self, *args):
+        lines = self._timed(self._file.readlines, *args)
+        self._bytes_read += sum(len(line) for line in lines)
+        return lines
+
+    def write(self, data):
+        self._bytes_written += len(data)
+        return self._timed(self._file.write, data)
+
+    def writelines(self, lines):
+        lines = list(lines)
+        self._bytes_written += sum(len(line) for line in lines)
+        return self._timed(self._file.writelines, lines)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def close(self):
+        try:
+            self._timed(self._file.close)
+        finally:
+            if not self._reported:
+                self._reported = True
+                self._recorder.add('file', os.path.basename(str(self._path)), self._start, time.perf_counter(),
+                                   path=str(self._path), mode=self._mode, io_seconds=round(self._io_seconds, 6),
+                                   bytes_read=self._bytes_read, bytes_written=self._bytes_written)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class SpanRecorder:
+    """
+    Records wall-clock spans around outbound HTTP calls and file I/O while it is installed.
+
+    HTTP spans are recorded by wrapping `requests.Session.request` and `httplib2.Http.request`. File spans are
+    recorded by wrapping `open`, and cover a file from its opening to its closing, with the time spent in reads
+    and writes and the bytes transferred as arguments.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.origin = time.perf_counter()
+        self._patches = []
+        self._lock = threading.Lock()
+
+    def add(self, category, name, start, end, **details):
+        """
+        Adds a span.
+
+        Args:
+            category (str): The category of the span, `http` or `file`.
+            name (str): The name of the span.
+            start (float): The `time.perf_counter` value at the start of the span.
+            end (float): The `time.perf_counter` value at the end of the span.
+            **details: The arguments of the span.
+        """
+        with self._lock:
+            self.spans.append({'category': category, 'name': name, 'start': start - self.origin,
+                               'seconds': end - start, 'thread': threading.get_ident(), 'details': details})
+
+    def _wrap_request(self, original, method_position, url_position):
+        recorder = self
+
+        def request(*args, **kwargs):
+            method = kwargs.get('method', args[method_position] if len(args) > method_position else 'GET')
+            url = str(kwargs.get('uri', kwargs.get('url', args[url_position] if len(args) > url_position else '')))
+            parsed = urlparse(url)
+            start = time.perf_counter()
+            status = None
+            try:
+                response = original(*args, **kwargs)
+                # httplib2 returns a (response, content) tuple
+                head = response[0] if isinstance(response, tuple) else response
+                status = getattr(head, 'status_code', None) or getattr(head, 'status', None)
+                return response
+            finally:
+                recorder.add('http', f'{method} {parsed.netloc}{parsed.path}', start, time.perf_counter(),
+                             url=url, status=status)
+
+        return request
+
+    def _wrap_open(self, original):
+        recorder = self
+
+        def traced_open(file, mode='r', *args, **kwargs):
+            start = time.perf_counter()
+            f = original(file, mode, *args, **kwargs)
+            if isinstance(file, int):
+                return f
+            return _TracedFile(recorder, f, file, mode, start)
+
+        return traced_open
+
+    def _patch(self, target, attribute, value):
+        self._patches.append((target, attribute, getattr(target, attribute)))
+        setattr(target, attribute, value)
+
+    def install(self):
+        """
+        Starts recording spans.
+        """
+        # Session.request(self, method, url, ...) and Http.request(self, uri, method='GET', ...)
+        self._patch(requests.Session, 'request', self._wrap_request(requests.Session.request, 1, 2))
+        try:
+            import httplib2
+        except ImportError:
+            httplib2 = None
+        if httplib2 is not None:
+            self._patch(httplib2.Http, 'request', self._wrap_request(httplib2.Http.request, 2, 1))
+        self._patch(builtins, 'open', self._wrap_open(builtins.open))
+
+    def uninstall(self):
+        """
+        Stops recording spans.
+        """
+        while self._patches:
+            target, attribute, original = self._patches.pop()
+            setattr(target, attribute, original)
+
+    def to_chrome_trace(self):
+        """
+        Returns the spans in the Chrome trace event format.
+
+        Returns:
+            dict: The trace, with one complete event per span.
+        """
+        return {'traceEvents': [
+            {'name': span['name'], 'cat': span['category'], 'ph': 'X', 'pid': os.getpid(), 'tid': span['thread'],
+             'ts': round(span['start'] * 1e6, 1), 'dur': round(span['seconds'] * 1e6, 1), 'args': span['details']}
+            for span in self.spans
+        ], 'displayTimeUnit': 'ms'}
+
+
+class StackSampler:
+    """
+    Samples the stack of a thread at a fixed interval and collapses the samples for flamegraphs.
+
+    Args:
+        thread_id (int): The identifier of the sampled thread. Defaults to the calling thread.
+        interval (float): The number of seconds between two samples.
+    """
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _frame_name(frame):
+        code = frame.f_code
+        return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+    def sample(self):
+        """
+        Takes one sample of the stack of the sampled thread.
+        """
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(self._frame_name(frame))
+            frame = frame.f_back
+        if stack:
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='mymatches-stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def folded(self):
+        """
+        Returns the samples as collapsed stacks, one `frame;frame;frame count` line per distinct stack.
+        """
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def hotspots(self, top=TOP_HOTSPOTS):
+        """
+        Returns the functions with the most samples.
+
+        Args:
+            top (int): The number of functions to return.
+
+        Returns:
+            list: Tuples of the function, its own samples and the samples it appears in, by own samples.
+        """
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        return [(name, samples, total[name]) for name, samples in own.most_common(top)]
+
+
+class Profiler:
+    """
+    Runs the profilers and the span recorder of a profiled run and writes their outputs.
+
+    Stack samples are always taken, so every run has a flamegraph-ready file. In cprofile mode, cProfile runs
+    as well and the hotspot summary comes from its statistics instead of the samples.
+
+    Args:
+        name (str): The name of the run, used in the output file names.
+        output_dir (str): The output directory. Defaults to the `profiles` folder of the data directory.
+        mode (str): `sampling` or `cprofile`.
+        interval (float): The number of seconds between two stack samples.
+        top (int): The number of hotspots and slowest spans in the summary.
+    """
+
+    def __init__(self, name, output_dir=None, mode='sampling', interval=SAMPLE_INTERVAL, top=TOP_HOTSPOTS):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        self.name = name
+        self.output_dir = output_dir or os.path.join(DATA_DIR, 'profiles')
+        self.mode = mode
+        self.top = top
+        self.sampler = StackSampler(interval=interval)
+        self.recorder = SpanRecorder()
+        self.profile = cProfile.Profile() if mode == 'cprofile' else None
+        self.seconds = None
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        self.recorder.install()
+        self.sampler.start()
+        if self.profile is not None:
+            self.profile.enable()
+
+    def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+        self.sampler.stop()
+        self.recorder.uninstall()
+        self.seconds = time.perf_counter() - self._start
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        self.write()
+        return False
+
+    def summary(self):
+        """
+        Returns the top-N hotspot summary of the run.
+
+        Returns:
+            str: The summary, as text.
+        """
+        lines = [f'Profile of {self.name} ({self.mode}): {self.seconds:.3f} s wall clock', '']
+
+        if self.profile is not None:
+            stream = io.StringIO()
+            stats = pstats.Stats(self.profile, stream=stream)
+            stats.sort_stats('cumulative').print_stats(self.top)
+            lines += [f'Top {self.top} functions by cumulative time:', stream.getvalue().strip(), '']
+        else:
+            samples = sum(self.sampler.stacks.values()) or 1
+            lines.append(f'Top {self.top} functions by own samples ({samples} samples):')
+            lines.append(f"{'own %':>7} {'total %':>8}  function")
+            for name, own, total in self.sampler.hotspots(self.top):
+                lines.append(f'{100 * own / samples:7.1f} {100 * total / samples:8.1f}  {name}')
+            lines.append('')
+
+        totals = defaultdict(lambda: [0, 0.0])
+        for span in self.recorder.spans:
+            totals[span['category']][0] += 1
+            totals[span['category']][1] += span['seconds']
+        lines.append('Spans:')
+        for category, (count, seconds) in sorted(totals.items()):
+            lines.append(f'{category:>6}: {count} spans, {seconds:.3f} s')
+        lines.append('')
+
+        lines.append(f'Top {self.top} slowest spans:')
+        for span in sorted(self.recorder.spans, key=lambda span: span['seconds'], reverse=True)[:self.top]:
+            lines.append(f"{span['seconds']:9.4f} s  {span['category']:>4}  {span['name']}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """
+        Writes the outputs of the run.
+
+        Returns:
+            dict: The paths of the written files, by kind.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{self.name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        paths = {'folded': f'{base}.folded', 'trace': f'{base}.trace.json', 'summary': f'{base}.txt'}
+
+        with open(paths['folded'], 'w', encoding='utf-8') as f:
+            f.write(self.sampler.folded())
+        with open(paths['trace'], 'w', encoding='utf-8') as f:
+            json.dump(self.recorder.to_chrome_trace(), f)
+        if self.profile is not None:
+            paths['pstats'] = f'{base}.pstats'
+            self.profile.dump_stats(paths['pstats'])
+        summary = self.summary()
+        with open(paths['summary'], 'w', encoding='utf-8') as f:
+            f.write(summary)
+
+        logging.info(f"Profile of {self.name} written to {base}.*")
+        return paths
+
+
+def add_profile_arguments(parser):
+    """
+    Adds the profiling options to a script argument parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser.
+    """
+    parser.add_argument('--profile', nargs='?', const='sampling', choices=PROFILE_MODES,
+                        help='profile the run (default mode: sampling) and write the results to data/profiles')
+    parser.add_argument('--profile-top', type=int, default=TOP_HOTSPOTS, help='number of hotspots in the summary')
+    parser.add_argument('--profile-dir', help='directory of the profiling results')
+
+
+def profile_call(name, func, *args, mode=None, output_dir=None, top=TOP_HOTSPOTS, summary_stream=None, **kwargs):
+    """
+    Calls a function, profiled when a profiling mode is given.
+
+    Args:
+        name (str): The name of the run.
+        func (callable): The function.
+        *args: The positional arguments of the function.
+        mode (str): `sampling`, `cprofile` or None to call the function without profiling.
+        output_dir (str): The output directory of the profiling results.
+        top (int): The number of hotspots and slowest spans in the summary.
+        summary_stream (file): A stream the summary is also written to, e.g. `sys.stdout` in a script.
+        **kwargs: The keyword arguments of the function.
+
+    Returns:
+        The return value of the function.
+    """
+    if mode is None:
+        return func(*args, **kwargs)
+    profiler = Profiler(name, output_dir, mode, top=top)
+    try:
+        with profiler:
+            return func(*args, **kwargs)
+    finally:
+        if summary_stream is not None:
+            summary_stream.write(profiler.summary())
@@ -0,0 +1,472 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+
+from mymatches.utils import setup_logging, stop_logging
+from mymatches.metrics import METRICS, export_metrics
+from mymatches.fetch_and_store_matches import load_config
+from mymatches.update_calendars import add_matches_to_calendar, authenticate_google
+
+"""
+sharding.py
+
+This module contains the sharded runner used for large calendar fleets. The coordinator splits CALENDARS into
+shards, each pinned to one service account key and therefore to its own quota bucket, and writes them to a
+local file-based queue. Worker processes, on this host or on any host sharing the queue directory, claim shards
+through leases that a heartbeat thread renews while they work. A crashed worker stops renewing, its lease expires and another
+worker picks the shard up. Each worker writes the progress of its shard, and the coordinator aggregates them
+into one run report.
+
+Layout of the queue directory:
+
+    shards/shard<n>.json      the teams, calendars and key of a shard
+    leases/shard<n>.json      the current owner and expiry of a shard lease
+    progress/shard<n>.json    the progress of a shard, with `done` set when it finished, and the API call and
+                              bytes written counters of its workers
+
+Classes:
+
+ShardQueue: File-based queue of shards with leases, shared by the coordinator and the workers.
+
+Functions:
+
+plan_shards: Splits the calendars into shards pinned to service account keys.
+run_worker: Claims and processes shards until none is left.
+run_sharded_update: Plans the shards, runs the workers and aggregates the run report.
+"""
+
+# Constants
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), '../../config')
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../../data')
+
+LEASE_SECONDS = 60
+
+
+def plan_shards(calendars, key_paths, shard_count=None):
+    """
+    Splits the calendars into shards pinned to service account keys.
+
+    Teams are assigned to shards by a stable hash of their ID, so a team stays on the same shard, and therefore
+    on the same quota bucket, from one run to the next. Shard `n` uses key `n % len(key_paths)`.
+
+    Args:
+        calendars (dict): The calendar ID of each team ID.
+        key_paths (list): The paths to the service account key files.
+        shard_count (int): The number of shards. Defaults to one shard per key.
+
+    Returns:
+        list: The shards, as dicts with `shard`, `key_path` and `calendars`.
+    """
+    shard_count = shard_count or len(key_paths)
+    shards = [{'shard': n, 'key_path': key_paths[n % len(key_paths)], 'calendars': {}} for n in range(shard_count)]
+    for team_id, calendar_id in calendars.items():
+        n = int(hashlib.sha1(str(team_id).encode('utf-8')).hexdigest(), 16) % shard_count
+        shards[n]['calendars'][team_id] = calendar_id
+    return shards
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class ShardQueue:
+    """
+    File-based queue of shards with leases, shared by the coordinator and the workers.
+
+    A lease is created with an exclusive file creation, so only one worker can claim a free shard. An expired
+    lease is taken over by renaming it to a name unique to the claiming worker first. The renamed file is then
+    checked to still be the expired lease: if another worker took the lease over in between, the worker may
+    have moved that worker's fresh lease, so it puts it back and skips the shard.
+
+    Args:
+        queue_dir (str): The queue directory.
+        lease_seconds (float): The lease duration.
+    """
+
+    def __init__(self, queue_dir, lease_seconds=LEASE_SECONDS):
+        self.queue_dir = queue_dir
+        self.lease_seconds = lease_seconds
+        for name in ('shards', 'leases', 'progress'):
+            os.makedirs(os.path.join(queue_dir, name), exist_ok=True)
+
+    def _path(self, folder, shard):
+        return os.path.join(self.queue_dir, folder, f'shard{shard}.json')
+
+    def publish(self, shards):
+        """
+        Replaces the queued shards and clears their leases and progress.
+
+        Args:
+            shards (list): The shards, as returned by `plan_shards`.
+        """
+        for folder in ('shards', 'leases', 'progress'):
+            for name in os.listdir(os.path.join(self.queue_dir, folder)):
+                os.remove(os.path.join(self.queue_dir, folder, name))
+        for shard in shards:
+            _write_json(self._path('shards', shard['shard']), shard)
+
+    def shards(self):
+        """
+        Returns the queued shards.
+
+        Returns:
+            list: The shards, ordered by number.
+        """
+        shards = [_read_json(os.path.join(self.queue_dir, 'shards', name))
+                  for name in os.listdir(os.path.join(self.queue_dir, 'shards')) if name.endswith('.json')]
+        return sorted((shard for shard in shards if shard), key=lambda shard: shard['shard'])
+
+    def progress(self, shard):
+        return _read_json(self._path('progress', shard))
+
+    def is_done(self, shard):
+        progress = self.progress(shard)
+        return bool(progress and progress.get('done'))
+
+    def claim(self, worker_id, now=None):
+        """
+        Claims the first shard that is not done and has no live lease.
+
+        Args:
+            worker_id (str): The ID of the claiming worker.
+            now (float): The current UNIX timestamp. Defaults to the current time.
+
+        Returns:
+            dict: The claimed shard, or None if no shard is available.
+        """
+        now = time.time() if now is None else now
+        lease = {'worker': worker_id, 'expires': now + self.lease_seconds}
+        for shard in self.shards():
+            if self.is_done(shard['shard']):
+                continue
+            lease_path = self._path('leases', shard['shard'])
+            try:
+                fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                current = _read_json(lease_path)
+                if current is None or current['expires'] > now:
+                    continue
+                # Take over the expired lease: only the worker whose rename moves that very lease owns it
+                stolen_path = f'{lease_path}.{worker_id}.stolen'
+                try:
+                    os.rename(lease_path, stolen_path)
+                except FileNotFoundError:
+                    continue
+                if _read_json(stolen_path) != current:
+                    # Another worker renewed or took over the lease since it was read: put it back
+                    try:
+                        os.link(stolen_path, lease_path)
+                    except FileExistsError:
+                        pass
+                    os.remove(stolen_path)
+                    continue
+                os.remove(stolen_path)
+                logging.warning(f"Lease of shard {shard['shard']} held by {current['worker']} expired, "
+                                f"taken over by {worker_id}")
+                try:
+                    fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                except FileExistsError:
+                    continue
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(lease, f)
+            return shard
+        return None
+
+    def renew(self, shard, worker_id, now=None):
+        """
+        Extends the lease of a shard held by a worker.
+
+        The new lease is written to a temporary file first and only replaces the lease if the worker still owns
+        it and it has not expired, so a renewal never overwrites the lease of a worker that took over the shard.
+
+        Args:
+            shard (int): The shard number.
+            worker_id (str): The ID of the worker.
+            now (float): The current UNIX timestamp. Defaults to the current time.
+
+        Returns:
+            bool: False if the worker lost the lease.
+        """
+        now = time.time() if now is None else now
+        lease_path = self._path('leases', shard)
+        tmp_path = f'{lease_path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'worker': worker_id, 'expires': now + self.lease_seconds}, f)
+        current = _read_json(lease_path)
+        # An expired lease may already be taken over by another worker, so it is not renewed
+        if not current or current['worker'] != worker_id or current['expires'] <= now:
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, lease_path)
+        return True
+
+    def report_progress(self, shard, worker_id, progress):
+        """
+        Writes the progress of a shard.
+
+        Args:
+            shard (int): The shard number.
+            worker_id (str): The ID of the worker.
+            progress (dict): The progress counters.
+        """
+        _write_json(self._path('progress', shard), dict(progress, shard=shard, worker=worker_id))
+
+    def release(self, shard, worker_id):
+        """
+        Releases the lease of a shard held by a worker.
+        """
+        lease_path = self._path('leases', shard)
+        current = _read_json(lease_path)
+        if current and current['worker'] == worker_id:
+            os.remove(lease_path)
+
+
+def _counters():
+    summary = METRICS.summary()
+    return {'api_calls': summary['api_calls'], 'bytes_written': summary['bytes_written']}
+
+
+def _add_counters(total, counters, sign=1):
+    """
+    Adds, or subtracts with `sign=-1`, the API call and bytes written counters of two metric snapshots.
+    """
+    result = {'api_calls': {endpoint: dict(values) for endpoint, values in total.get('api_calls', {}).items()},
+              'bytes_written': dict(total.get('bytes_written', {}))}
+    for endpoint, values in counters.get('api_calls', {}).items():
+        entry = result['api_calls'].setdefault(endpoint, {key: 0 for key in values})
+        for key, value in values.items():
+            entry[key] = entry.get(key, 0) + sign * value
+    for kind, value in counters.get('bytes_written', {}).items():
+        result['bytes_written'][kind] = result['bytes_written'].get(kind, 0) + sign * value
+    return result
+
+
+class _LeaseHeartbeat:
+    """
+    Renews the lease of a shard from a background thread every third of the lease duration while the worker
+    syncs its teams, so a slow team does not let the lease expire. `lost` is set when the lease is lost.
+    """
+
+    def __init__(self, shard_queue, shard, worker_id):
+        self.shard_queue = shard_queue
+        self.shard = shard
+        self.worker_id = worker_id
+        self.lost = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.shard_queue.lease_seconds / 3):
+            try:
+                renewed = self.shard_queue.renew(self.shard, self.worker_id)
+            except OSError as e:
+                logging.error(f"Error renewing the lease of shard {self.shard}: {e}")
+                continue
+            if not renewed:
+                logging.warning(f"Worker {self.worker_id} lost the lease of shard {self.shard}")
+                self.lost.set()
+                return
+
+
+def default_service_factory(key_path):
+    """
+    Returns the Google Calendar service object of a service account key.
+    """
+    return authenticate_google(key_path)
+
+
+def run_worker(queue_dir, data_dir, service_factory=default_service_factory, worker_id=None,
+               lease_seconds=LEASE_SECONDS):
+    """
+    Claims and processes shards until none is left. Each shard is synced with a service object built from its
+    own key while a heartbeat thread renews its lease, and the shard is abandoned before its next team once the
+    lease is lost. The API calls and bytes written while working on a shard
+    are added to the metrics of its progress file.
+
+    Args:
+        queue_dir (str): The queue directory.
+        data_dir (str): The path to the data directory.
+        service_factory (callable): Builds the service object of a key path. Must be picklable to run in a
+            worker process.
+        worker_id (str): The ID of the worker. Defaults to the host name and process ID.
+        lease_seconds (float): The lease duration.
+
+    Returns:
+        list: The numbers of the shards this worker finished.
+    """
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    shard_queue = ShardQueue(queue_dir, lease_seconds)
+    finished = []
+
+    while True:
+        shard = shard_queue.claim(worker_id)
+        if shard is None:
+            return finished
+
+        number = shard['shard']
+        previous = shard_queue.progress(number) or {}
+        completed = set(previous.get('completed', []))
+        progress = {'key_path': shard['key_path'], 'teams': len(shard['calendars']), 'completed': sorted(completed),
+                    'errors': previous.get('errors', 0), 'started_at': previous.get('started_at', time.time()),
+                    'done': False}
+        baseline = _counters()
+        logging.info(f"Worker {worker_id} claimed shard {number} ({len(shard['calendars'])} teams)")
+
+        service = service_factory(shard['key_path'])
+        with _LeaseHeartbeat(shard_queue, number, worker_id) as heartbeat:
+            for team_id, calendar_id in sorted(shard['calendars'].items()):
+                if heartbeat.lost.is_set():
+                    break
+                # Teams completed by a crashed worker are not synced again
+                if team_id in completed:
+                    continue
+                try:
+                    add_matches_to_calendar(team_id, calendar_id, service, data_dir)
+                except Exception as e:
+                    progress['errors'] += 1
+                    logging.error(f"Error syncing team {team_id} in shard {number}: {e}")
+                completed.add(team_id)
+                progress['completed'] = sorted(completed)
+                progress['metrics'] = _add_counters(previous.get('metrics', {}),
+                                                    _add_counters(_counters(), baseline, -1))
+                shard_queue.report_progress(number, worker_id, progress)
+
+        # The worker that took the shard over finishes it
+        if heartbeat.lost.is_set() or not shard_queue.renew(number, worker_id):
+            logging.warning(f"Worker {worker_id} abandoned shard {number}")
+            continue
+        progress.update(done=True, finished_at=time.time())
+        shard_queue.report_progress(number, worker_id, progress)
+        shard_queue.release(number, worker_id)
+        finished.append(number)
+
+
+def _worker_main(worker_number, queue_dir, data_dir, service_factory, lease_seconds):
+    """
+    Entry point of a worker process. The logging listener and the metrics of the coordinator do not survive the
+    fork, so each worker sets up its own; worker processes exit without running the atexit handlers, so the log
+    is flushed explicitly.
+    """
+    setup_logging(os.path.join(data_dir, 'logs', f'sharded_update_worker{worker_number}.log'))
+    METRICS.reset()
+    try:
+        run_worker(queue_dir, data_dir, service_factory, lease_seconds=lease_seconds)
+    finally:
+        stop_logging()
+
+
+def aggregate_report(queue_dir):
+    """
+    Aggregates the progress of every shard into one run report.
+
+    Args:
+        queue_dir (str): The queue directory.
+
+    Returns:
+        dict: The run report, with the API call and bytes written counters of all workers in `metrics`.
+    """
+    shard_queue = ShardQueue(queue_dir)
+    shards = []
+    for shard in shard_queue.shards():
+        progress = shard_queue.progress(shard['shard']) or {}
+        shards.append({
+            'shard': shard['shard'],
+            'key_path': shard['key_path'],
+            'worker': progress.get('worker'),
+            'teams': len(shard['calendars']),
+            'completed': len(progress.get('completed', [])),
+            'errors': progress.get('errors', 0),
+            'done': bool(progress.get('done')),
+            'seconds': round(progress['finished_at'] - progress['started_at'], 3) if progress.get('done') else None,
+            'metrics': _add_counters({}, progress.get('metrics', {})),
+        })
+    metrics = {}
+    for shard in shards:
+        metrics = _add_counters(metrics, shard['metrics'])
+    return {
+        'shards': shards,
+        'teams': sum(shard['teams'] for shard in shards),
+        'completed': sum(shard['completed'] for shard in shards),
+        'errors': sum(shard['errors'] for shard in shards),
+        'done': all(shard['done'] for shard in shards),
+        'metrics': metrics,
+    }
+
+
+def run_sharded_update(workers=None, shard_count=None, queue_dir=None, service_factory=default_service_factory,
+                       lease_seconds=LEASE_SECONDS):
+    """
+    Updates the calendars of the config.json file with a pool of worker processes.
+
+    The service account keys are read from the SERVICE_ACCOUNT_KEYS list of the config file, as paths relative
+    to the config directory, and default to the single service_account_key.json. Workers started on other hosts
+    with `run_worker` on the same queue directory join the run.
+
+    Args:
+        workers (int): The number of worker processes. Defaults to the number of shards.
+        shard_count (int): The number of shards. Defaults to one shard per key.
+        queue_dir (str): The queue directory. Defaults to the `shards` folder of the data directory.
+        service_factory (callable): Builds the service object of a key path.
+        lease_seconds (float): The lease duration.
+
+    Returns:
+        dict: The run report.
+    """
+    setup_logging(os.path.join(DATA_DIR, 'logs', 'sharded_update.log'))
+    METRICS.reset()
+
+    config = load_config(os.path.join(CONFIG_DIR, 'config.json'))
+    key_paths = [os.path.join(CONFIG_DIR, key) for key in config.get('SERVICE_ACCOUNT_KEYS',
+                                                                     ['service_account_key.json'])]
+    queue_dir = queue_dir or os.path.join(DATA_DIR, 'shards')
+
+    shards = plan_shards(config['CALENDARS'], key_paths, shard_count)
+    shard_queue = ShardQueue(queue_dir, lease_seconds)
+    shard_queue.publish(shards)
+
+    processes = [multiprocessing.Process(target=_worker_main,
+                                         args=(n, queue_dir, DATA_DIR, service_factory, lease_seconds))
+                 for n in range(workers or len(shards))]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    # Shards left behind by crashed workers are finished here once their leases expire
+    while not aggregate_report(queue_dir)['done']:
+        if not run_worker(queue_dir, DATA_DIR, service_factory, lease_seconds=lease_seconds):
+            time.sleep(min(lease_seconds, 5))
+
+    report = aggregate_report(queue_dir)
+    with open(os.path.join(queue_dir, 'report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    logging.info(f"Sharded update finished: {report['completed']} teams in {len(shards)} shards, "
+                 f"{report['errors']} errors")
+
+    export_metrics('sharded_update', DATA_DIR)
+    return report
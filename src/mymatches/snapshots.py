@@ -0,0 +1,218 @@
+import bisect
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from mymatches.metrics import record_bytes_written
+
+"""
+snapshots.py
+
+This module contains the snapshot history of the fixture payloads. Every payload fetched for a team or a league
+is stored as a compact, gzip-compressed object named after the SHA-256 of its canonical JSON, so identical
+payloads are stored once, and a per-source index records when each payload was seen. Fetching an unchanged payload costs no new
+bytes. A retention policy trims old index entries and removes the objects no index refers to.
+
+Layout of the `snapshots` folder of the data directory:
+
+    objects/<sha[:2]>/<sha>.json.gz
+    index/team<team_id>.jsonl      one {"time", "sha", "size"} line per change
+    index/league<league_id>.jsonl  the same, for the payloads of a league
+
+Functions:
+
+archive_snapshot: Stores the payload of a team or league if it changed since its last snapshot.
+snapshot_history: Returns the index entries of a team or league.
+load_snapshot: Loads a payload by hash.
+load_snapshot_at: Loads the payload of a team or league as it was at a given time.
+apply_retention: Trims the indexes and deletes unreferenced objects.
+"""
+
+# Retention defaults
+SNAPSHOT_RETENTION_DAYS = 90
+SNAPSHOT_KEEP_LAST = 10
+
+SNAPSHOT_KINDS = ('team', 'league')
+
+
+def _snapshots_dir(data_dir):
+    return os.path.join(data_dir, 'snapshots')
+
+
+def _object_path(sha, data_dir):
+    return os.path.join(_snapshots_dir(data_dir), 'objects', sha[:2], f'{sha}.json.gz')
+
+
+def _index_path(source_id, data_dir, kind='team'):
+    if kind not in SNAPSHOT_KINDS:
+        raise ValueError(f"Unknown snapshot kind: {kind}")
+    return os.path.join(_snapshots_dir(data_dir), 'index', f'{kind}{source_id}.jsonl')
+
+
+def _timestamp(when):
+    return when.timestamp() if isinstance(when, datetime) else float(when)
+
+
+def snapshot_history(source_id, data_dir, kind='team'):
+    """
+    Returns the index entries of a team or league, oldest first.
+
+    Args:
+        source_id (str): The team or league ID.
+        data_dir (str): The path to the data directory.
+        kind (str): `team` or `league`.
+
+    Returns:
+        list: The entries, as dicts with the `time` (UNIX timestamp), `sha` and compressed `size` of a snapshot.
+    """
+    index_path = _index_path(source_id, data_dir, kind)
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def archive_snapshot(source_id, payload, data_dir, now=None, kind='team'):
+    """
+    Stores the payload of a team or league if it changed since its last snapshot.
+
+    Args:
+        source_id (str): The team or league ID.
+        payload (dict): The API-Football payload.
+        data_dir (str): The path to the data directory.
+        now (float): The UNIX timestamp of the snapshot. Defaults to the current time.
+        kind (str): `team` or `league`. Teams and leagues have separate histories even when their IDs collide.
+
+    Returns:
+        tuple: The SHA-256 of the payload and the number of bytes written.
+    """
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    sha = hashlib.sha256(canonical).hexdigest()
+
+    history = snapshot_history(source_id, data_dir, kind)
+    if history and history[-1]['sha'] == sha:
+        return sha, 0
+
+    written = 0
+    object_path = _object_path(sha, data_dir)
+    if os.path.exists(object_path):
+        size = os.path.getsize(object_path)
+    else:
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        content = gzip.compress(canonical, compresslevel=9, mtime=0)
+        tmp_path = f'{object_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, object_path)
+        size = written = len(content)
+
+    index_path = _index_path(source_id, data_dir, kind)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    entry = json.dumps({'time': round(time.time() if now is None else now, 3), 'sha': sha, 'size': size})
+    with open(index_path, 'a', encoding='utf-8') as f:
+        f.write(entry + '\n')
+    written += len(entry) + 1
+
+    record_bytes_written('snapshots', written)
+    logging.info(f"Archived snapshot {sha[:12]} for {kind} {source_id} ({written} bytes written)")
+    return sha, written
+
+
+def load_snapshot(sha, data_dir):
+    """
+    Loads a payload by hash.
+
+    Args:
+        sha (str): The SHA-256 of the payload.
+        data_dir (str): The path to the data directory.
+
+    Returns:
+        dict: The payload.
+
+    Raises:
+        FileNotFoundError: If no snapshot has this hash.
+    """
+    object_path = _object_path(sha, data_dir)
+    if not os.path.exists(object_path):
+        raise FileNotFoundError(f"Snapshot not found in this path: {object_path}")
+    with gzip.open(object_path, 'rb') as f:
+        return json.loads(f.read().decode('utf-8'))
+
+
+def load_snapshot_at(source_id, when, data_dir, kind='team'):
+    """
+    Loads the payload of a team or league as it was at a given time.
+
+    Args:
+        source_id (str): The team or league ID.
+        when (datetime or float): The time, as a datetime or a UNIX timestamp.
+        data_dir (str): The path to the data directory.
+        kind (str): `team` or `league`.
+
+    Returns:
+        dict: The latest payload archived at or before `when`, or None if there is none.
+    """
+    history = snapshot_history(source_id, data_dir, kind)
+    position = bisect.bisect_right([entry['time'] for entry in history], _timestamp(when))
+    if not position:
+        return None
+    return load_snapshot(history[position - 1]['sha'], data_dir)
+
+
+def apply_retention(data_dir, retention_days=SNAPSHOT_RETENTION_DAYS, keep_last=SNAPSHOT_KEEP_LAST, now=None):
+    """
+    Trims the snapshot indexes and deletes the objects no index refers to.
+
+    An index entry is kept if it is younger than `retention_days` or among the `keep_last` most recent entries
+    of its team or league, so the current payload of a source is never deleted.
+
+    Args:
+        data_dir (str): The path to the data directory.
+        retention_days (float): The age after which entries may be dropped.
+        keep_last (int): The number of most recent entries always kept per team or league.
+        now (float): The current UNIX timestamp. Defaults to the current time.
+
+    Returns:
+        dict: The number of index `entries_removed`, `objects_removed` and `bytes_freed`.
+    """
+    stats = {'entries_removed': 0, 'objects_removed': 0, 'bytes_freed': 0}
+    index_dir = os.path.join(_snapshots_dir(data_dir), 'index')
+    objects_dir = os.path.join(_snapshots_dir(data_dir), 'objects')
+    if not os.path.exists(index_dir):
+        return stats
+
+    cutoff = (time.time() if now is None else now) - retention_days * 24 * 3600
+    referenced = set()
+    for name in sorted(os.listdir(index_dir)):
+        kind = next((kind for kind in SNAPSHOT_KINDS if name.startswith(kind)), None)
+        if kind is None or not name.endswith('.jsonl'):
+            continue
+        source_id = name[len(kind):-len('.jsonl')]
+        history = snapshot_history(source_id, data_dir, kind)
+        kept = [entry for position, entry in enumerate(history)
+                if entry['time'] >= cutoff or position >= len(history) - max(keep_last, 1)]
+        referenced.update(entry['sha'] for entry in kept)
+        if len(kept) < len(history):
+            stats['entries_removed'] += len(history) - len(kept)
+            index_path = _index_path(source_id, data_dir, kind)
+            with open(f'{index_path}.tmp', 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry) + '\n' for entry in kept)
+            os.replace(f'{index_path}.tmp', index_path)
+
+    for prefix in os.listdir(objects_dir) if os.path.exists(objects_dir) else []:
+        for name in os.listdir(os.path.join(objects_dir, prefix)):
+            if name[:-len('.json.gz')] in referenced:
+                continue
+            path = os.path.join(objects_dir, prefix, name)
+            stats['bytes_freed'] += os.path.getsize(path)
+            stats['objects_removed'] += 1
+            os.remove(path)
+
+    if stats['entries_removed'] or stats['objects_removed']:
+        logging.info(f"Snapshot retention removed {stats['entries_removed']} entries and "
+                     f"{stats['objects_removed']} objects ({stats['bytes_freed']} bytes)")
+    return stats
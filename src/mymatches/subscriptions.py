@@ -0,0 +1,544 @@
+import hashlib
+import json
+import logging
+import os
+
+import requests
+
+from mymatches.utils import setup_logging
+from mymatches.metrics import METRICS, timed, record_api_call, record_bytes_written, export_metrics
+from mymatches.fetch_and_store_matches import (API_FOOTBALL_URL, fetch_matches, is_file_recent, load_config,
+                                               store_matches)
+from mymatches.snapshots import SNAPSHOT_KEEP_LAST, SNAPSHOT_RETENTION_DAYS, apply_retention, archive_snapshot
+from mymatches.update_calendars import authenticate_google, build_event, load_existing_events, save_events
+
+"""
+subscriptions.py
+
+This module contains the multi-tenant subscription model. A calendar subscribes to teams, leagues or both, and
+a precomputed inverted index maps each fixture to the calendars that must show it. Each team and league is
+fetched once whatever the number of subscribers, each fixture's event is built once, and only the calendars
+whose copy of an event is missing or outdated are written, so sync cost follows unique fixtures and deltas
+rather than the number of subscriptions.
+
+Subscriptions are read from the SUBSCRIPTIONS section of config.json:
+
+    "SUBSCRIPTIONS": {
+        "calendar_id": {"teams": ["131"], "leagues": ["71"]}
+    }
+
+The legacy CALENDARS section (team ID to calendar ID) is read as team subscriptions. For those calendars, the
+events created by `update_calendars` are adopted instead of inserted again, and the events created here are
+recorded in the same `events<team_id>.json` files, so both entry points keep working on a single copy.
+
+Classes:
+
+SubscriptionIndex: Subscriptions and the fixture to calendars inverted index, updated incrementally.
+
+Functions:
+
+load_subscriptions: Reads the subscriptions from the configuration dictionary.
+fetch_league_matches: Fetches the upcoming matches of a league.
+sync_calendars: Writes the missing, outdated and unsubscribed events of every calendar.
+subscribed_events: Returns the events synced for subscriptions, by fixture and calendar.
+sync_subscriptions: Fetches every subscribed team and league once and syncs all subscribed calendars.
+"""
+
+# Constants
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), '../../config')
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../../data')
+
+
+def load_subscriptions(config):
+    """
+    Reads the subscriptions from the configuration dictionary.
+
+    Args:
+        config (dict): The configuration dictionary.
+
+    Returns:
+        dict: The sets of subscribed `teams` and `leagues`, keyed by calendar ID.
+    """
+    subscriptions = {}
+    for team_id, calendar_id in config.get('CALENDARS', {}).items():
+        subscriptions.setdefault(calendar_id, {'teams': set(), 'leagues': set()})['teams'].add(str(team_id))
+    for calendar_id, subscription in config.get('SUBSCRIPTIONS', {}).items():
+        entry = subscriptions.setdefault(calendar_id, {'teams': set(), 'leagues': set()})
+        entry['teams'].update(str(team_id) for team_id in subscription.get('teams', []))
+        entry['leagues'].update(str(league_id) for league_id in subscription.get('leagues', []))
+    return subscriptions
+
+
+class SubscriptionIndex:
+    """
+    Subscriptions of calendars to teams and leagues, and the inverted index from fixtures to calendars.
+
+    The index is updated incrementally: a subscription change only recomputes the fixtures of the affected
+    team or league, and registering fixtures only computes the calendars of those fixtures.
+    """
+
+    def __init__(self):
+        self.team_subscribers = {}
+        self.league_subscribers = {}
+        self.fixtures = {}
+        self.team_fixtures = {}
+        self.league_fixtures = {}
+        self.fixture_calendars = {}
+
+    def subscriptions(self):
+        """
+        Returns the current subscriptions.
+
+        Returns:
+            dict: The sets of subscribed `teams` and `leagues`, keyed by calendar ID.
+        """
+        subscriptions = {}
+        for key, subscribers in (('teams', self.team_subscribers), ('leagues', self.league_subscribers)):
+            for source_id, calendars in subscribers.items():
+                for calendar_id in calendars:
+                    subscriptions.setdefault(calendar_id, {'teams': set(), 'leagues': set()})[key].add(source_id)
+        return subscriptions
+
+    def subscribe(self, calendar_id, teams=(), leagues=()):
+        """
+        Subscribes a calendar to teams and leagues.
+
+        Args:
+            calendar_id (str): The calendar ID.
+            teams (iterable): The team IDs.
+            leagues (iterable): The league IDs.
+        """
+        for team_id in teams:
+            self.team_subscribers.setdefault(str(team_id), set()).add(calendar_id)
+            self._reindex(self.team_fixtures.get(str(team_id), ()))
+        for league_id in leagues:
+            self.league_subscribers.setdefault(str(league_id), set()).add(calendar_id)
+            self._reindex(self.league_fixtures.get(str(league_id), ()))
+
+    def unsubscribe(self, calendar_id, teams=(), leagues=()):
+        """
+        Unsubscribes a calendar from teams and leagues.
+
+        Args:
+            calendar_id (str): The calendar ID.
+            teams (iterable): The team IDs.
+            leagues (iterable): The league IDs.
+        """
+        for team_id in teams:
+            self.team_subscribers.get(str(team_id), set()).discard(calendar_id)
+            if not self.team_subscribers.get(str(team_id)):
+                self.team_subscribers.pop(str(team_id), None)
+            self._reindex(self.team_fixtures.get(str(team_id), ()))
+        for league_id in leagues:
+            self.league_subscribers.get(str(league_id), set()).discard(calendar_id)
+            if not self.league_subscribers.get(str(league_id)):
+                self.league_subscribers.pop(str(league_id), None)
+            self._reindex(self.league_fixtures.get(str(league_id), ()))
+
+    def set_subscriptions(self, subscriptions):
+        """
+        Replaces the subscriptions, applying only the differences with the current ones.
+
+        Args:
+            subscriptions (dict): The sets of subscribed `teams` and `leagues`, keyed by calendar ID.
+        """
+        current = self.subscriptions()
+        for calendar_id in set(current) | set(subscriptions):
+            old = current.get(calendar_id, {'teams': set(), 'leagues': set()})
+            new = subscriptions.get(calendar_id, {'teams': set(), 'leagues': set()})
+            self.unsubscribe(calendar_id, old['teams'] - set(new['teams']), old['leagues'] - set(new['leagues']))
+            self.subscribe(calendar_id, set(new['teams']) - old['teams'], set(new['leagues']) - old['leagues'])
+
+    def add_fixtures(self, matches):
+        """
+        Registers fixtures and computes their calendars.
+
+        Args:
+            matches (iterable): The matches, as returned by API-Football.
+        """
+        changed = []
+        for match in matches:
+            fixture_id = str(match['fixture']['id'])
+            entry = {'teams': [str(match['teams']['home']['id']), str(match['teams']['away']['id'])],
+                     'league': str(match['league']['id'])}
+            if self.fixtures.get(fixture_id) == entry:
+                continue
+            self._forget(fixture_id)
+            self.fixtures[fixture_id] = entry
+            for team_id in entry['teams']:
+                self.team_fixtures.setdefault(team_id, set()).add(fixture_id)
+            self.league_fixtures.setdefault(entry['league'], set()).add(fixture_id)
+            changed.append(fixture_id)
+        self._reindex(changed)
+
+    def prune(self, fixture_ids):
+        """
+        Forgets the fixtures that are not in the given ones, e.g. matches that were played.
+
+        Args:
+            fixture_ids (iterable): The fixture IDs to keep.
+        """
+        keep = {str(fixture_id) for fixture_id in fixture_ids}
+        for fixture_id in [fixture_id for fixture_id in self.fixtures if fixture_id not in keep]:
+            self._forget(fixture_id)
+
+    def _forget(self, fixture_id):
+        entry = self.fixtures.pop(fixture_id, None)
+        if entry:
+            for team_id in entry['teams']:
+                self.team_fixtures.get(team_id, set()).discard(fixture_id)
+            self.league_fixtures.get(entry['league'], set()).discard(fixture_id)
+        self.fixture_calendars.pop(fixture_id, None)
+
+    def _reindex(self, fixture_ids):
+        for fixture_id in list(fixture_ids):
+            entry = self.fixtures[fixture_id]
+            calendars = set(self.league_subscribers.get(entry['league'], ()))
+            for team_id in entry['teams']:
+                calendars.update(self.team_subscribers.get(team_id, ()))
+            if calendars:
+                self.fixture_calendars[fixture_id] = calendars
+            else:
+                self.fixture_calendars.pop(fixture_id, None)
+
+    def calendars_for(self, fixture_id):
+        """
+        Returns the calendars that must show a fixture.
+
+        Args:
+            fixture_id (str): The fixture ID.
+
+        Returns:
+            set: The calendar IDs.
+        """
+        return self.fixture_calendars.get(str(fixture_id), set())
+
+    def to_dict(self):
+        return {
+            'team_subscribers': {key: sorted(value) for key, value in self.team_subscribers.items()},
+            'league_subscribers': {key: sorted(value) for key, value in self.league_subscribers.items()},
+            'fixtures': self.fixtures,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        index.team_subscribers = {key: set(value) for key, value in data['team_subscribers'].items()}
+        index.league_subscribers = {key: set(value) for key, value in data['league_subscribers'].items()}
+        for fixture_id, entry in data['fixtures'].items():
+            index.fixtures[fixture_id] = entry
+            for team_id in entry['teams']:
+                index.team_fixtures.setdefault(team_id, set()).add(fixture_id)
+            index.league_fixtures.setdefault(entry['league'], set()).add(fixture_id)
+        index._reindex(index.fixtures)
+        return index
+
+
+def _index_file(data_dir):
+    return os.path.join(data_dir, 'subscriptions', 'index.json')
+
+
+def load_index(data_dir):
+    """
+    Loads the subscription index.
+
+    Args:
+        data_dir (str): The path to the data directory.
+
+    Returns:
+        SubscriptionIndex: The stored index, or an empty one.
+    """
+    index_file = _index_file(data_dir)
+    if os.path.exists(index_file):
+        with open(index_file, 'r', encoding='utf-8') as f:
+            return SubscriptionIndex.from_dict(json.load(f))
+    return SubscriptionIndex()
+
+
+def save_index(index, data_dir):
+    """
+    Saves the subscription index.
+
+    Args:
+        index (SubscriptionIndex): The index.
+        data_dir (str): The path to the data directory.
+    """
+    index_file = _index_file(data_dir)
+    os.makedirs(os.path.dirname(index_file), exist_ok=True)
+    with open(index_file, 'w', encoding='utf-8') as f:
+        json.dump(index.to_dict(), f, ensure_ascii=False)
+
+
+@timed('fetch_league_matches')
+def fetch_league_matches(league_id, api_key, base_url=API_FOOTBALL_URL):
+    """
+    Fetches the upcoming matches of a league.
+
+    Args:
+        league_id (str): The league ID.
+        api_key (str): The API key for authorization.
+        base_url (str): The API-Football base URL.
+
+    Returns:
+        dict: The matches data if the request is successful.
+
+    Raises:
+        Exception: If the request fails.
+    """
+    url = f"{base_url}/fixtures"
+    querystring = {"league": league_id, "next": "99"}
+
+    headers = {
+        "x-rapidapi-key": api_key,
+        "x-rapidapi-host": "api-football-v1.p.rapidapi.com"
+    }
+
+    try:
+        response = requests.get(url, headers=headers, params=querystring)
+    except Exception:
+        record_api_call('api-football/fixtures', error=True)
+        raise
+    record_api_call('api-football/fixtures', error=response.status_code != 200, bytes_received=len(response.content))
+    if response.status_code == 200:
+        return response.json()
+    else:
+        raise Exception(
+            f"Failed to fetch matches for league {league_id}. "
+            f"Status code: {response.status_code}. "
+            f"Response content: {response.text}"
+        )
+
+
+def _calendar_state_file(calendar_id, data_dir):
+    name = hashlib.sha1(calendar_id.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(data_dir, 'subscriptions', 'calendars', f'{name}.json')
+
+
+def _load_calendar_state(calendar_id, data_dir):
+    state_file = _calendar_state_file(calendar_id, data_dir)
+    if os.path.exists(state_file):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)['events']
+    return {}
+
+
+def _stored_calendars(data_dir):
+    """
+    Returns the calendars that hold synced events, including the ones without subscriptions left.
+    """
+    states_dir = os.path.join(data_dir, 'subscriptions', 'calendars')
+    if not os.path.exists(states_dir):
+        return set()
+    calendars = set()
+    for name in os.listdir(states_dir):
+        with open(os.path.join(states_dir, name), 'r', encoding='utf-8') as f:
+            calendars.add(json.load(f)['calendar_id'])
+    return calendars
+
+
+def subscribed_events(data_dir):
+    """
+    Returns the events synced for subscriptions.
+
+    Args:
+        data_dir (str): The path to the data directory.
+
+    Returns:
+        dict: The event ID of each calendar holding a fixture, keyed by fixture ID.
+    """
+    states_dir = os.path.join(data_dir, 'subscriptions', 'calendars')
+    fixture_events = {}
+    for name in sorted(os.listdir(states_dir)) if os.path.exists(states_dir) else []:
+        with open(os.path.join(states_dir, name), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        for fixture_id, entry in state['events'].items():
+            fixture_events.setdefault(fixture_id, {})[state['calendar_id']] = entry['event_id']
+    return fixture_events
+
+
+def _adopt_legacy_events(events, team_ids, data_dir):
+    """
+    Adds the events `update_calendars` created for the legacy teams of a calendar. Their hash is unknown, so
+    they are updated once rather than inserted a second time.
+    """
+    for team_id in team_ids:
+        for fixture_id, event_id in load_existing_events(team_id, data_dir).items():
+            events.setdefault(fixture_id, {'event_id': event_id, 'hash': None})
+
+
+def _share_legacy_events(events, deleted, team_ids, index, data_dir):
+    """
+    Records the events of the fixtures of the legacy teams of a calendar in their `update_calendars` events files.
+    """
+    for team_id in team_ids:
+        legacy = load_existing_events(team_id, data_dir)
+        shared = dict(legacy)
+        for fixture_id, entry in events.items():
+            if team_id in index.fixtures.get(fixture_id, {}).get('teams', ()):
+                shared[fixture_id] = entry['event_id']
+        for fixture_id in deleted:
+            shared.pop(fixture_id, None)
+        if shared != legacy:
+            save_events(team_id, shared, data_dir)
+
+
+def _save_calendar_state(calendar_id, events, data_dir):
+    state_file = _calendar_state_file(calendar_id, data_dir)
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    content = json.dumps({'calendar_id': calendar_id, 'events': events}, ensure_ascii=False).encode('utf-8')
+    with open(state_file, 'wb') as f:
+        f.write(content)
+    record_bytes_written('subscriptions', len(content))
+
+
+@timed('sync_calendars')
+def sync_calendars(index, matches, service, data_dir, legacy_calendars=None, delete_unsubscribed=True):
+    """
+    Writes the missing, outdated and unsubscribed events of every calendar of the index.
+
+    Each calendar keeps, per fixture, the ID and the content hash of the event it holds. A fixture's event is
+    built and hashed once; a calendar is only written to when its hash differs, and events of known fixtures
+    the calendar is no longer subscribed to are deleted.
+
+    Events of the legacy CALENDARS teams are shared with `update_calendars` through its events files.
+
+    Args:
+        index (SubscriptionIndex): The subscription index.
+        matches (dict): The matches, keyed by fixture ID.
+        service (googleapiclient.discovery.Resource): The Google Calendar service object.
+        data_dir (str): The path to the data directory.
+        legacy_calendars (dict): The legacy CALENDARS section, the calendar ID of each team ID.
+        delete_unsubscribed (bool): Whether to delete the events of fixtures missing from the targets. Pass False
+            when `matches` may lack fixtures that are still subscribed, e.g. after a failed fetch.
+
+    Returns:
+        dict: The number of events `inserted`, `updated`, `deleted`, `unchanged` and `failed`.
+    """
+    stats = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0, 'failed': 0}
+    wanted = {}
+    for fixture_id, match in matches.items():
+        calendars = index.calendars_for(fixture_id)
+        if not calendars:
+            continue
+        event = build_event(match)
+        event_hash = hashlib.sha1(json.dumps(event, sort_keys=True).encode('utf-8')).hexdigest()
+        for calendar_id in calendars:
+            wanted.setdefault(calendar_id, {})[fixture_id] = (event, event_hash)
+
+    legacy_teams = {}
+    for team_id, calendar_id in (legacy_calendars or {}).items():
+        legacy_teams.setdefault(calendar_id, []).append(str(team_id))
+
+    calendars = set(wanted) | set(index.subscriptions()) | _stored_calendars(data_dir)
+    for calendar_id in sorted(calendars):
+        events = _load_calendar_state(calendar_id, data_dir)
+        _adopt_legacy_events(events, legacy_teams.get(calendar_id, ()), data_dir)
+        targets = wanted.get(calendar_id, {})
+        deleted = []
+        dirty = False
+
+        for fixture_id, (event, event_hash) in targets.items():
+            known = events.get(fixture_id)
+            if known and known['hash'] == event_hash:
+                stats['unchanged'] += 1
+                continue
+            method = 'update' if known else 'insert'
+            try:
+                if known:
+                    service.events().update(calendarId=calendar_id, eventId=known['event_id'], body=event).execute()
+                    event_id = known['event_id']
+                else:
+                    event_id = service.events().insert(calendarId=calendar_id, body=event).execute()['id']
+                record_api_call(f'calendar/events.{method}')
+            except Exception as e:
+                record_api_call(f'calendar/events.{method}', error=True)
+                stats['failed'] += 1
+                logging.error(f"Failed to {method} event: {event['summary']}. Calendar: {calendar_id}. "
+                              f"Error: {str(e)}")
+                continue
+            events[fixture_id] = {'event_id': event_id, 'hash': event_hash}
+            stats['inserted' if method == 'insert' else 'updated'] += 1
+            dirty = True
+
+        # Events of fixtures that are still scheduled but no longer subscribed to
+        for fixture_id in [fixture_id for fixture_id in events if delete_unsubscribed
+                           and fixture_id in index.fixtures and fixture_id not in targets]:
+            try:
+                service.events().delete(calendarId=calendar_id, eventId=events[fixture_id]['event_id']).execute()
+                record_api_call('calendar/events.delete')
+            except Exception as e:
+                record_api_call('calendar/events.delete', error=True)
+                stats['failed'] += 1
+                logging.error(f"Failed to delete event of fixture {fixture_id}. Calendar: {calendar_id}. "
+                              f"Error: {str(e)}")
+                continue
+            del events[fixture_id]
+            deleted.append(fixture_id)
+            stats['deleted'] += 1
+            dirty = True
+
+        if dirty:
+            _save_calendar_state(calendar_id, events, data_dir)
+            _share_legacy_events(events, deleted, legacy_teams.get(calendar_id, ()), index, data_dir)
+
+    logging.info(f"Synced {len(calendars)} calendars: " + ', '.join(f"{count} {key}" for key, count in stats.items()))
+    return stats
+
+
+def _source_file(kind, source_id, data_dir):
+    name = f'matches{source_id}.json' if kind == 'team' else f'matches_league{source_id}.json'
+    return os.path.abspath(os.path.join(data_dir, 'matches', name))
+
+
+def sync_subscriptions():
+    """
+    Fetches every subscribed team and league once, updates the subscription index and syncs all subscribed
+    calendars.
+    """
+    setup_logging(os.path.join(DATA_DIR, 'logs', 'sync_subscriptions.log'))
+    METRICS.reset()
+
+    config = load_config(os.path.join(CONFIG_DIR, 'config.json'))
+    index = load_index(DATA_DIR)
+    index.set_subscriptions(load_subscriptions(config))
+    base_url = config.get('API_URL', API_FOOTBALL_URL)
+
+    matches = {}
+    complete = True
+    sources = [('team', team_id) for team_id in sorted(index.team_subscribers)]
+    sources += [('league', league_id) for league_id in sorted(index.league_subscribers)]
+    for kind, source_id in sources:
+        json_file_path = _source_file(kind, source_id, DATA_DIR)
+        try:
+            if not is_file_recent(json_file_path):
+                fetch = fetch_league_matches if kind == 'league' else fetch_matches
+                payload = fetch(source_id, config['API_KEY'], base_url)
+                store_matches(payload, json_file_path)
+                archive_snapshot(source_id, payload, DATA_DIR, kind=kind)
+        except Exception as e:
+            logging.error(f"Error processing {kind} {source_id}: {e}")
+            complete = False
+        # After a failed fetch, the last stored matches keep the source's events in place
+        try:
+            with open(json_file_path, 'r', encoding='utf-8') as f:
+                source_matches = json.load(f)['response']
+        except Exception as e:
+            logging.error(f"No stored matches for {kind} {source_id}: {e}")
+            complete = False
+            continue
+        for match in source_matches:
+            matches[str(match['fixture']['id'])] = match
+
+    index.add_fixtures(matches.values())
+    if complete:
+        index.prune(matches)
+    save_index(index, DATA_DIR)
+
+    service = authenticate_google(os.path.join(CONFIG_DIR, 'service_account_key.json'))
+    # Without every source, a missing fixture may still be subscribed, so nothing is deleted
+    sync_calendars(index, matches, service, DATA_DIR, config.get('CALENDARS', {}), delete_unsubscribed=complete)
+
+    apply_retention(DATA_DIR, config.get('SNAPSHOT_RETENTION_DAYS', SNAPSHOT_RETENTION_DAYS),
+                    config.get('SNAPSHOT_KEEP_LAST', SNAPSHOT_KEEP_LAST))
+
+    export_metrics('sync_subscriptions', DATA_DIR)
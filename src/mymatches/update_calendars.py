@@ -6,6 +6,7 @@ from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 
 from mymatches import setup_logging
+from mymatches.metrics import METRICS, timed, record_api_call, record_bytes_written, export_metrics
 
 # Constants
 CONFIG_DIR = os.path.join(os.path.dirname(__file__), '../../config')
@@ -26,6 +27,7 @@ def authenticate_google(key_path):
 	return build('calendar', 'v3', credentials=credentials)
 
 
+@timed('add_matches_to_calendar')
 def add_matches_to_calendar(team_id, calendar_id, service, data_dir):
 	"""
 	Adds the matches to the Google Calendar.
@@ -43,30 +45,58 @@ def add_matches_to_calendar(team_id, calendar_id, service, data_dir):
 
 	# Iterate over the matches from the response
 	for match in matches_data['response']:
-		fixture = match['fixture']
-		league = match['league']
-		home_team = match['teams']['home']
-		away_team = match['teams']['away']
-
-		# Extract match details
-		start_time = datetime.fromisoformat(fixture['date'])
-		end_time = start_time + timedelta(hours=2)  # Assume match duration is 2 hours
-		event_summary = f"{home_team['name']} vs {away_team['name']}, {league['name']}"
-		event_id = str(fixture['id'])
-		venue = fixture['venue']['name'] if fixture['venue'] else 'TBD'
-
-		# Prepare the event
-		event = {
-			'summary': event_summary,
-			'start': {'dateTime': start_time.isoformat(), 'timeZone': fixture['timezone']},
-			'end': {'dateTime': end_time.isoformat(), 'timeZone': fixture['timezone']},
-			'location': venue
-		}
+		event_id = str(match['fixture']['id'])
+		event = build_event(match)
 
 		# Add or update the event in the calendar
 		add_or_update_event(team_id, calendar_id, event_id, event, service, data_dir)
 
 
+def build_event(match):
+	"""
+	Builds the Google Calendar event of a match.
+
+	Args:
+		match (dict): The match, as returned by API-Football.
+
+	Returns:
+		dict: The event details.
+	"""
+	fixture = match['fixture']
+	league = match['league']
+	home_team = match['teams']['home']
+	away_team = match['teams']['away']
+
+	# Extract match details
+	start_time = datetime.fromisoformat(fixture['date'])
+	end_time = start_time + timedelta(hours=2)  # Assume match duration is 2 hours
+	event_summary = f"{home_team['name']} vs {away_team['name']}, {league['name']}"
+	venue = fixture['venue']['name'] if fixture['venue'] else 'TBD'
+
+	# Prepare the event
+	return {
+		'summary': event_summary,
+		'start': {'dateTime': start_time.isoformat(), 'timeZone': fixture['timezone']},
+		'end': {'dateTime': end_time.isoformat(), 'timeZone': fixture['timezone']},
+		'location': venue
+	}
+
+
+@timed('calendar_api')
+def _execute(request, endpoint, body_size):
+	"""
+	Executes a Google Calendar API request and counts the call, so that only the API call itself is recorded.
+	"""
+	try:
+		response = request.execute()
+	except Exception:
+		record_api_call(endpoint, error=True, bytes_sent=body_size)
+		raise
+	record_api_call(endpoint, bytes_sent=body_size)
+	return response
+
+
+@timed('add_or_update_event')
 def add_or_update_event(team_id, calendar_id, event_id, event, service, data_dir):
 	"""
 	Adds or updates an event in the Google Calendar.
@@ -81,18 +111,20 @@ def add_or_update_event(team_id, calendar_id, event_id, event, service, data_dir
 
 	"""
 	existing_events = load_existing_events(team_id, data_dir)
+	body_size = len(json.dumps(event, ensure_ascii=False).encode('utf-8'))
 
 	if event_id in existing_events:
 		try:
-			updated_event = service.events().update(calendarId=calendar_id, eventId=existing_events[event_id],
-			                                        body=event).execute()
+			updated_event = _execute(service.events().update(calendarId=calendar_id, eventId=existing_events[event_id],
+			                                                 body=event), 'calendar/events.update', body_size)
 			if updated_event:
 				logging.info(f"Successfully updated event: {event['summary']}")
 		except Exception as e:
 			logging.error(f"Failed to update event: {event['summary']}. Event ID: {event_id}. Error: {str(e)}")
 	else:
 		try:
-			created_event = service.events().insert(calendarId=calendar_id, body=event).execute()
+			created_event = _execute(service.events().insert(calendarId=calendar_id, body=event),
+			                         'calendar/events.insert', body_size)
 			existing_events[event_id] = created_event['id']
 			save_events(team_id, existing_events, data_dir)
 			if created_event:
@@ -136,8 +168,10 @@ def save_events(team_id, events, data_dir):
 		os.makedirs(events_dir)
 
 	events_file = os.path.join(data_dir, 'events', 'events' + team_id + '.json')
-	with open(events_file, 'w', encoding='utf-8') as f:
-		json.dump(events, f, ensure_ascii=False, indent=4)
+	content = json.dumps(events, ensure_ascii=False, indent=4).encode('utf-8')
+	with open(events_file, 'wb') as f:
+		f.write(content)
+	record_bytes_written('events', len(content))
 
 
 def update_calendars():
@@ -148,6 +182,7 @@ def update_calendars():
 
 
 	setup_logging(os.path.join(DATA_DIR, 'logs', 'update_calendars.log'))
+	METRICS.reset()
 
 	config_path = os.path.join(CONFIG_DIR, 'config.json')
 	with open(config_path, 'r', encoding='utf-8') as config_file:
@@ -162,6 +197,8 @@ def update_calendars():
 		calendar_id = calendars[team_id]
 		add_matches_to_calendar(team_id, calendar_id, service, DATA_DIR)
 
+	export_metrics('update_calendars', DATA_DIR)
+
 
 
 if __name__ == '__main__':
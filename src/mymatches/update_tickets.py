@@ -1,3 +1,4 @@
+import json
 import os
 import re
 import time
@@ -9,7 +10,9 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from urllib.parse import quote
-from mymatches.utils import setup_logging
+from mymatches.utils import setup_logging, log_contains
+from mymatches.notifiers import NotificationDispatcher, build_notifiers
+from mymatches.metrics import METRICS, timed, record_api_call, export_metrics
 import platform
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -25,22 +28,18 @@ WHATSAPP_SEND_URL = "https://web.whatsapp.com/send"
 CONFIG_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'config')
 PHONE_NUMBER_LIST_PATH = os.path.join(CONFIG_DIR, 'phone_numbers.txt')
 
-# get phone numbers from text file and put then into a list
-with open(PHONE_NUMBER_LIST_PATH, 'r') as file:
-    PHONE_NUMBERS_LIST = file.readlines()
-    PHONE_NUMBERS_LIST = [number.strip() for number in PHONE_NUMBERS_LIST]
-
-
 CHROME_DRIVER_PATH = r"path\to\chromedriver.exe"
 CHROME_PROFILE_PATH = r"userfolder\AppData\Local\Google\Chrome\User Data"
 PROFILE_DIRECTORY = "Profile x"  # Adjust this to the correct profile
 
-LOGS_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'logs')
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data')
+LOGS_DIR = os.path.join(DATA_DIR, 'logs')
 
 # Setup logging configuration
 LOG_FILE = os.path.join(LOGS_DIR, 'update_tickets.log')
 
 
+@timed('get_news_content')
 def get_news_content(post_url):
     """
     Fetches and returns the content of the news article from the provided URL.
@@ -51,8 +50,10 @@ def get_news_content(post_url):
     Returns:
         str: The content of the news post or an error message.
     """
+    response = None
     try:
         response = requests.get(post_url)
+        record_api_call('news/post', error=response.status_code != 200, bytes_received=len(response.content))
         soup = BeautifulSoup(response.content, 'html.parser')
         content_element = soup.find('div', class_='mb-5')
         if content_element:
@@ -60,10 +61,13 @@ def get_news_content(post_url):
             return content
         return "No content found."
     except Exception as e:
+        if response is None:
+            record_api_call('news/post', error=True)
         logging.error(f"Error fetching news content: {e}")
         return "Error retrieving content."
 
 
+@timed('check_for_ticket_post')
 def check_for_ticket_post(url, search_text):
     """
     Searches for a post that matches the search text and returns the post content.
@@ -75,8 +79,10 @@ def check_for_ticket_post(url, search_text):
     Returns:
         str: The content of the matching post or None if no matching post is found.
     """
+    response = None
     try:
         response = requests.get(url)
+        record_api_call('news/list', error=response.status_code != 200, bytes_received=len(response.content))
         soup = BeautifulSoup(response.content, 'html.parser')
         posts = soup.find_all('div', class_='box-noticias p-3 h-100 d-flex flex-column justify-content-between')
 
@@ -88,6 +94,8 @@ def check_for_ticket_post(url, search_text):
                 return post_content, post_link, title_element.text
         return None, None, None
     except Exception as e:
+        if response is None:
+            record_api_call('news/list', error=True)
         logging.error(f"Error checking for post: {e}")
         return None, None, None
 
@@ -192,9 +200,11 @@ def add_or_update_event(calendar_id, service, event):
 
     try:
         created_event = service.events().insert(calendarId=calendar_id, body=event).execute()
+        record_api_call('calendar/events.insert')
         if created_event:
             logging.info(f"Successfully added event: {event['summary']}")
     except Exception as e:
+        record_api_call('calendar/events.insert', error=True)
         logging.error(f"Failed to add event: {event['summary']}.  Error: {str(e)}")
 
 
@@ -273,75 +283,105 @@ def authenticate_google_oauth():
     return build('calendar', 'v3', credentials=creds)
 
 
+def notify_subscribers(message, subject, link=None):
+    """
+    Sends the message to the subscribers of every channel listed in the NOTIFIERS section of the config file.
+    Deliveries are recorded in the data directory, so a subscriber never receives the same message twice.
+
+    WARNING! Whatsapp may ban numbers that uses automated messages. Do not use personal number to send messages,
+    buy a new number for this service.
+
+    Args:
+        message (str): The message to send.
+        subject (str): The message subject.
+        link (str): The link of the post the message is about.
+
+    Returns:
+        dict: The delivery report of the dispatcher.
+    """
+    config_path = os.path.join(CONFIG_DIR, 'config.json')
+    if not os.path.exists(config_path):
+        logging.info("No config file found, skipping notifications.")
+        return {}
+
+    with open(config_path, 'r', encoding='utf-8') as config_file:
+        config = json.load(config_file)
+
+    notifiers = build_notifiers(config.get('NOTIFIERS', []), PHONE_NUMBER_LIST_PATH)
+    if not notifiers:
+        return {}
+    delivered_path = os.path.join(DATA_DIR, 'notifications', 'delivered.jsonl')
+    return NotificationDispatcher(notifiers, delivered_path).dispatch(message, subject, link)
+
+
 def run_update_tickets():
     """
     Main function to check for a new post and send an update if a matching post is found.
 
     """
-    post_content, post_link, post_title = check_for_ticket_post(BLOG_URL, SEARCH_TEXT)
+    METRICS.reset()
+    try:
+        post_content, post_link, post_title = check_for_ticket_post(BLOG_URL, SEARCH_TEXT)
 
-    # check in log file if the post message is already sent
-    setup_logging(LOG_FILE)
+        # check in log file if the post message is already sent
+        setup_logging(LOG_FILE)
 
-    if post_content:
+        if post_content:
 
-        with open(LOG_FILE, 'r') as file:
-            log_content = file.read()
-            if post_link in log_content:
+            if log_contains(LOG_FILE, post_link):
                 logging.info(f"No new tickets post found")
                 return
 
-        message = f"New Tickets Post Auto Update Alert!\n\nContent:\n{post_content}\n\nPost Link: {post_link}"
-        print(post_title)
-        print(message)
-        logging.info(f'Last post update: {post_link.split("/")[-2]}')
-
-        # Extract the ticket selling information
-        ticket_info = extract_ticket_selling_info(post_content)
-        print(ticket_info)
-        if ticket_info:
-            start_date, start_time = ticket_info
-            event_summary = post_title[19:]
-            print(event_summary)
-            # Combine the date and time into one string
-            # Clean the time string by removing the comma and replacing 'h'
-            start_time = start_time.replace(',', '').replace('h', ':00')
-
-            # Split the time into hour and ensure it's zero-padded
-            hour, minute = start_time.split(':')
-            hour = hour.zfill(2)
-            start_time = f'{hour}:{minute}'
-
-            # Get the current year
-            current_year = datetime.now().year
-
-            # Parse the date string into day and month
-            day, month = start_date.split('/')
-
-            # Construct the ISO format string dynamically
-            iso_format_str = f'{current_year}-{month.zfill(2)}-{day.zfill(2)}T{start_time}'
-
-            # Parse the date and time string into a datetime object
-            # Create the datetime object from the ISO format string
-            start_time_obj = datetime.fromisoformat(iso_format_str)
-            end_time = start_time_obj + timedelta(hours=48)
-
-            venue = "sociogigante.com/ingressos"
-            event = create_event(event_summary, start_time_obj, end_time, venue)
-            # service_acc_key_path = os.path.join(CONFIG_DIR, 'service_account_key.json')
-            # service = authenticate_google(service_acc_key_path)
-            service = authenticate_google_oauth()
-            calendar_id = "98e4f5e3788173b71456bc62c7e3ba201f03e2f330585e2be059a289ba078997@group.calendar.google.com"
-            add_or_update_event(calendar_id, service, event)
-
-        # WARNING! Whatsapp may ban numbers that uses automated messages. Do not use personal number to send messages, buy a new number for this service.
-        #
-        # for phone_number in PHONE_NUMBERS_LIST:
-        #     kill_chrome_processes()
-        #     send_whatsapp_message(phone_number, message, post_link)
+            message = f"New Tickets Post Auto Update Alert!\n\nContent:\n{post_content}\n\nPost Link: {post_link}"
+            print(post_title)
+            print(message)
+            logging.info(f'Last post update: {post_link.split("/")[-2]}')
+
+            # Extract the ticket selling information
+            ticket_info = extract_ticket_selling_info(post_content)
+            print(ticket_info)
+            if ticket_info:
+                start_date, start_time = ticket_info
+                event_summary = post_title[19:]
+                print(event_summary)
+                # Combine the date and time into one string
+                # Clean the time string by removing the comma and replacing 'h'
+                start_time = start_time.replace(',', '').replace('h', ':00')
+
+                # Split the time into hour and ensure it's zero-padded
+                hour, minute = start_time.split(':')
+                hour = hour.zfill(2)
+                start_time = f'{hour}:{minute}'
+
+                # Get the current year
+                current_year = datetime.now().year
+
+                # Parse the date string into day and month
+                day, month = start_date.split('/')
+
+                # Construct the ISO format string dynamically
+                iso_format_str = f'{current_year}-{month.zfill(2)}-{day.zfill(2)}T{start_time}'
+
+                # Parse the date and time string into a datetime object
+                # Create the datetime object from the ISO format string
+                start_time_obj = datetime.fromisoformat(iso_format_str)
+                end_time = start_time_obj + timedelta(hours=48)
+
+                venue = "sociogigante.com/ingressos"
+                event = create_event(event_summary, start_time_obj, end_time, venue)
+                # service_acc_key_path = os.path.join(CONFIG_DIR, 'service_account_key.json')
+                # service = authenticate_google(service_acc_key_path)
+                service = authenticate_google_oauth()
+                calendar_id = "98e4f5e3788173b71456bc62c7e3ba201f03e2f330585e2be059a289ba078997@group.calendar.google.com"
+                add_or_update_event(calendar_id, service, event)
+
+            notify_subscribers(message, post_title, post_link)
+            logging.info(f'Alert dispatched for post: {post_link}')
 
-    else:
-        logging.info("No matching post found.")
+        else:
+            logging.info("No matching post found.")
+    finally:
+        export_metrics('update_tickets', DATA_DIR)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,11 @@
+import atexit
+import copy
+import glob
 import json
 import os
 import logging
+import logging.handlers
+import queue
 from datetime import datetime, timedelta
 import requests
 from google.oauth2.service_account import Credentials
@@ -14,37 +19,155 @@ This module contains utility functions used by the mymatches package.
 Functions:
 
 setup_logging: Setup logging configuration.
+flush_logging: Blocks until every queued log record has been written.
+stop_logging: Flushes and stops the background log listener.
+log_contains: Checks whether a text appears in a log file or in its rotated backups.
 reset_calendar: Deletes all events from the Google Calendar.
 
 
 """
 
 
-def setup_logging(log_path):
+# Log line format
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Rotation defaults, overridable through the environment
+LOG_MAX_BYTES = int(os.environ.get('MYMATCHES_LOG_MAX_BYTES', 5 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get('MYMATCHES_LOG_BACKUP_COUNT', 5))
+LOG_ROTATE_WHEN = os.environ.get('MYMATCHES_LOG_ROTATE_WHEN') or None
+LOG_JSON = os.environ.get('MYMATCHES_LOG_FORMAT', '').lower() == 'json'
+
+# Active logging pipeline, replaced on every setup_logging call
+_log_queue = None
+_log_queue_handler = None
+_log_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+  """Formats each record as one JSON object per line."""
+
+  def format(self, record):
+    entry = {
+      'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+      'level': record.levelname,
+      'logger': record.name,
+      'message': record.getMessage(),
+    }
+    if record.exc_info:
+      entry['exception'] = self.formatException(record.exc_info)
+    return json.dumps(entry, ensure_ascii=False)
+
+
+class _RecordQueueHandler(logging.handlers.QueueHandler):
+  """Queues records with their message merged but their exception info kept, so the listener's formatter
+  decides how tracebacks are rendered."""
+
+  def prepare(self, record):
+    record = copy.copy(record)
+    record.msg = record.getMessage()
+    record.args = None
+    return record
+
+
+def setup_logging(log_path, max_bytes=None, backup_count=None, when=None, json_format=None, level=logging.INFO):
   """Setup logging configuration.
 
+    Records are put on an in-memory queue by the calling thread and written to the log file and to the console
+    by a background listener, so logging never blocks on disk I/O. The log file is rotated by size, or by time
+    when `when` is given. Calling this function again, e.g. when several entry points run in one process,
+    flushes and replaces the previous configuration.
+
     Args:
         log_path (str): The path to the log file.
+        max_bytes (int): Rotate the file when it reaches this size. Defaults to LOG_MAX_BYTES.
+        backup_count (int): The number of rotated files to keep. Defaults to LOG_BACKUP_COUNT.
+        when (str): Rotate by time instead of size, e.g. 'midnight' or 'H'. Defaults to LOG_ROTATE_WHEN.
+        json_format (bool): Write one JSON object per line instead of plain text. Defaults to LOG_JSON.
+        level (int): The root logger level.
 
   """
+  global _log_queue, _log_queue_handler, _log_listener
 
   if not os.path.exists(os.path.dirname(log_path)):
     os.makedirs(os.path.dirname(log_path), exist_ok=True)
 
-  logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-      logging.FileHandler(log_path),
-      logging.StreamHandler()
-    ]
-  )
+  stop_logging()
+
+  max_bytes = LOG_MAX_BYTES if max_bytes is None else max_bytes
+  backup_count = LOG_BACKUP_COUNT if backup_count is None else backup_count
+  when = LOG_ROTATE_WHEN if when is None else when
+  json_format = LOG_JSON if json_format is None else json_format
+
+  if when:
+    file_handler = logging.handlers.TimedRotatingFileHandler(log_path, when=when, backupCount=backup_count,
+                                                             encoding='utf-8')
+  else:
+    file_handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count,
+                                                        encoding='utf-8')
+  formatter = JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT)
+  file_handler.setFormatter(formatter)
+  stream_handler = logging.StreamHandler()
+  stream_handler.setFormatter(formatter)
+
+  _log_queue = queue.Queue(-1)
+  _log_queue_handler = _RecordQueueHandler(_log_queue)
+  _log_listener = logging.handlers.QueueListener(_log_queue, file_handler, stream_handler)
+  _log_listener.start()
+
+  root_logger = logging.getLogger()
+  root_logger.setLevel(level)
+  root_logger.addHandler(_log_queue_handler)
 
   # Suppress specific log messages
   logging.getLogger('oauth2client').setLevel(logging.ERROR)
   logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
 
 
+def flush_logging():
+  """Blocks until every queued log record has been written."""
+
+  if _log_queue is not None:
+    _log_queue.join()
+
+
+@atexit.register
+def stop_logging():
+  """Flushes the queued log records, stops the background listener and closes the log file."""
+
+  global _log_queue, _log_queue_handler, _log_listener
+
+  if _log_listener is None:
+    return
+
+  logging.getLogger().removeHandler(_log_queue_handler)
+  _log_listener.stop()
+  for handler in _log_listener.handlers:
+    handler.close()
+  _log_queue = _log_queue_handler = _log_listener = None
+
+
+def log_contains(log_path, text):
+  """
+  Checks whether a text appears in a log file or in any of its rotated backups.
+
+  Args:
+	  log_path (str): The path to the log file.
+	  text (str): The text to look for.
+
+  Returns:
+	  bool: True if any line of the log history contains the text.
+  """
+
+  flush_logging()
+  for path in sorted(glob.glob(glob.escape(log_path) + '*')):
+    if path != log_path and not path.startswith(log_path + '.'):
+      continue
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+      if any(text in line for line in f):
+        return True
+  return False
+
+
 def reset_calendar(service, calendar_id):
   """
   Deletes all events from the Google Calendar.
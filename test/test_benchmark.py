@@ -0,0 +1,92 @@
+import unittest
+
+from mymatches.benchmark import percentile, run_scenario
+from mymatches.fakes import FakeApiFootball, FakeApiFootballServer, FakeCalendarService, FakeHttpError
+from mymatches.fetch_and_store_matches import fetch_matches
+from mymatches.utils import reset_calendar
+
+
+class TestFakes(unittest.TestCase):
+    """
+    Test the local API-Football and Calendar stand-ins.
+    """
+
+    def test_schedule_is_shared_between_teams(self):
+        api = FakeApiFootball(6, fixtures_per_team=5)
+
+        self.assertEqual(len(api.fixtures), 15)
+        self.assertTrue(all(len(fixtures) == 5 for fixtures in api.team_fixtures.values()))
+        for fixture_id, fixture in api.fixtures.items():
+            home = str(fixture['teams']['home']['id'])
+            away = str(fixture['teams']['away']['id'])
+            self.assertIn(fixture_id, api.team_fixtures[home])
+            self.assertIn(fixture_id, api.team_fixtures[away])
+
+    def test_api_football_server(self):
+        api = FakeApiFootball(4, fixtures_per_team=3)
+        with FakeApiFootballServer(api) as server:
+            matches = fetch_matches('1', 'key', base_url=server.url)
+            ids = '-'.join(str(fixture_id) for fixture_id in api.team_fixtures['2'][:2])
+            by_ids = api.query({'ids': ids})
+
+            self.assertEqual(server.request_count, 1)
+        self.assertEqual(matches['results'], 3)
+        self.assertEqual(by_ids['results'], 2)
+
+    def test_api_football_error_injection(self):
+        with FakeApiFootballServer(FakeApiFootball(2), error_rate=1.0) as server:
+            with self.assertRaises(Exception):
+                fetch_matches('1', 'key', base_url=server.url)
+
+    def test_calendar_service(self):
+        service = FakeCalendarService()
+        created = service.events().insert(calendarId='c', body={'summary': 'A vs B'}).execute()
+        service.events().update(calendarId='c', eventId=created['id'], body={'summary': 'A vs C'}).execute()
+        service.events().patch(calendarId='c', eventId=created['id'], body={'location': 'Maracanã'}).execute()
+
+        event = service.events().get(calendarId='c', eventId=created['id']).execute()
+        self.assertEqual((event['summary'], event['location']), ('A vs C', 'Maracanã'))
+        with self.assertRaises(FakeHttpError):
+            service.events().update(calendarId='c', eventId='missing', body={}).execute()
+
+        responses = []
+        batch = service.new_batch_http_request(callback=lambda rid, response, error: responses.append(response))
+        for i in range(5):
+            batch.add(service.events().insert(calendarId='c', body={'summary': str(i)}))
+        batch.execute()
+        self.assertEqual(len(responses), 5)
+        self.assertEqual(service.calls['batch'], 1)
+
+        reset_calendar(service, 'c')
+        self.assertEqual(service.events().list(calendarId='c').execute()['items'], [])
+
+    def test_calendar_error_injection(self):
+        service = FakeCalendarService(error_rate=1.0)
+        with self.assertRaises(FakeHttpError):
+            service.events().list(calendarId='c').execute()
+        self.assertEqual(service.errors, 1)
+
+
+class TestBenchmark(unittest.TestCase):
+    """
+    Test the benchmark scenarios.
+    """
+
+    def test_percentile(self):
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_run_scenario(self):
+        report = run_scenario(10, fixtures_per_team=4)
+
+        self.assertEqual(report['fixtures'], 20)
+        self.assertEqual(report['events'], 40)
+        self.assertEqual(report['api_calls']['api_football'], 10)
+        self.assertEqual(report['api_calls']['calendar'], 40)
+        self.assertEqual(report['fetch']['operations'], 10)
+        self.assertGreater(report['calendar']['throughput_per_second'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
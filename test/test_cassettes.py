@@ -0,0 +1,124 @@
+import importlib
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from mymatches.cassettes import CassetteMiss, compare_to_baseline, run_with_cassette, use_cassette
+from mymatches.fakes import FakeApiFootball, FakeApiFootballServer, FakeCalendarService
+from mymatches.fetch_and_store_matches import fetch_matches
+from mymatches.utils import stop_logging
+
+# The package re-exports a function named update_calendars, so fetch the module itself
+update_calendars = importlib.import_module('mymatches.update_calendars')
+subscriptions = importlib.import_module('mymatches.subscriptions')
+
+
+class TestCassettes(unittest.TestCase):
+    """
+    Test recording and replaying API-Football and Calendar exchanges.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cassette_path = os.path.join(self.tmp.name, 'run.jsonl.gz')
+
+    def workload(self, base_url):
+        results = [fetch_matches(team_id, 'secret-key', base_url=base_url)['results'] for team_id in ('1', '2')]
+        service = update_calendars.authenticate_google('unused.json')
+        created = service.events().insert(calendarId='c', body={'summary': 'A vs B'}).execute()
+        service.events().update(calendarId='c', eventId=created['id'], body={'summary': 'A vs C'}).execute()
+        return results, created['id']
+
+    def test_record_then_replay(self):
+        api = FakeApiFootball(4, fixtures_per_team=3)
+        with FakeApiFootballServer(api) as server:
+            base_url = server.url
+            with patch.object(update_calendars, 'authenticate_google', return_value=FakeCalendarService()):
+                with use_cassette(self.cassette_path, mode='record') as cassette:
+                    recorded = self.workload(base_url)
+        self.assertEqual(sum(cassette.counts.values()), 4)
+        with open(self.cassette_path, 'rb') as f:
+            self.assertNotIn(b'secret-key', f.read())
+
+        # The server is gone and no real service is created: everything comes from the cassette
+        with use_cassette(self.cassette_path, mode='replay', time_scale=0) as cassette:
+            replayed = self.workload(base_url)
+            with self.assertRaises(CassetteMiss):
+                requests.get(f"{base_url}/fixtures", params={'team': '3'})
+
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(cassette.counts['calendar/events.insert'], 1)
+
+    def test_batches_are_recorded_as_one_request(self):
+        service = FakeCalendarService()
+        responses = []
+
+        def workload():
+            batch = update_calendars.authenticate_google('unused.json').new_batch_http_request(
+                callback=lambda request_id, response, exception: responses.append(response['summary']))
+            events = update_calendars.authenticate_google('unused.json').events()
+            for summary in ('A vs B', 'C vs D', 'E vs F'):
+                batch.add(events.insert(calendarId='c', body={'summary': summary}))
+            batch.execute()
+
+        with patch.object(update_calendars, 'authenticate_google', return_value=service):
+            with use_cassette(self.cassette_path, mode='record') as cassette:
+                workload()
+        self.assertEqual(service.calls['batch'], 1)
+        self.assertEqual(cassette.counts['calendar/events.insert'], 3)
+
+        with use_cassette(self.cassette_path, mode='replay', time_scale=0):
+            workload()
+        self.assertEqual(responses, ['A vs B', 'C vs D', 'E vs F'] * 2)
+
+    def test_other_entry_points_are_replayed(self):
+        api = FakeApiFootball(4, fixtures_per_team=2)
+        self.addCleanup(stop_logging)
+
+        def sync(data_dir, base_url):
+            os.makedirs(data_dir)
+            with open(os.path.join(data_dir, 'config.json'), 'w', encoding='utf-8') as f:
+                json.dump({'API_KEY': 'key', 'API_URL': base_url, 'SUBSCRIPTIONS': {'c': {'teams': ['1']}}}, f)
+            with patch.object(subscriptions, 'CONFIG_DIR', data_dir), patch.object(subscriptions, 'DATA_DIR', data_dir):
+                subscriptions.sync_subscriptions()
+
+        with FakeApiFootballServer(api) as server:
+            base_url = server.url
+            with patch.object(subscriptions, 'authenticate_google', return_value=FakeCalendarService()):
+                with use_cassette(self.cassette_path, mode='record') as recorded:
+                    sync(os.path.join(self.tmp.name, 'record'), base_url)
+
+        # subscriptions imported the real authenticate_google, which must not load any credentials in replay
+        with use_cassette(self.cassette_path, mode='replay', time_scale=0) as replayed:
+            sync(os.path.join(self.tmp.name, 'replay'), base_url)
+
+        self.assertEqual(recorded.counts['calendar/events.insert'], 2)
+        self.assertEqual(replayed.counts, recorded.counts)
+
+    def test_baseline_comparison(self):
+        api = FakeApiFootball(2, fixtures_per_team=1)
+        baseline_path = os.path.join(self.tmp.name, 'baseline.json')
+        with FakeApiFootballServer(api) as server:
+            def workload():
+                fetch_matches('1', 'key', base_url=server.url)
+
+            run_with_cassette(workload, self.cassette_path, mode='record', baseline_path=baseline_path)
+            self.assertTrue(os.path.exists(baseline_path))
+
+        report = run_with_cassette(workload, self.cassette_path, mode='replay', time_scale=0,
+                                   baseline_path=baseline_path, tolerance=10)
+        self.assertEqual(report['regressions'], [])
+        self.assertEqual(report['unplayed'], 0)
+
+        regressions = compare_to_baseline({'wall_seconds': 3.0, 'requests': {'GET /fixtures': 2}},
+                                          {'wall_seconds': 1.0, 'requests': {'GET /fixtures': 1}})
+        self.assertEqual(len(regressions), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
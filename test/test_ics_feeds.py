@@ -0,0 +1,126 @@
+import gzip
+import os
+import tempfile
+import threading
+import unittest
+
+import requests
+
+from mymatches.fakes import FakeApiFootball
+from mymatches.fetch_and_store_matches import store_matches
+from mymatches.ics_feeds import _fold, make_feed_server, publish_team_feed
+
+
+class TestPublishTeamFeed(unittest.TestCase):
+    """
+    Test the incremental rendering of the ICS feeds.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.api = FakeApiFootball(4, fixtures_per_team=3)
+        self.feed_file = os.path.join(self.tmp.name, 'ics', 'team1.ics')
+
+    def store(self):
+        store_matches(self.api.query({'team': '1', 'next': '99'}),
+                      os.path.join(self.tmp.name, 'matches', 'matches1.json'))
+
+    def test_only_changed_vevents_are_rendered(self):
+        self.store()
+        self.assertEqual(publish_team_feed('1', self.tmp.name),
+                         {'rendered': 3, 'reused': 0, 'removed': 0, 'written': True})
+        with open(self.feed_file, 'rb') as f:
+            content = f.read().decode('utf-8')
+        self.assertTrue(content.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(content.count('BEGIN:VEVENT'), 3)
+        self.assertIn('X-WR-CALNAME:Team 1', content)
+
+        self.store()
+        self.assertEqual(publish_team_feed('1', self.tmp.name),
+                         {'rendered': 0, 'reused': 3, 'removed': 0, 'written': False})
+
+        fixture_id = self.api.team_fixtures['1'][0]
+        self.api.fixtures[fixture_id]['fixture']['venue']['name'] = 'Maracanã, Rio'
+        self.store()
+        self.assertEqual(publish_team_feed('1', self.tmp.name),
+                         {'rendered': 1, 'reused': 2, 'removed': 0, 'written': True})
+        with open(self.feed_file, 'rb') as f:
+            self.assertIn('LOCATION:Maracanã\\, Rio', f.read().decode('utf-8'))
+
+    def test_fold(self):
+        line = 'SUMMARY:' + 'ã' * 60
+        folded = _fold(line)
+
+        self.assertTrue(all(len(part.encode('utf-8')) <= 75 for part in folded.split('\r\n')))
+        self.assertEqual(folded.replace('\r\n ', ''), line)
+
+
+class TestFeedServer(unittest.TestCase):
+    """
+    Test the HTTP server of the feeds.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        with open(os.path.join(self.tmp.name, 'team1.ics'), 'wb') as f:
+            f.write(b'BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n' * 50)
+
+        self.server = make_feed_server(self.tmp.name, port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def test_etag_and_gzip(self):
+        plain = requests.get(f"{self.url}/team1.ics", headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(plain.status_code, 200)
+        self.assertEqual(plain.headers['Content-Type'], 'text/calendar; charset=utf-8')
+
+        cached = requests.get(f"{self.url}/team1.ics", headers={'Accept-Encoding': 'identity',
+                                                                  'If-None-Match': plain.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+
+        compressed = requests.get(f"{self.url}/team1.ics", headers={'Accept-Encoding': 'gzip'}, stream=True)
+        raw = compressed.raw.read()
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertLess(len(raw), len(plain.content))
+        self.assertEqual(gzip.decompress(raw), plain.content)
+        self.assertNotEqual(compressed.headers['ETag'], plain.headers['ETag'])
+
+    def test_negotiation_headers(self):
+        plain = requests.get(f"{self.url}/team1.ics", headers={'Accept-Encoding': 'identity'})
+        refused = requests.get(f"{self.url}/team1.ics", headers={'Accept-Encoding': 'gzip;q=0, identity'})
+        self.assertNotIn('Content-Encoding', refused.headers)
+        self.assertEqual(refused.headers['ETag'], plain.headers['ETag'])
+        wildcard = requests.get(f"{self.url}/team1.ics", headers={'Accept-Encoding': 'identity, *;q=0.5'},
+                                stream=True)
+        self.assertEqual(wildcard.headers['Content-Encoding'], 'gzip')
+
+        for if_none_match in (f'"other", {plain.headers["ETag"]}', f'W/{plain.headers["ETag"]}', '*'):
+            cached = requests.get(f"{self.url}/team1.ics", headers={'Accept-Encoding': 'identity',
+                                                                      'If-None-Match': if_none_match})
+            self.assertEqual(cached.status_code, 304, if_none_match)
+        stale = requests.get(f"{self.url}/team1.ics", headers={'Accept-Encoding': 'identity',
+                                                                 'If-None-Match': '"other", W/"older"'})
+        self.assertEqual(stale.status_code, 200)
+
+    def test_changed_feed_gets_new_etag(self):
+        first = requests.get(f"{self.url}/team1.ics")
+        with open(os.path.join(self.tmp.name, 'team1.ics'), 'ab') as f:
+            f.write(b'\r\n')
+        second = requests.get(f"{self.url}/team1.ics", headers={'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second.headers['ETag'], first.headers['ETag'])
+
+    def test_unknown_paths(self):
+        self.assertEqual(requests.get(f"{self.url}/missing.ics").status_code, 404)
+        self.assertEqual(requests.get(f"{self.url}/../secret.ics").status_code, 404)
+        self.assertEqual(requests.get(f"{self.url}/team1.txt").status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
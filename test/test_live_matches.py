@@ -0,0 +1,111 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from mymatches.fakes import FakeApiFootball, FakeApiFootballServer, FakeCalendarService
+from mymatches.fetch_and_store_matches import fetch_matches, store_matches
+from mymatches.live_matches import MAX_IDS_PER_REQUEST, find_tracked_fixtures, poll_live_fixtures
+from mymatches.subscriptions import SubscriptionIndex, load_subscriptions, sync_calendars
+from mymatches.update_calendars import add_matches_to_calendar
+
+
+class TestLiveMatches(unittest.TestCase):
+    """
+    Test the live-match polling mode against the local stand-ins.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        kickoff = datetime.now(timezone.utc) + timedelta(minutes=10)
+        self.api = FakeApiFootball(6, fixtures_per_team=3, start=kickoff)
+        self.server = FakeApiFootballServer(self.api).start()
+        self.addCleanup(self.server.stop)
+
+        self.service = FakeCalendarService()
+        self.config = {'API_KEY': 'key', 'API_URL': self.server.url,
+                       'CALENDARS': {'1': 'calendar1', '2': 'calendar2'}}
+        for team_id, calendar_id in self.config['CALENDARS'].items():
+            store_matches(fetch_matches(team_id, 'key', base_url=self.server.url),
+                          os.path.join(self.tmp.name, 'matches', f'matches{team_id}.json'))
+            add_matches_to_calendar(team_id, calendar_id, self.service, self.tmp.name)
+        self.service.calls.clear()
+
+    def summaries(self, calendar_id):
+        return sorted(event['summary'] for event in self.service.calendars[calendar_id].values())
+
+    def test_only_fixtures_near_kickoff_are_tracked(self):
+        tracked = find_tracked_fixtures(['1', '2'], self.tmp.name, {})
+        first_round = {str(fixture_id) for fixture_id in self.api.team_fixtures['1'][:1] +
+                       self.api.team_fixtures['2'][:1]}
+
+        self.assertEqual(set(tracked), first_round)
+        far_future = time.time() + 30 * 24 * 3600
+        self.assertEqual(find_tracked_fixtures(['1', '2'], self.tmp.name, {}, now=far_future), {})
+
+    def test_score_changes_are_pushed_once(self):
+        state = {}
+        stats = poll_live_fixtures(self.config, self.service, self.tmp.name, state)
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(self.server.request_count, 3)
+        self.assertEqual(stats['updated'], 0)
+
+        fixture_id = self.api.team_fixtures['1'][0]
+        self.api.set_status(fixture_id, '1H', elapsed=12, home_goals=1, away_goals=0)
+        stats = poll_live_fixtures(self.config, self.service, self.tmp.name, state)
+        self.assertEqual(stats['updated'], 1)
+        match = self.api.fixtures[fixture_id]
+        home, away = match['teams']['home']['name'], match['teams']['away']['name']
+        self.assertIn(f"{home} 1 x 0 {away}, League 100 (1H)", self.summaries('calendar1'))
+
+        # Elapsed minutes alone do not cost a calendar write
+        self.api.set_status(fixture_id, '1H', elapsed=30, home_goals=1, away_goals=0)
+        self.assertEqual(poll_live_fixtures(self.config, self.service, self.tmp.name, state)['updated'], 0)
+
+        self.api.set_status(fixture_id, 'FT', elapsed=90, home_goals=2, away_goals=0)
+        poll_live_fixtures(self.config, self.service, self.tmp.name, state)
+        self.assertIn(f"{home} 2 x 0 {away}, League 100 (FT)", self.summaries('calendar1'))
+        self.assertNotIn(str(fixture_id), find_tracked_fixtures(['1', '2'], self.tmp.name, state))
+        self.assertEqual(set(self.service.calls), {'patch'})
+
+    def test_subscribed_calendars_are_updated(self):
+        config = dict(self.config, SUBSCRIPTIONS={'league_calendar': {'leagues': ['100']}})
+        store_matches(self.api.query({'league': '100', 'next': '99'}),
+                      os.path.join(self.tmp.name, 'matches', 'matches_league100.json'))
+        index = SubscriptionIndex()
+        index.add_fixtures(self.api.fixtures.values())
+        index.set_subscriptions(load_subscriptions(config))
+        matches = {str(fixture_id): match for fixture_id, match in self.api.fixtures.items()}
+        sync_calendars(index, matches, self.service, self.tmp.name, config['CALENDARS'])
+        self.service.calls.clear()
+
+        fixture_id = self.api.team_fixtures['1'][0]
+        self.api.set_status(fixture_id, '1H', elapsed=12, home_goals=1, away_goals=0)
+        stats = poll_live_fixtures(config, self.service, self.tmp.name, {})
+
+        # calendar1 holds one copy of the fixture, shared by both entry points
+        self.assertEqual(stats['updated'], 2)
+        self.assertEqual(self.service.calls['patch'], 2)
+        match = self.api.fixtures[fixture_id]
+        summary = f"{match['teams']['home']['name']} 1 x 0 {match['teams']['away']['name']}, League 100 (1H)"
+        self.assertIn(summary, self.summaries('league_calendar'))
+        self.assertIn(summary, self.summaries('calendar1'))
+
+    def test_requests_are_batched_by_id(self):
+        api = FakeApiFootball(60, fixtures_per_team=1, start=datetime.now(timezone.utc))
+        with FakeApiFootballServer(api) as server:
+            config = {'API_KEY': 'key', 'API_URL': server.url, 'CALENDARS': {}}
+            for team_id in api.team_fixtures:
+                config['CALENDARS'][team_id] = f'calendar{team_id}'
+                store_matches(api.query({'team': team_id}),
+                              os.path.join(self.tmp.name, 'matches', f'matches{team_id}.json'))
+
+            stats = poll_live_fixtures(config, self.service, self.tmp.name, {})
+            self.assertEqual(stats['tracked'], 30)
+            self.assertEqual(server.request_count, -(-30 // MAX_IDS_PER_REQUEST))
+
+
+if __name__ == '__main__':
+    unittest.main()
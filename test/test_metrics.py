@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from mymatches.metrics import METRICS, Histogram, export_metrics, record_api_call, timed
+from mymatches.fetch_and_store_matches import fetch_matches, store_matches
+from mymatches.update_calendars import add_or_update_event
+
+
+class TestHistogram(unittest.TestCase):
+    """
+    Test the latency histogram.
+    """
+
+    def test_quantiles(self):
+        histogram = Histogram(buckets=(0.1, 1.0, 10.0))
+        for value in [0.05] * 90 + [0.5] * 8 + [5.0] * 2:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.counts, [90, 8, 2, 0])
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.95), 1.0)
+        self.assertEqual(histogram.quantile(1.0), 5.0)
+
+
+class TestInstrumentation(unittest.TestCase):
+    """
+    Test that the pipeline stages feed the metrics registry and that both exports are written.
+    """
+
+    def setUp(self):
+        METRICS.reset()
+
+    def test_timed_and_counters(self):
+        @timed('stage')
+        def stage():
+            return 42
+
+        self.assertEqual(stage(), 42)
+        self.assertEqual(stage.__name__, 'stage')
+        record_api_call('endpoint', bytes_received=10)
+        record_api_call('endpoint', error=True)
+
+        summary = METRICS.summary('test')
+        self.assertEqual(summary['stages']['stage']['count'], 1)
+        self.assertEqual(summary['api_calls']['endpoint'],
+                         {'calls': 2, 'errors': 1, 'bytes_received': 10, 'bytes_sent': 0})
+
+    @patch('mymatches.fetch_and_store_matches.requests.get')
+    def test_pipeline_metrics(self, mock_get):
+        mock_get.return_value = MagicMock(status_code=200, content=b'{"response": []}',
+                                          json=lambda: {'response': []})
+        service = MagicMock()
+        service.events.return_value.insert.return_value.execute.return_value = {'id': 'abc'}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            matches = fetch_matches('1', 'key')
+            store_matches(matches, os.path.join(tmp, 'matches', 'matches1.json'))
+            event = {'summary': 'A vs B', 'start': {}, 'end': {}, 'location': 'TBD'}
+            add_or_update_event('1', 'calendar', '99', event, service, tmp)
+            add_or_update_event('1', 'calendar', '99', event, service, tmp)
+
+            summary = export_metrics('test_run', tmp)
+            with open(os.path.join(tmp, 'metrics', 'test_run.json'), 'r', encoding='utf-8') as f:
+                self.assertEqual(json.load(f)['run'], 'test_run')
+            with open(os.path.join(tmp, 'metrics', 'test_run.prom'), 'r', encoding='utf-8') as f:
+                prometheus = f.read()
+
+        self.assertEqual(summary['api_calls']['api-football/fixtures']['calls'], 1)
+        self.assertEqual(summary['api_calls']['api-football/fixtures']['bytes_received'], 16)
+        self.assertEqual(summary['api_calls']['calendar/events.insert']['calls'], 1)
+        self.assertEqual(summary['api_calls']['calendar/events.update']['calls'], 1)
+        self.assertEqual(summary['stages']['add_or_update_event']['count'], 2)
+        self.assertEqual(summary['stages']['calendar_api']['count'], 2)
+        self.assertGreaterEqual(summary['stages']['add_or_update_event']['total_seconds'],
+                                summary['stages']['calendar_api']['total_seconds'])
+        self.assertGreater(summary['bytes_written']['matches'], 0)
+        self.assertGreater(summary['bytes_written']['events'], 0)
+        self.assertIn('mymatches_stage_duration_seconds_count{run="test_run",stage="fetch_matches"} 1', prometheus)
+        self.assertIn('mymatches_api_calls_total{run="test_run",endpoint="calendar/events.insert"} 1', prometheus)
+
+    def test_local_failure_is_not_an_api_error(self):
+        service = MagicMock()
+        service.events.return_value.insert.return_value.execute.return_value = {'id': 'abc'}
+        event = {'summary': 'A vs B', 'start': {}, 'end': {}, 'location': 'TBD'}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch('mymatches.update_calendars.save_events', side_effect=OSError("disk full")):
+                add_or_update_event('1', 'calendar', '99', event, service, tmp)
+
+        insert_calls = METRICS.summary('test')['api_calls']['calendar/events.insert']
+        self.assertEqual((insert_calls['calls'], insert_calls['errors']), (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
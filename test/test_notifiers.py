@@ -0,0 +1,284 @@
+import importlib
+import io
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from mymatches.notifiers import (Notifier, NotificationDispatcher, SmtpNotifier, StdoutNotifier, WebhookNotifier,
+                                 build_notifiers, load_phone_numbers)
+from mymatches.utils import stop_logging
+
+
+class RecordingNotifier(Notifier):
+    """
+    Notifier that records the batches it receives and the peak number of concurrent sends.
+    """
+
+    name = 'recording'
+
+    def __init__(self, recipients, delay=0.0, fail=False, **kwargs):
+        super().__init__(recipients, **kwargs)
+        self.delay = delay
+        self.fail = fail
+        self.batches = []
+        self.start_times = []
+        self.in_flight = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def send(self, recipients, message, subject=None, link=None):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            self.start_times.append(time.monotonic())
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+            self.batches.append(list(recipients))
+        if self.fail:
+            raise Exception("channel down")
+
+
+class SmtpStubHandler(socketserver.StreamRequestHandler):
+    """
+    Minimal SMTP server that accepts every message and stores the envelope recipients.
+    """
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        recipients = []
+        self.reply("220 localhost stub")
+        while True:
+            line = self.rfile.readline().decode('utf-8').rstrip('\r\n')
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in ('HELO', 'EHLO'):
+                self.reply("250 localhost")
+            elif command == 'MAIL':
+                recipients = []
+                self.reply("250 OK")
+            elif command == 'RCPT':
+                recipients.append(line.split(':', 1)[1].strip().strip('<>'))
+                self.reply("250 OK")
+            elif command == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                body = []
+                while True:
+                    data_line = self.rfile.readline().decode('utf-8')
+                    if data_line in ('.\r\n', '.\n', ''):
+                        break
+                    body.append(data_line)
+                self.server.messages.append((list(recipients), ''.join(body)))
+                self.reply("250 OK")
+            elif command == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class WebhookStubHandler(BaseHTTPRequestHandler):
+    """
+    HTTP stub that stores every JSON body it receives.
+    """
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        self.server.payloads.append(json.loads(self.rfile.read(length)))
+        self.send_response(self.server.status)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestNotificationDispatcher(unittest.TestCase):
+    """
+    Test the fan-out rules of the NotificationDispatcher.
+    """
+
+    def test_dedupe_and_batching(self):
+        notifier = RecordingNotifier(['a', 'b', ' a', 'c', 'd', 'b', 'e'], batch_size=2, max_concurrency=2)
+        report = NotificationDispatcher([notifier]).dispatch("hello")
+
+        self.assertEqual(report['recording'], {'sent': 5, 'failed': 0, 'skipped': 2})
+        self.assertEqual(sorted(r for batch in notifier.batches for r in batch), ['a', 'b', 'c', 'd', 'e'])
+        self.assertTrue(all(len(batch) <= 2 for batch in notifier.batches))
+
+    def test_same_message_is_not_sent_twice(self):
+        notifier = RecordingNotifier(['a', 'b'])
+        dispatcher = NotificationDispatcher([notifier])
+        dispatcher.dispatch("hello")
+        report = dispatcher.dispatch("hello")
+
+        self.assertEqual(report['recording'], {'sent': 0, 'failed': 0, 'skipped': 2})
+        report = dispatcher.dispatch("another alert")
+        self.assertEqual(report['recording']['sent'], 2)
+
+    def test_deliveries_are_remembered_across_dispatchers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            delivered_path = os.path.join(tmp, 'notifications', 'delivered.jsonl')
+            NotificationDispatcher([RecordingNotifier(['a', 'b'])], delivered_path).dispatch("hello")
+
+            notifier = RecordingNotifier(['a', 'b', 'c'])
+            report = NotificationDispatcher([notifier], delivered_path).dispatch("hello")
+
+        self.assertEqual(report['recording'], {'sent': 1, 'failed': 0, 'skipped': 2})
+        self.assertEqual(notifier.batches, [['c']])
+
+    def test_concurrency_limit(self):
+        notifier = RecordingNotifier([str(i) for i in range(12)], delay=0.05, max_concurrency=3)
+        NotificationDispatcher([notifier]).dispatch("hello")
+
+        self.assertEqual(notifier.peak, 3)
+
+    def test_rate_limit(self):
+        notifier = RecordingNotifier([str(i) for i in range(5)], max_concurrency=5, rate_limit=20)
+        NotificationDispatcher([notifier]).dispatch("hello")
+
+        starts = sorted(notifier.start_times)
+        self.assertGreaterEqual(starts[-1] - starts[0], 4 / 20 * 0.9)
+
+    def test_failed_batches_are_reported_and_retried(self):
+        notifier = RecordingNotifier(['a', 'b'], fail=True)
+        dispatcher = NotificationDispatcher([notifier])
+        self.assertEqual(dispatcher.dispatch("hello")['recording'], {'sent': 0, 'failed': 2, 'skipped': 0})
+
+        notifier.fail = False
+        self.assertEqual(dispatcher.dispatch("hello")['recording']['sent'], 2)
+
+
+class TestChannels(unittest.TestCase):
+    """
+    Test the notification channels against local stand-ins.
+    """
+
+    def test_stdout_notifier(self):
+        stream = io.StringIO()
+        NotificationDispatcher([StdoutNotifier(stream=stream)]).dispatch("hello", subject="Tickets")
+
+        self.assertEqual(stream.getvalue(), "Tickets\nhello\n")
+
+    def test_smtp_notifier(self):
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SmtpStubHandler)
+        server.messages = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            recipients = [f"fan{i}@example.com" for i in range(5)] + ["FAN0@example.com"]
+            notifier = SmtpNotifier(recipients, host='127.0.0.1', port=server.server_address[1], batch_size=2)
+            report = NotificationDispatcher([notifier]).dispatch("hello", subject="Tickets")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(report['smtp'], {'sent': 5, 'failed': 0, 'skipped': 1})
+        self.assertEqual(len(server.messages), 3)
+        delivered = sorted(r for recipients, _ in server.messages for r in recipients)
+        self.assertEqual(delivered, [f"fan{i}@example.com" for i in range(5)])
+        self.assertIn("Subject: Tickets", server.messages[0][1])
+
+    def test_webhook_notifier(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookStubHandler)
+        server.payloads = []
+        server.status = 204
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/hook"
+            notifier = WebhookNotifier([str(i) for i in range(250)], url=url, batch_size=100)
+            report = NotificationDispatcher([notifier]).dispatch("hello", subject="Tickets")
+
+            server.status = 500
+            failed = NotificationDispatcher([WebhookNotifier(['x'], url=url)]).dispatch("hello")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(report['webhook']['sent'], 250)
+        self.assertEqual(sorted(len(p['recipients']) for p in server.payloads[:3]), [50, 100, 100])
+        self.assertEqual(failed['webhook']['failed'], 1)
+
+
+class TestUpdateTicketsNotifications(unittest.TestCase):
+    """
+    Test that scheduled ticket runs do not alert the subscribers twice.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(stop_logging)
+        with open(os.path.join(self.tmp.name, 'config.json'), 'w', encoding='utf-8') as f:
+            json.dump({'NOTIFIERS': [{'type': 'stdout'}]}, f)
+
+        self.notifier = RecordingNotifier(['a', 'b'])
+        self.update_tickets = importlib.import_module('mymatches.update_tickets')
+        post = ("Venda de ingressos", "https://vasco.com.br/noticias/venda-de-ingressos/", "Venda de ingressos")
+        for name, value in [('CONFIG_DIR', self.tmp.name), ('DATA_DIR', self.tmp.name),
+                            ('check_for_ticket_post', lambda url, text: post),
+                            ('extract_ticket_selling_info', lambda content: None),
+                            ('build_notifiers', lambda specs, path: [self.notifier])]:
+            patcher = patch.object(self.update_tickets, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_update_tickets(self, log_name):
+        with patch.object(self.update_tickets, 'LOG_FILE', os.path.join(self.tmp.name, 'logs', log_name)):
+            self.update_tickets.run_update_tickets()
+
+    def sent_to(self):
+        return sorted(recipient for batch in self.notifier.batches for recipient in batch)
+
+    def test_second_run_sends_nothing(self):
+        self.run_update_tickets('update_tickets.log')
+        self.assertEqual(self.sent_to(), ['a', 'b'])
+
+        self.run_update_tickets('update_tickets.log')
+        self.assertEqual(self.sent_to(), ['a', 'b'])
+
+        # The delivery record still holds when the log history is gone
+        self.run_update_tickets('fresh.log')
+        self.assertEqual(self.sent_to(), ['a', 'b'])
+
+
+class TestBuildNotifiers(unittest.TestCase):
+    """
+    Test building the channels from the config file.
+    """
+
+    def test_build_notifiers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            phone_path = os.path.join(tmp, 'phone_numbers.txt')
+            with open(phone_path, 'w', encoding='utf-8') as f:
+                f.write("Phone numbers for sending whatsapp messages\n+55 21 99999-0000\n\n5521988887777\n")
+
+            self.assertEqual(load_phone_numbers(phone_path), ['+55 21 99999-0000', '5521988887777'])
+            notifiers = build_notifiers([{'type': 'stdout'}, {'type': 'whatsapp'}], phone_path)
+
+        self.assertEqual([n.name for n in notifiers], ['stdout', 'whatsapp'])
+        self.assertEqual(len(notifiers[1].recipients), 2)
+        with self.assertRaises(ValueError):
+            build_notifiers([{'type': 'pigeon'}])
+
+    def test_dispatch_settings(self):
+        stdout, whatsapp, webhook = build_notifiers([
+            {'type': 'stdout', 'max_concurrency': 2, 'batch_size': 10, 'color': 'green'},
+            {'type': 'whatsapp', 'recipients': ['5521988887777'], 'max_concurrency': 4, 'rate_limit': 0.5},
+            {'type': 'webhook', 'url': 'http://127.0.0.1/hook', 'recipients': ['x'], 'batch_size': 20},
+        ])
+
+        self.assertEqual((stdout.max_concurrency, stdout.batch_size), (2, 10))
+        self.assertEqual((whatsapp.max_concurrency, whatsapp.rate_limit), (1, 0.5))
+        self.assertEqual(webhook.batch_size, 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
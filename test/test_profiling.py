@@ -0,0 +1,86 @@
+import builtins
+import io
+import json
+import os
+import pstats
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+import requests
+
+from mymatches.fakes import FakeApiFootball, FakeApiFootballServer
+from mymatches.fetch_and_store_matches import fetch_matches, store_matches
+from mymatches.profiling import Profiler, profile_call
+
+
+def busy_loop(iterations):
+    return sum(i * i for i in range(iterations))
+
+
+class TestProfiler(unittest.TestCase):
+    """
+    Test the profiling mode of the script entry points.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def fetch_and_store(self, server):
+        for team_id in ('1', '2'):
+            matches = fetch_matches(team_id, 'key', base_url=server.url)
+            store_matches(matches, os.path.join(self.tmp.name, 'matches', f'matches{team_id}.json'))
+        busy_loop(300000)
+
+    def test_spans_and_flamegraph(self):
+        with FakeApiFootballServer(FakeApiFootball(4), latency=0.02) as server:
+            profiler = Profiler('fetch', os.path.join(self.tmp.name, 'profiles'), interval=0.001)
+            with profiler:
+                self.fetch_and_store(server)
+        self.assertEqual(requests.Session.request.__name__, 'request')
+        self.assertEqual(builtins.open.__name__, 'open')
+
+        http_spans = [span for span in profiler.recorder.spans if span['category'] == 'http']
+        file_spans = [span for span in profiler.recorder.spans if span['category'] == 'file']
+        self.assertEqual(len(http_spans), 2)
+        self.assertTrue(all(span['seconds'] >= 0.02 and span['details']['status'] == 200 for span in http_spans))
+        self.assertEqual(sorted(span['name'] for span in file_spans), ['matches1.json', 'matches2.json'])
+        self.assertGreater(file_spans[0]['details']['bytes_written'], 0)
+
+        files = sorted(os.listdir(os.path.join(self.tmp.name, 'profiles')))
+        self.assertEqual([name.rsplit('-', 1)[-1].split('.', 1)[-1] for name in files],
+                         ['folded', 'trace.json', 'txt'])
+        folded = os.path.join(self.tmp.name, 'profiles', files[0])
+        with open(folded, 'r', encoding='utf-8') as f:
+            self.assertTrue(any('busy_loop' in line for line in f))
+        with open(os.path.join(self.tmp.name, 'profiles', files[1]), 'r', encoding='utf-8') as f:
+            events = json.load(f)['traceEvents']
+        self.assertEqual(len(events), 4)
+
+    def test_cprofile_mode(self):
+        output_dir = os.path.join(self.tmp.name, 'profiles')
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            self.assertEqual(profile_call('loop', busy_loop, 1000, mode='cprofile', output_dir=output_dir, top=5),
+                             busy_loop(1000))
+        self.assertEqual(stdout.getvalue(), '')
+        files = os.listdir(output_dir)
+        stats = pstats.Stats(os.path.join(output_dir, next(name for name in files if name.endswith('.pstats'))))
+        self.assertTrue(any(function[2] == 'busy_loop' for function in stats.stats))
+        with open(os.path.join(output_dir, next(name for name in files if name.endswith('.txt'))),
+                  'r', encoding='utf-8') as f:
+            self.assertIn('busy_loop', f.read())
+
+    def test_summary_stream(self):
+        stream = io.StringIO()
+        profile_call('loop', busy_loop, 1000, mode='sampling', output_dir=self.tmp.name, summary_stream=stream)
+        self.assertTrue(stream.getvalue().startswith('Profile of loop (sampling)'))
+
+    def test_no_mode_calls_directly(self):
+        self.assertEqual(profile_call('loop', busy_loop, 10, output_dir=self.tmp.name), busy_loop(10))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
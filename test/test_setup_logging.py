@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from mymatches.utils import flush_logging, log_contains, setup_logging, stop_logging
+
+
+class TestSetupLogging(unittest.TestCase):
+    """
+    Test the queue-based logging setup.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(stop_logging)
+
+    def test_size_rotation(self):
+        log_path = os.path.join(self.tmp.name, 'logs', 'run.log')
+        setup_logging(log_path, max_bytes=2000, backup_count=2)
+        for i in range(200):
+            logging.info(f"message {i:03d} " + "x" * 40)
+        flush_logging()
+
+        self.assertTrue(os.path.exists(log_path + '.1'))
+        self.assertTrue(os.path.exists(log_path + '.2'))
+        self.assertFalse(os.path.exists(log_path + '.3'))
+        self.assertLessEqual(os.path.getsize(log_path), 2000)
+        self.assertTrue(log_contains(log_path, "message 199"))
+        self.assertFalse(log_contains(log_path, "message 000"))
+
+    def test_json_format(self):
+        log_path = os.path.join(self.tmp.name, 'run.log')
+        setup_logging(log_path, json_format=True)
+        logging.warning("São Januário")
+        flush_logging()
+
+        with open(log_path, 'r', encoding='utf-8') as f:
+            entry = json.loads(f.readline())
+        self.assertEqual(entry['level'], 'WARNING')
+        self.assertEqual(entry['message'], "São Januário")
+
+    def test_json_format_exception(self):
+        log_path = os.path.join(self.tmp.name, 'run.log')
+        setup_logging(log_path, json_format=True)
+        try:
+            raise ValueError("bad fixture")
+        except ValueError:
+            logging.exception("Failed to parse %s", "fixture 1")
+        flush_logging()
+
+        with open(log_path, 'r', encoding='utf-8') as f:
+            entry = json.loads(f.readline())
+        self.assertEqual(entry['message'], "Failed to parse fixture 1")
+        self.assertIn("ValueError: bad fixture", entry['exception'])
+
+    def test_reconfigure_in_same_process(self):
+        first_log = os.path.join(self.tmp.name, 'first.log')
+        second_log = os.path.join(self.tmp.name, 'second.log')
+
+        setup_logging(first_log)
+        logging.info("first entry point")
+        setup_logging(second_log)
+        logging.info("second entry point")
+        flush_logging()
+
+        self.assertTrue(log_contains(first_log, "first entry point"))
+        self.assertFalse(log_contains(first_log, "second entry point"))
+        self.assertTrue(log_contains(second_log, "second entry point"))
+        queue_handlers = [h for h in logging.getLogger().handlers if isinstance(h, logging.handlers.QueueHandler)]
+        self.assertEqual(len(queue_handlers), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
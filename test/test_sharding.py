@@ -0,0 +1,185 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from mymatches.fakes import FakeApiFootball, FakeCalendarService
+from mymatches.fetch_and_store_matches import store_matches
+from mymatches import sharding
+from mymatches.sharding import ShardQueue, aggregate_report, plan_shards, run_worker
+from mymatches.update_calendars import add_matches_to_calendar
+
+SERVICES = {}
+
+
+def fake_service_factory(key_path):
+    """
+    Builds one fake service object per key, so the calls of each quota bucket can be counted.
+    """
+    return SERVICES.setdefault(key_path, FakeCalendarService())
+
+
+class TestSharding(unittest.TestCase):
+    """
+    Test the sharded runner, its leases and its run report.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.queue_dir = os.path.join(self.tmp.name, 'shards')
+        self.api = FakeApiFootball(12, fixtures_per_team=3)
+        for team_id in self.api.team_fixtures:
+            store_matches(self.api.query({'team': team_id, 'next': '99'}),
+                          os.path.join(self.tmp.name, 'matches', f'matches{team_id}.json'))
+        self.calendars = {team_id: f'calendar{team_id}' for team_id in self.api.team_fixtures}
+        SERVICES.clear()
+
+    def synced_teams(self):
+        events_dir = os.path.join(self.tmp.name, 'events')
+        return {name[len('events'):-len('.json')] for name in os.listdir(events_dir)}
+
+    def test_plan_is_stable_and_pins_keys(self):
+        shards = plan_shards(self.calendars, ['a.json', 'b.json'], shard_count=4)
+        self.assertEqual([shard['key_path'] for shard in shards], ['a.json', 'b.json', 'a.json', 'b.json'])
+        self.assertEqual(sum(len(shard['calendars']) for shard in shards), len(self.calendars))
+        self.assertEqual(shards, plan_shards(self.calendars, ['a.json', 'b.json'], shard_count=4))
+
+    def test_worker_processes_share_the_queue(self):
+        os.remove(os.path.join(self.tmp.name, 'matches', 'matches1.json'))
+        ShardQueue(self.queue_dir).publish(plan_shards(self.calendars, ['a.json', 'b.json', 'c.json']))
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=sharding._worker_main,
+                                     args=(n, self.queue_dir, self.tmp.name, fake_service_factory, 60))
+                     for n in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        report = aggregate_report(self.queue_dir)
+        self.assertTrue(report['done'])
+        self.assertEqual(report['completed'], len(self.calendars))
+        self.assertEqual(report['errors'], 1)
+        self.assertEqual(self.synced_teams(), set(self.calendars) - {'1'})
+
+        # The counters and the errors of the worker processes reach the report and the worker logs
+        self.assertEqual(report['metrics']['api_calls']['calendar/events.insert']['calls'],
+                         (len(self.calendars) - 1) * 3)
+        self.assertGreater(report['metrics']['bytes_written']['events'], 0)
+        logs = []
+        for n in range(3):
+            with open(os.path.join(self.tmp.name, 'logs', f'sharded_update_worker{n}.log'), 'r',
+                      encoding='utf-8') as f:
+                logs.append(f.read())
+        self.assertEqual(sum('Error syncing team 1 ' in log for log in logs), 1)
+
+    def test_expired_lease_is_taken_over(self):
+        shard_queue = ShardQueue(self.queue_dir, lease_seconds=30)
+        shard_queue.publish(plan_shards(self.calendars, ['a.json']))
+
+        # A worker claims the shard, syncs one team and crashes
+        shard = shard_queue.claim('crashed', now=0)
+        first_team = sorted(shard['calendars'])[0]
+        shard_queue.report_progress(0, 'crashed', {'completed': [first_team], 'errors': 0, 'started_at': 0})
+        self.assertIsNone(shard_queue.claim('other', now=10))
+
+        self.assertEqual(run_worker(self.queue_dir, self.tmp.name, fake_service_factory, worker_id='other'), [0])
+        self.assertEqual(self.synced_teams(), set(self.calendars) - {first_team})
+        self.assertEqual(SERVICES['a.json'].calls['insert'], (len(self.calendars) - 1) * 3)
+
+        report = aggregate_report(self.queue_dir)
+        self.assertEqual(report['shards'][0]['worker'], 'other')
+        self.assertEqual(report['completed'], len(self.calendars))
+
+    def test_takeover_is_exclusive(self):
+        shard_queue = ShardQueue(self.queue_dir, lease_seconds=30)
+        shard_queue.publish(plan_shards(self.calendars, ['a.json']))
+        shard_queue.claim('crashed', now=0)
+        lease_path = os.path.join(self.queue_dir, 'leases', 'shard0.json')
+        with open(lease_path, 'r', encoding='utf-8') as f:
+            expired = json.load(f)
+
+        # B reads the expired lease, then A takes it over before B renames it
+        self.assertIsNotNone(shard_queue.claim('A', now=100))
+        read_json = sharding._read_json
+        stale = [expired]
+
+        def read_json_with_stale_lease(path):
+            return stale.pop() if path == lease_path and stale else read_json(path)
+
+        with patch.object(sharding, '_read_json', read_json_with_stale_lease):
+            self.assertIsNone(shard_queue.claim('B', now=100))
+        with open(lease_path, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['worker'], 'A')
+        self.assertEqual(os.listdir(os.path.join(self.queue_dir, 'leases')), ['shard0.json'])
+        self.assertTrue(shard_queue.renew(0, 'A', now=101))
+
+    def test_lost_lease_stops_the_worker(self):
+        shard_queue = ShardQueue(self.queue_dir, lease_seconds=30)
+        shard_queue.publish(plan_shards(self.calendars, ['a.json']))
+        shard_queue.claim('first', now=0)
+        self.assertTrue(shard_queue.renew(0, 'first', now=10))
+
+        shard_queue.claim('second', now=100)
+        self.assertFalse(shard_queue.renew(0, 'first', now=101))
+        with open(os.path.join(self.queue_dir, 'leases', 'shard0.json'), 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['worker'], 'second')
+
+    def test_expired_lease_is_not_renewed(self):
+        shard_queue = ShardQueue(self.queue_dir, lease_seconds=30)
+        shard_queue.publish(plan_shards(self.calendars, ['a.json']))
+        shard_queue.claim('first', now=0)
+
+        self.assertFalse(shard_queue.renew(0, 'first', now=40))
+        self.assertEqual(os.listdir(os.path.join(self.queue_dir, 'leases')), ['shard0.json'])
+        self.assertEqual(shard_queue.claim('second', now=40)['shard'], 0)
+
+    def sync_slowly(self, seconds, on_team=None):
+        calls = []
+
+        def slow_sync(*args):
+            calls.append(args[0])
+            time.sleep(seconds)
+            if on_team:
+                on_team(len(calls))
+            return add_matches_to_calendar(*args)
+
+        return calls, patch.object(sharding, 'add_matches_to_calendar', slow_sync)
+
+    def test_heartbeat_renews_the_lease_during_slow_teams(self):
+        calendars = dict(sorted(self.calendars.items())[:3])
+        ShardQueue(self.queue_dir).publish(plan_shards(calendars, ['a.json']))
+        shard_queue = ShardQueue(self.queue_dir, lease_seconds=0.3)
+        intruders = []
+        calls, slow_sync = self.sync_slowly(0.5, lambda team: intruders.append(shard_queue.claim('intruder')))
+
+        with slow_sync:
+            self.assertEqual(run_worker(self.queue_dir, self.tmp.name, fake_service_factory, worker_id='slow',
+                                        lease_seconds=0.3), [0])
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(intruders, [None, None, None])
+
+    def test_lost_lease_abandons_the_shard(self):
+        shard_queue = ShardQueue(self.queue_dir, lease_seconds=0.3)
+        shard_queue.publish(plan_shards(self.calendars, ['a.json']))
+        lease_path = os.path.join(self.queue_dir, 'leases', 'shard0.json')
+
+        def take_over(team):
+            if team == 1:
+                sharding._write_json(lease_path, {'worker': 'second', 'expires': time.time() + 60})
+                time.sleep(0.3)
+
+        calls, slow_sync = self.sync_slowly(0, take_over)
+        with slow_sync:
+            self.assertEqual(run_worker(self.queue_dir, self.tmp.name, fake_service_factory, worker_id='first',
+                                        lease_seconds=0.3), [])
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(aggregate_report(self.queue_dir)['done'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import unittest
+
+from mymatches.fakes import FakeApiFootball
+from mymatches.snapshots import (apply_retention, archive_snapshot, load_snapshot, load_snapshot_at,
+                                 snapshot_history)
+
+DAY = 24 * 3600
+
+
+class TestSnapshots(unittest.TestCase):
+    """
+    Test the content-addressed snapshot history.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.api = FakeApiFootball(4, fixtures_per_team=20)
+
+    def payload(self):
+        return self.api.query({'team': '1', 'next': '99'})
+
+    def objects(self):
+        objects_dir = os.path.join(self.tmp.name, 'snapshots', 'objects')
+        return [name for prefix in os.listdir(objects_dir) for name in os.listdir(os.path.join(objects_dir, prefix))]
+
+    def test_unchanged_payload_costs_no_bytes(self):
+        sha, written = archive_snapshot('1', self.payload(), self.tmp.name, now=1000)
+        self.assertGreater(written, 0)
+        self.assertEqual(archive_snapshot('1', self.payload(), self.tmp.name, now=2000), (sha, 0))
+        self.assertEqual(len(snapshot_history('1', self.tmp.name)), 1)
+        self.assertEqual(load_snapshot(sha, self.tmp.name), self.payload())
+
+        # Another team with the same payload shares the object
+        archive_snapshot('2', self.payload(), self.tmp.name, now=1000)
+        self.assertEqual(len(self.objects()), 1)
+
+    def test_snapshot_is_compressed(self):
+        sha, _ = archive_snapshot('1', self.payload(), self.tmp.name)
+        pretty_size = len(json.dumps(self.payload(), indent=4).encode('utf-8'))
+        history = snapshot_history('1', self.tmp.name)
+        self.assertLess(history[0]['size'] * 5, pretty_size)
+
+    def test_lookup_at_time(self):
+        first = self.payload()
+        archive_snapshot('1', first, self.tmp.name, now=1000)
+        self.api.set_status(self.api.team_fixtures['1'][0], 'PST', long='Match Postponed')
+        second = self.payload()
+        archive_snapshot('1', second, self.tmp.name, now=2000)
+
+        self.assertIsNone(load_snapshot_at('1', 999, self.tmp.name))
+        self.assertEqual(load_snapshot_at('1', 1000, self.tmp.name), first)
+        self.assertEqual(load_snapshot_at('1', 1999, self.tmp.name), first)
+        self.assertEqual(load_snapshot_at('1', 5000, self.tmp.name), second)
+
+    def test_league_history_is_separate(self):
+        league = self.api.query({'league': '100', 'next': '99'})
+        archive_snapshot('1', self.payload(), self.tmp.name, now=1000)
+        archive_snapshot('1', league, self.tmp.name, now=1000, kind='league')
+
+        self.assertEqual(load_snapshot_at('1', 1000, self.tmp.name), self.payload())
+        self.assertEqual(load_snapshot_at('1', 1000, self.tmp.name, kind='league'), league)
+
+        # Retention keeps the current payload of both
+        apply_retention(self.tmp.name, retention_days=0, keep_last=1, now=1000 + DAY)
+        self.assertEqual(len(self.objects()), 2)
+
+    def test_retention(self):
+        fixture_id = self.api.team_fixtures['1'][0]
+        for day in range(5):
+            self.api.set_status(fixture_id, 'NS', elapsed=day)
+            archive_snapshot('1', self.payload(), self.tmp.name, now=day * DAY)
+
+        stats = apply_retention(self.tmp.name, retention_days=2, keep_last=1, now=5 * DAY)
+        self.assertEqual(stats['entries_removed'], 3)
+        self.assertEqual(stats['objects_removed'], 3)
+        self.assertEqual([entry['time'] for entry in snapshot_history('1', self.tmp.name)], [3 * DAY, 4 * DAY])
+        self.assertEqual(len(self.objects()), 2)
+
+        # The latest snapshot survives however old it is
+        apply_retention(self.tmp.name, retention_days=0, keep_last=1, now=100 * DAY)
+        self.assertEqual(load_snapshot_at('1', 100 * DAY, self.tmp.name), self.payload())
+
+
+if __name__ == '__main__':
+    unittest.main()
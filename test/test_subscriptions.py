@@ -0,0 +1,213 @@
+import importlib
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from mymatches.fakes import FakeApiFootball, FakeCalendarService
+from mymatches.fetch_and_store_matches import store_matches
+from mymatches.snapshots import load_snapshot_at, snapshot_history
+from mymatches.subscriptions import SubscriptionIndex, load_subscriptions, sync_calendars
+from mymatches.update_calendars import add_matches_to_calendar
+from mymatches.utils import stop_logging
+
+subscriptions = importlib.import_module('mymatches.subscriptions')
+
+
+class TestSubscriptionIndex(unittest.TestCase):
+    """
+    Test the incremental maintenance of the fixture to calendars index.
+    """
+
+    def setUp(self):
+        self.api = FakeApiFootball(6, fixtures_per_team=5, league_count=2)
+        self.index = SubscriptionIndex()
+        self.index.add_fixtures(self.api.fixtures.values())
+
+    def fixtures_of_team(self, team_id):
+        return {str(fixture_id) for fixture_id in self.api.team_fixtures[team_id]}
+
+    def fixtures_of_league(self, league_id):
+        return {str(fixture_id) for fixture_id, match in self.api.fixtures.items()
+                if match['league']['id'] == league_id}
+
+    def calendar_fixtures(self, calendar_id):
+        return {fixture_id for fixture_id, calendars in self.index.fixture_calendars.items()
+                if calendar_id in calendars}
+
+    def test_subscribe_and_unsubscribe(self):
+        self.index.subscribe('mine', teams=['1', '2'])
+        self.index.subscribe('league', leagues=['100'])
+
+        self.assertEqual(self.calendar_fixtures('mine'), self.fixtures_of_team('1') | self.fixtures_of_team('2'))
+        self.assertEqual(self.calendar_fixtures('league'), self.fixtures_of_league(100))
+
+        self.index.unsubscribe('mine', teams=['2'])
+        self.assertEqual(self.calendar_fixtures('mine'), self.fixtures_of_team('1'))
+        self.assertNotIn('2', self.index.team_subscribers)
+
+    def test_set_subscriptions_and_legacy_config(self):
+        config = {'CALENDARS': {'1': 'team1'},
+                  'SUBSCRIPTIONS': {'team1': {'leagues': [101]}, 'combined': {'teams': ['3', '4']}}}
+        self.index.set_subscriptions(load_subscriptions(config))
+
+        self.assertEqual(self.calendar_fixtures('team1'), self.fixtures_of_team('1') | self.fixtures_of_league(101))
+        self.assertEqual(self.calendar_fixtures('combined'), self.fixtures_of_team('3') | self.fixtures_of_team('4'))
+
+        self.index.set_subscriptions(load_subscriptions({'CALENDARS': {'1': 'team1'}}))
+        self.assertEqual(self.calendar_fixtures('team1'), self.fixtures_of_team('1'))
+        self.assertEqual(self.calendar_fixtures('combined'), set())
+
+    def test_round_trip(self):
+        self.index.subscribe('mine', teams=['1'], leagues=['101'])
+        restored = SubscriptionIndex.from_dict(self.index.to_dict())
+
+        self.assertEqual(restored.fixture_calendars, self.index.fixture_calendars)
+
+
+class TestSyncCalendars(unittest.TestCase):
+    """
+    Test that calendar writes follow deltas only.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.api = FakeApiFootball(6, fixtures_per_team=4)
+        self.matches = {str(fixture_id): match for fixture_id, match in self.api.fixtures.items()}
+        self.index = SubscriptionIndex()
+        self.index.add_fixtures(self.matches.values())
+        self.service = FakeCalendarService()
+
+    def test_writes_follow_deltas(self):
+        for i in range(50):
+            self.index.subscribe(f'fan{i}', teams=['1'])
+        self.index.subscribe('everything', leagues=['100'])
+
+        stats = sync_calendars(self.index, self.matches, self.service, self.tmp.name)
+        self.assertEqual(stats['inserted'], 50 * 4 + len(self.matches))
+
+        self.service.calls.clear()
+        stats = sync_calendars(self.index, self.matches, self.service, self.tmp.name)
+        self.assertEqual(self.service.api_calls, 0)
+        self.assertEqual(stats['unchanged'], 50 * 4 + len(self.matches))
+
+        # A change to a team 1 fixture reaches its subscribers and the league calendar only
+        fixture_id = self.api.team_fixtures['1'][0]
+        self.matches[str(fixture_id)]['fixture']['venue']['name'] = 'Maracanã'
+        stats = sync_calendars(self.index, self.matches, self.service, self.tmp.name)
+        self.assertEqual(stats['updated'], 51)
+        self.assertEqual(self.service.calls['update'], 51)
+
+    def test_unsubscribed_events_are_deleted(self):
+        self.index.subscribe('mine', teams=['1', '2'])
+        sync_calendars(self.index, self.matches, self.service, self.tmp.name)
+        self.assertEqual(len(self.service.calendars['mine']), 8)
+
+        self.index.unsubscribe('mine', teams=['2'])
+        stats = sync_calendars(self.index, self.matches, self.service, self.tmp.name)
+        self.assertEqual(stats['deleted'], 4)
+        self.assertEqual(len(self.service.calendars['mine']), 4)
+
+        self.index.unsubscribe('mine', teams=['1'])
+        sync_calendars(self.index, self.matches, self.service, self.tmp.name)
+        self.assertEqual(self.service.calendars['mine'], {})
+
+    def store_team_matches(self, team_id):
+        store_matches(self.api.query({'team': team_id, 'next': '99'}),
+                      os.path.join(self.tmp.name, 'matches', f'matches{team_id}.json'))
+
+    def test_legacy_events_are_adopted(self):
+        self.store_team_matches('1')
+        add_matches_to_calendar('1', 'calendar1', self.service, self.tmp.name)
+        legacy = {'1': 'calendar1'}
+        self.index.set_subscriptions(load_subscriptions({'CALENDARS': legacy}))
+
+        stats = sync_calendars(self.index, self.matches, self.service, self.tmp.name, legacy)
+        self.assertEqual((stats['inserted'], stats['updated']), (0, 4))
+        self.assertEqual(len(self.service.calendars['calendar1']), 4)
+
+        stats = sync_calendars(self.index, self.matches, self.service, self.tmp.name, legacy)
+        self.assertEqual(stats['unchanged'], 4)
+
+    def test_subscription_events_are_shared_with_update_calendars(self):
+        legacy = {'1': 'calendar1'}
+        self.index.set_subscriptions(load_subscriptions({'CALENDARS': legacy}))
+        sync_calendars(self.index, self.matches, self.service, self.tmp.name, legacy)
+
+        self.store_team_matches('1')
+        self.service.calls.clear()
+        add_matches_to_calendar('1', 'calendar1', self.service, self.tmp.name)
+        self.assertEqual(self.service.calls['insert'], 0)
+        self.assertEqual(len(self.service.calendars['calendar1']), 4)
+
+
+class TestSyncSubscriptions(unittest.TestCase):
+    """
+    Test the fetches of a resync.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(stop_logging)
+        self.api = FakeApiFootball(4, fixtures_per_team=3)
+        self.service = FakeCalendarService()
+        with open(os.path.join(self.tmp.name, 'config.json'), 'w', encoding='utf-8') as f:
+            json.dump({'API_KEY': 'key', 'SUBSCRIPTIONS': {'mine': {'teams': ['1', '2']},
+                                                           'all': {'leagues': ['100']}}}, f)
+        for target, value in (('CONFIG_DIR', self.tmp.name), ('DATA_DIR', self.tmp.name),
+                              ('authenticate_google', lambda key_file: self.service),
+                              ('is_file_recent', lambda file_path: False)):
+            patcher = patch.object(subscriptions, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sync(self, failing=()):
+        def fetch(team_id, api_key, base_url):
+            if team_id in failing:
+                raise Exception(f"Failed to fetch matches for team {team_id}. Status code: 500.")
+            return self.api.query({'team': team_id, 'next': '99'})
+
+        def fetch_league(league_id, api_key, base_url):
+            return self.api.query({'league': league_id, 'next': '99'})
+
+        with patch.object(subscriptions, 'fetch_matches', fetch), \
+                patch.object(subscriptions, 'fetch_league_matches', fetch_league):
+            subscriptions.sync_subscriptions()
+
+    def test_failed_fetch_keeps_events(self):
+        self.sync()
+        scheduled = len(self.service.calendars['mine'])
+        self.assertGreater(scheduled, 3)
+
+        # The last stored matches of team 2 stand in for the failed fetch
+        self.sync(failing=['2'])
+        self.assertEqual(len(self.service.calendars['mine']), scheduled)
+        self.assertEqual(self.service.calls['delete'], 0)
+
+        # Without stored matches, nothing is deleted
+        os.remove(os.path.join(self.tmp.name, 'matches', 'matches2.json'))
+        self.sync(failing=['2'])
+        self.assertEqual(len(self.service.calendars['mine']), scheduled)
+        self.assertEqual(self.service.calls['delete'], 0)
+
+    def test_payloads_are_archived(self):
+        self.sync()
+        self.sync()
+        self.assertEqual(len(snapshot_history('1', self.tmp.name)), 1)
+        self.assertEqual(len(snapshot_history('100', self.tmp.name, kind='league')), 1)
+        self.assertEqual(load_snapshot_at('100', time.time(), self.tmp.name, kind='league'),
+                         self.api.query({'league': '100', 'next': '99'}))
+
+        self.api.set_status(self.api.team_fixtures['1'][0], 'PST', long='Match Postponed')
+        self.sync()
+        self.assertEqual(len(snapshot_history('1', self.tmp.name)), 2)
+        self.assertEqual(len(snapshot_history('2', self.tmp.name)), 1)
+        self.assertEqual(len(snapshot_history('100', self.tmp.name, kind='league')), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
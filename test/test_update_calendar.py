@@ -3,7 +3,7 @@ import logging
 import unittest
 from unittest.mock import patch
 import os
-from mymatches import setup_logging, update_calendars
+from mymatches import setup_logging, flush_logging, update_calendars
 
 
 # Constants
@@ -31,6 +31,7 @@ class TestUpdateCalendars(unittest.TestCase):
 
         # Run the update_calendars function
         update_calendars()
+        flush_logging()
 
         # Check for error messages at each new added line in the update_calendars log file
         with open(log_file, 'r') as f: